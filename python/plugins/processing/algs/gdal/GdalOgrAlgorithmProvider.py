@@ -109,7 +109,8 @@ class GdalOgrAlgorithmProvider(AlgorithmProvider):
 
     def __init__(self):
         AlgorithmProvider.__init__(self)
-        self.createAlgsList()
+        # Created the first time algorithms are loaded
+        self.preloadedAlgs = None
 
     def scriptsFolder(self):
         """The folder where script algorithms are stored.
@@ -126,6 +127,8 @@ class GdalOgrAlgorithmProvider(AlgorithmProvider):
         return QIcon(os.path.join(pluginPath, 'images', 'gdal.png'))
 
     def _loadAlgorithms(self):
+        if self.preloadedAlgs is None:
+            self.createAlgsList()
         self.algs = self.preloadedAlgs
 
     def createAlgsList(self):
@@ -26,14 +26,16 @@ __copyright__ = '(C) 2012, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import os
+import shutil
 import subprocess
 import platform
 from PyQt4.QtCore import QSettings
 from qgis.core import QgsApplication
 from processing.core.ProcessingLog import ProcessingLog
+from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 
 try:
-    from osgeo import gdal
+    from osgeo import gdal, ogr
     gdalAvailable = True
 except:
     gdalAvailable = False
@@ -43,6 +45,11 @@ class GdalUtils:
 
     supportedRasters = None
 
+    # Creation options used when copying a raster to its final format
+    RASTER_CREATION_OPTIONS = {
+        'GTiff': ['TILED=YES', 'BIGTIFF=IF_SAFER'],
+    }
+
     @staticmethod
     def runGdal(commands, progress):
         envval = unicode(os.getenv('PATH'))
@@ -151,3 +158,90 @@ class GdalUtils:
                 escaped = s
             joined += escaped + ' '
         return joined.strip()
+
+    @staticmethod
+    def _progressCallback(progress):
+        def callback(complete, message, data):
+            progress.setPercentage(int(complete * 100))
+            return 1
+        return callback
+
+    @staticmethod
+    def translateVector(source, destination, driverName, layerOptions=None,
+                        progress=None):
+        """Copies a vector dataset to another format in a single bulk
+        operation, as ogr2ogr would do.
+
+        An existing destination dataset is replaced.
+
+        Returns False if the GDAL bindings are too old (GDAL < 2.1) to
+        do it in process, so the caller can copy the features itself.
+        """
+        if not gdalAvailable or not hasattr(gdal, 'VectorTranslate'):
+            return False
+        if os.path.exists(destination):
+            driver = ogr.GetDriverByName(driverName)
+            if driver is None or driver.DeleteDataSource(destination) != 0:
+                raise GeoAlgorithmExecutionException(
+                    'Could not overwrite %s' % destination)
+        callback = GdalUtils._progressCallback(progress) if progress else None
+        ds = gdal.VectorTranslate(destination, source, format=driverName,
+                                  accessMode='overwrite',
+                                  layerCreationOptions=layerOptions or [],
+                                  callback=callback)
+        if ds is None:
+            raise GeoAlgorithmExecutionException(
+                'Could not convert %s to %s:\n%s'
+                % (source, destination, gdal.GetLastErrorMsg()))
+        # Closes the dataset, writing it to disk
+        ds = None
+        return True
+
+    @staticmethod
+    def translateRaster(source, destination, driverName, srs=None,
+                        progress=None):
+        """Copies a raster to another format, in process when the GDAL
+        bindings allow it (GDAL >= 2.1) and with gdal_translate
+        otherwise.
+        """
+        options = GdalUtils.RASTER_CREATION_OPTIONS.get(driverName, [])
+        if gdalAvailable and hasattr(gdal, 'Translate'):
+            callback = GdalUtils._progressCallback(progress) if progress else None
+            ds = gdal.Translate(destination, source, format=driverName,
+                                outputSRS=srs, creationOptions=options,
+                                callback=callback)
+            if ds is None:
+                raise GeoAlgorithmExecutionException(
+                    'Could not convert %s to %s:\n%s'
+                    % (source, destination, gdal.GetLastErrorMsg()))
+            ds = None
+        else:
+            arguments = ['-of', driverName]
+            if srs:
+                arguments.extend(['-a_srs', srs])
+            for option in options:
+                arguments.extend(['-co', option])
+            arguments.extend([source, destination])
+            GdalUtils.runGdal(['gdal_translate',
+                               GdalUtils.escapeAndJoin(arguments)], progress)
+
+    @staticmethod
+    def moveDataset(source, destination):
+        """Renames all the files of a dataset (e.g. the .shp, .shx, .dbf
+        and .prj files of a shapefile, or the .aux.xml of a raster) so
+        that they take the name of the destination file.
+        """
+        sourceRoot, sourceExt = os.path.splitext(source)
+        destinationRoot, destinationExt = os.path.splitext(destination)
+        folder = os.path.dirname(source) or '.'
+        basename = os.path.basename(sourceRoot)
+        for name in os.listdir(folder):
+            if not name.startswith(basename + '.'):
+                continue
+            suffix = name[len(basename):]
+            if suffix.startswith(sourceExt):
+                suffix = destinationExt + suffix[len(sourceExt):]
+            target = destinationRoot + suffix
+            if os.path.exists(target):
+                os.remove(target)
+            shutil.move(os.path.join(folder, name), target)
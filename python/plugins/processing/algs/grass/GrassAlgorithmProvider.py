@@ -44,7 +44,8 @@ class GrassAlgorithmProvider(AlgorithmProvider):
 
     def __init__(self):
         AlgorithmProvider.__init__(self)
-        self.createAlgsList()  # Preloading algorithms to speed up
+        # Created the first time algorithms are loaded
+        self.preloadedAlgs = None
 
     def initializeSettings(self):
         AlgorithmProvider.initializeSettings(self)
@@ -88,6 +89,8 @@ class GrassAlgorithmProvider(AlgorithmProvider):
         self.preloadedAlgs.append(nviz())
 
     def _loadAlgorithms(self):
+        if self.preloadedAlgs is None:
+            self.createAlgsList()
         self.algs = self.preloadedAlgs
 
     def getDescription(self):
@@ -44,7 +44,8 @@ class Grass7AlgorithmProvider(AlgorithmProvider):
     def __init__(self):
         AlgorithmProvider.__init__(self)
         self.activate = False
-        self.createAlgsList()
+        # Created the first time algorithms are loaded
+        self.preloadedAlgs = None
 
     def initializeSettings(self):
         AlgorithmProvider.initializeSettings(self)
@@ -94,6 +95,8 @@ class Grass7AlgorithmProvider(AlgorithmProvider):
         self.preloadedAlgs.append(nviz7())
 
     def _loadAlgorithms(self):
+        if self.preloadedAlgs is None:
+            self.createAlgsList()
         self.algs = self.preloadedAlgs
 
     def getDescription(self):
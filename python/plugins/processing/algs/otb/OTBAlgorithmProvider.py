@@ -45,7 +45,8 @@ class OTBAlgorithmProvider(AlgorithmProvider):
     def __init__(self):
         AlgorithmProvider.__init__(self)
         self.activate = True
-        self.createAlgsList()
+        # Created the first time algorithms are loaded
+        self.preloadedAlgs = None
 
     def getDescription(self):
         return self.tr("Orfeo Toolbox (Image analysis)")
@@ -57,6 +58,8 @@ class OTBAlgorithmProvider(AlgorithmProvider):
         return QIcon(os.path.join(pluginPath, 'images', 'otb.png'))
 
     def _loadAlgorithms(self):
+        if self.preloadedAlgs is None:
+            self.createAlgsList()
         self.algs = self.preloadedAlgs
 
     def createAlgsList(self):
@@ -64,7 +64,7 @@ class BarPlot(GeoAlgorithm):
 
         output = self.getOutputValue(self.OUTPUT)
 
-        values = vector.values(layer, namefieldname, valuefieldname)
+        values = vector.values(layer, namefieldname, valuefieldname, asNumpy=True)
         plt.close()
 
         ind = np.arange(len(values[namefieldname]))
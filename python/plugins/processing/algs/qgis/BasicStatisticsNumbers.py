@@ -113,7 +113,7 @@ class BasicStatisticsNumbers(GeoAlgorithm):
         isFirst = True
         values = []
 
-        features = vector.features(layer)
+        features = vector.features(layer, [index], geometry=False)
         count = len(features)
         total = 100.0 / float(count)
         current = 0
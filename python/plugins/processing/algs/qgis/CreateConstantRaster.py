@@ -54,7 +54,7 @@ class CreateConstantRaster(GeoAlgorithm):
     def processAlgorithm(self, progress):
         layer = dataobjects.getObjectFromUri(
             self.getParameterValue(self.INPUT))
-        value = self.getOutputValue(self.NUMBER)
+        value = self.getParameterValue(self.NUMBER)
 
         output = self.getOutputFromName(self.OUTPUT)
 
@@ -70,5 +70,5 @@ class CreateConstantRaster(GeoAlgorithm):
                          1,
                          self.crs,
                          )
-        w.matrix[:] = value
+        w.fill(value)
         w.close()
@@ -25,15 +25,14 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
-from sets import Set
 from PyQt4.QtCore import QVariant
-from qgis.core import QGis, QgsField, QgsFeatureRequest, QgsFeature, QgsGeometry, QgsPoint
+from qgis.core import QGis, QgsField, QgsFeature, QgsGeometry, QgsPoint
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.tools import dataobjects, vector
 from processing.core.parameters import ParameterVector
 from processing.core.outputs import OutputVector
-import voronoi
+import triangulation
 
 
 class Delaunay(GeoAlgorithm):
@@ -63,30 +62,17 @@ class Delaunay(GeoAlgorithm):
                                                                      QGis.WKBPolygon, layer.crs())
 
         pts = []
-        ptDict = {}
-        ptNdx = -1
-        c = voronoi.Context()
-        features = vector.features(layer)
-        for inFeat in features:
-            geom = QgsGeometry(inFeat.geometry())
-            point = geom.asPoint()
-            x = point.x()
-            y = point.y()
-            pts.append((x, y))
-            ptNdx += 1
-            ptDict[ptNdx] = inFeat.id()
+        for inFeat in vector.features(layer):
+            point = inFeat.geometry().asPoint()
+            pts.append((point.x(), point.y()))
 
         if len(pts) < 3:
             raise GeoAlgorithmExecutionException(
                 self.tr('Input file should contain at least 3 points. Choose '
                         'another file and try again.'))
 
-        uniqueSet = Set(item for item in pts)
-        ids = [pts.index(item) for item in uniqueSet]
-        sl = voronoi.SiteList([voronoi.Site(*i) for i in uniqueSet])
-        c.triangulate = True
-        voronoi.voronoi(sl, c)
-        triangles = c.triangles
+        uniqueSet, ids = triangulation.uniquePoints(pts)
+        triangles = triangulation.delaunayTriangles(uniqueSet)
         feat = QgsFeature()
 
         current = 0
@@ -99,11 +85,7 @@ class Delaunay(GeoAlgorithm):
             attrs = []
             step = 0
             for index in indicies:
-                request = QgsFeatureRequest().setFilterFid(ptDict[ids[index]])
-                inFeat = layer.getFeatures(request).next()
-                geom = QgsGeometry(inFeat.geometry())
-                point = QgsPoint(geom.asPoint())
-                polygon.append(point)
+                polygon.append(QgsPoint(*pts[ids[index]]))
                 if step <= 3:
                     attrs.append(ids[index])
                 step += 1
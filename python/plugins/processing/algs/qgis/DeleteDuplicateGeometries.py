@@ -25,15 +25,19 @@ __copyright__ = '(C) 2010, Michael Minn'
 
 __revision__ = '$Format:%H$'
 
-from qgis.core import QgsGeometry, QgsFeatureRequest
+from collections import defaultdict
+
+from qgis.core import QgsGeometry, QgsRectangle, QgsSpatialIndex
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
+from processing.core.parameters import ParameterNumber
 from processing.core.outputs import OutputVector
 from processing.tools import dataobjects, vector
 
 
 class DeleteDuplicateGeometries(GeoAlgorithm):
     INPUT = 'INPUT'
+    TOLERANCE = 'TOLERANCE'
     OUTPUT = 'OUTPUT'
 
     def defineCharacteristics(self):
@@ -42,40 +46,89 @@ class DeleteDuplicateGeometries(GeoAlgorithm):
 
         self.addParameter(ParameterVector(self.INPUT,
                                           self.tr('Input layer'), [ParameterVector.VECTOR_TYPE_ANY]))
+        self.addParameter(ParameterNumber(self.TOLERANCE,
+                                          self.tr('Tolerance (0 for equal geometries)'),
+                                          0.0, None, 0.0))
         self.addOutput(OutputVector(self.OUTPUT, self.tr('Cleaned')))
 
     def processAlgorithm(self, progress):
         layer = dataobjects.getObjectFromUri(
             self.getParameterValue(self.INPUT))
+        tolerance = self.getParameterValue(self.TOLERANCE)
 
         fields = layer.pendingFields()
 
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(fields,
                                                                      layer.wkbType(), layer.crs())
 
+        # First pass: only bounding boxes are read, to find the
+        # features that may have a duplicate. Equal geometries have the
+        # same bounding box, and geometries within the tolerance of
+        # each other have bounding boxes within the tolerance too
+        features = vector.features(layer, attributes=[])
+        total = 50.0 / max(len(features), 1)
+        bboxes = {}
+        sameBBox = defaultdict(list)
+        index = QgsSpatialIndex() if tolerance > 0 else None
+        for current, f in enumerate(features):
+            bbox = self.boundingBox(f.geometry())
+            if bbox is not None:
+                if index is None:
+                    sameBBox[bbox].append(f.id())
+                else:
+                    bboxes[f.id()] = bbox
+                    index.insertFeature(f)
+            progress.setPercentage(int(current * total))
+
+        # Second pass: features are written as they are read, and only
+        # the geometries of those that have candidate duplicates are
+        # kept to compare them with the following ones
+        kept = {}
         features = vector.features(layer)
-
-        count = len(features)
-        total = 100.0 / float(count)
-        geoms = dict()
-        for count, f in enumerate(features):
-            geoms[f.id()] = QgsGeometry(f.geometry())
-            progress.setPercentage(int(count * total))
-
-        cleaned = dict(geoms)
-
-        for i, g in geoms.iteritems():
-            for j in cleaned.keys():
-                if i == j or i not in cleaned:
+        for current, f in enumerate(features):
+            geom = f.geometry()
+            bbox = self.boundingBox(geom)
+            if bbox is None:
+                writer.addFeature(f)
+                continue
+            if index is None:
+                candidates = sameBBox[bbox]
+            else:
+                candidates = self.nearBoundingBoxes(index, bboxes, bbox, tolerance)
+            if len(candidates) > 1:
+                wkb = geom.asWkb()
+                if any(self.isDuplicate(geom, wkb, kept[fid], tolerance)
+                       for fid in candidates if fid in kept):
                     continue
-                if g.isGeosEqual(cleaned[j]):
-                    del cleaned[j]
-
-        count = len(cleaned)
-        total = 100.0 / float(count)
-        request = QgsFeatureRequest().setFilterFids(cleaned.keys())
-        for count, f in enumerate(layer.getFeatures(request)):
+                kept[f.id()] = (QgsGeometry(geom), wkb)
             writer.addFeature(f)
-            progress.setPercentage(int(count * total))
+            progress.setPercentage(50 + int(current * total))
 
         del writer
+
+    def boundingBox(self, geom):
+        if geom is None or geom.isEmpty():
+            return None
+        rect = geom.boundingBox()
+        return (rect.xMinimum(), rect.yMinimum(),
+                rect.xMaximum(), rect.yMaximum())
+
+    def nearBoundingBoxes(self, index, bboxes, bbox, tolerance):
+        """Returns the ids of the features whose bounding box corners
+        are all within the tolerance of those of the passed one.
+        """
+        rect = QgsRectangle(bbox[0] - tolerance, bbox[1] - tolerance,
+                            bbox[2] + tolerance, bbox[3] + tolerance)
+        return [fid for fid in index.intersects(rect)
+                if all(abs(a - b) <= tolerance for a, b in zip(bboxes[fid], bbox))]
+
+    def isDuplicate(self, geom, wkb, other, tolerance):
+        otherGeom, otherWkb = other
+        if wkb == otherWkb:
+            return True
+        if tolerance > 0:
+            # Each geometry lies within the tolerance of the other one
+            # (their Hausdorff distance is not larger than it)
+            return otherGeom.buffer(tolerance, 8).contains(geom) \
+                and geom.buffer(tolerance, 8).contains(otherGeom)
+        return geom.isGeosEqual(otherGeom)
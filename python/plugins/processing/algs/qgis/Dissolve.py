@@ -25,6 +25,9 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
+from collections import OrderedDict
+from itertools import izip
+
 from qgis.core import QgsFeature, QgsGeometry
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
@@ -33,6 +36,21 @@ from processing.core.parameters import ParameterBoolean
 from processing.core.parameters import ParameterTableField
 from processing.core.outputs import OutputVector
 from processing.tools import vector, dataobjects
+from processing.tools.system import processPool, workerProcesses
+
+
+def geometryFromWkb(wkb):
+    if wkb is None:
+        return None
+    geom = QgsGeometry()
+    geom.fromWkb(wkb)
+    return geom
+
+
+def _unionWkb(wkbs):
+    """Dissolves a list of WKB geometries in a worker process."""
+    union = vector.cascadedUnion([geometryFromWkb(wkb) for wkb in wkbs])
+    return union.asWkb() if union is not None else None
 
 
 class Dissolve(GeoAlgorithm):
@@ -59,77 +77,68 @@ class Dissolve(GeoAlgorithm):
                                              vproviderA.geometryType(),
                                              vproviderA.crs())
         outFeat = QgsFeature()
-        nElement = 0
         features = vector.features(vlayerA)
-        nFeat = len(features)
-
-        if not useField:
-            first = True
-            for inFeat in features:
-                nElement += 1
-                progress.setPercentage(int(nElement * 100 / nFeat))
-                if first:
-                    attrs = inFeat.attributes()
-                    tmpInGeom = QgsGeometry(inFeat.geometry())
-                    outFeat.setGeometry(tmpInGeom)
-                    first = False
-                else:
-                    tmpInGeom = QgsGeometry(inFeat.geometry())
-                    tmpOutGeom = QgsGeometry(outFeat.geometry())
-                    try:
-                        tmpOutGeom = QgsGeometry(tmpOutGeom.combine(tmpInGeom))
-                        outFeat.setGeometry(tmpOutGeom)
-                    except:
-                        raise GeoAlgorithmExecutionException(
-                            self.tr('Geometry exception while dissolving'))
-            outFeat.setAttributes(attrs)
-            writer.addFeature(outFeat)
-        else:
-            fieldIdx = vlayerA.fieldNameIndex(fieldname)
-            unique = vector.getUniqueValues(vlayerA, int(fieldIdx))
-            nFeat = len(unique)
-            myDict = {}
-            attrDict = {}
-            for item in unique:
-                myDict[unicode(item).strip()] = []
-                attrDict[unicode(item).strip()] = None
-
-            unique = None
-
-            for inFeat in features:
-                attrs = inFeat.attributes()
-                tempItem = attrs[fieldIdx]
-                tmpInGeom = QgsGeometry(inFeat.geometry())
-
-                if attrDict[unicode(tempItem).strip()] == None:
-                    # keep attributes of first feature
-                    attrDict[unicode(tempItem).strip()] = attrs
-
-                myDict[unicode(tempItem).strip()].append(tmpInGeom)
-
-            features = None
-
-            for key, value in myDict.items():
-                nElement += 1
-                progress.setPercentage(int(nElement * 100 / nFeat))
-                for i in range(len(value)):
-                    tmpInGeom = value[i]
-
-                    if i == 0:
-                        tmpOutGeom = tmpInGeom
-                    else:
-                        try:
-                            tmpOutGeom = QgsGeometry(
-                                tmpOutGeom.combine(tmpInGeom))
-                        except:
-                            raise GeoAlgorithmExecutionException(
-                                self.tr('Geometry exception while dissolving'))
-                outFeat.setGeometry(tmpOutGeom)
+        fieldIdx = vlayerA.fieldNameIndex(fieldname) if useField else -1
+
+        # Group geometries by dissolve value, keeping the attributes of
+        # the first feature of each group
+        geomDict = OrderedDict()
+        attrDict = {}
+        for inFeat in features:
+            attrs = inFeat.attributes()
+            key = unicode(attrs[fieldIdx]).strip() if useField else None
+            if key not in geomDict:
+                geomDict[key] = []
+                attrDict[key] = attrs
+            geomDict[key].append(QgsGeometry(inFeat.geometry()))
+        features = None
+
+        # processPool returns None when workers cannot be forked, as
+        # inside the QGIS GUI, and the unions are then computed here
+        workers = workerProcesses()
+        pool = processPool(workers)
+        nFeat = len(geomDict)
+        try:
+            if pool is None:
+                dissolved = (vector.cascadedUnion(geoms)
+                             for geoms in geomDict.itervalues())
+            else:
+                dissolved = self.parallelUnions(pool, workers, geomDict.values())
+            for nElement, (key, geom) in enumerate(izip(geomDict.iterkeys(), dissolved)):
+                if geom is None:
+                    raise GeoAlgorithmExecutionException(
+                        self.tr('Geometry exception while dissolving'))
+                outFeat.setGeometry(geom)
                 outFeat.setAttributes(attrDict[key])
                 writer.addFeature(outFeat)
+                progress.setPercentage(int((nElement + 1) * 100 / nFeat))
+        finally:
+            if pool is not None:
+                pool.terminate()
 
         del writer
 
+    def parallelUnions(self, pool, workers, groups):
+        """Returns an iterator over the union of each group of
+        geometries, computed on the passed process pool.
+
+        A single group, as used when dissolving everything, is split
+        into one chunk per worker, and the chunk unions merged at the
+        end.
+        """
+        if len(groups) == 1 and len(groups[0]) > 1:
+            geoms = groups[0]
+            size = (len(geoms) + workers - 1) // workers
+            wkbs = [[g.asWkb() for g in geoms[i:i + size]]
+                    for i in xrange(0, len(geoms), size)]
+            unions = [geometryFromWkb(wkb) for wkb in pool.map(_unionWkb, wkbs)]
+            if any(u is None for u in unions):
+                return iter([None])
+            return iter([vector.cascadedUnion(unions)])
+
+        wkbs = ([g.asWkb() for g in geoms] for geoms in groups)
+        return (geometryFromWkb(wkb) for wkb in pool.imap(_unionWkb, wkbs))
+
     def defineCharacteristics(self):
         self.name = 'Dissolve'
         self.group = 'Vector geometry tools'
@@ -25,8 +25,11 @@ __copyright__ = '(C) 2013, Bernhard Ströbl'
 
 __revision__ = '$Format:%H$'
 
+import heapq
+from collections import defaultdict
+
 from PyQt4.QtCore import QLocale, QDate
-from qgis.core import QgsFeatureRequest, QgsFeature, QgsGeometry
+from qgis.core import QgsExpression, QgsFeatureRequest, QgsFeature, QgsSpatialIndex
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.core.ProcessingLog import ProcessingLog
@@ -36,7 +39,7 @@ from processing.core.parameters import ParameterTableField
 from processing.core.parameters import ParameterString
 from processing.core.parameters import ParameterSelection
 from processing.core.outputs import OutputVector
-from processing.tools import dataobjects
+from processing.tools import dataobjects, vector
 
 
 class Eliminate(GeoAlgorithm):
@@ -88,8 +91,6 @@ class Eliminate(GeoAlgorithm):
 
     def processAlgorithm(self, progress):
         inLayer = dataobjects.getObjectFromUri(self.getParameterValue(self.INPUT))
-        boundary = self.getParameterValue(self.MODE) == self.MODE_BOUNDARY
-        smallestArea = self.getParameterValue(self.MODE) == self.MODE_SMALLEST_AREA
         keepSelection = self.getParameterValue(self.KEEPSELECTION)
 
         if not keepSelection:
@@ -150,172 +151,169 @@ class Eliminate(GeoAlgorithm):
                 selectionError = True
                 msg = self.tr('"%s" can only be used with string fields' % comparison)
 
-            selected = []
-
             if selectionError:
                 raise GeoAlgorithmExecutionException(
                     self.tr('Error in selection input: %s' % msg))
-            else:
-                for feature in inLayer.getFeatures():
-                    aValue = feature.attributes()[selectindex]
-
-                    if aValue is None:
-                        continue
-
-                    if selectType == 2:
-                        x = int(aValue)
-                    elif selectType == 6:
-                        x = float(aValue)
-                    elif selectType == 10:
-                        # 10: string, boolean
-                        x = unicode(aValue)
-                    elif selectType == 14:
-                        # date
-                        x = aValue  # should be date
-
-                    match = False
-
-                    if comparison == '==':
-                        match = x == y
-                    elif comparison == '!=':
-                        match = x != y
-                    elif comparison == '>':
-                        match = x > y
-                    elif comparison == '>=':
-                        match = x >= y
-                    elif comparison == '<':
-                        match = x < y
-                    elif comparison == '<=':
-                        match = x <= y
-                    elif comparison == 'begins with':
-                        match = x.startswith(y)
-                    elif comparison == 'contains':
-                        match = x.find(y) >= 0
-
-                    if match:
-                        selected.append(feature.id())
 
+            request = QgsFeatureRequest()
+            request.setFilterExpression(self.selectionExpression(
+                attribute, comparison, y, selectType))
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            selected = [feature.id() for feature in inLayer.getFeatures(request)]
             inLayer.setSelectedFeatures(selected)
 
         if inLayer.selectedFeatureCount() == 0:
             ProcessingLog.addToLog(ProcessingLog.LOG_WARNING,
                                    self.tr('%s: (No selection in input layer "%s")' % (self.commandLineName(), self.getParameterValue(self.INPUT))))
 
-        # Keep references to the features to eliminate
-        featToEliminate = []
-        for aFeat in inLayer.selectedFeatures():
-            featToEliminate.append(aFeat)
-
-        # Delete all features to eliminate in inLayer (we won't save this)
-        inLayer.startEditing()
-        inLayer.deleteSelectedFeatures()
-
-        # ANALYZE
-        if len(featToEliminate) > 0:  # Prevent zero division
-            start = 20.00
-            add = 80.00 / len(featToEliminate)
-        else:
-            start = 100
-
-        progress.setPercentage(start)
-        madeProgress = True
-
-        # We go through the list and see if we find any polygons we can
-        # merge the selected with. If we have no success with some we
-        # merge and then restart the whole story.
-        while madeProgress:  # Check if we made any progress
-            madeProgress = False
-            featNotEliminated = []
-
-            # Iterate over the polygons to eliminate
-            for i in range(len(featToEliminate)):
-                feat = featToEliminate.pop()
-                geom2Eliminate = feat.geometry()
-                bbox = geom2Eliminate.boundingBox()
-                fit = inLayer.getFeatures(
-                    QgsFeatureRequest().setFilterRect(bbox))
-                mergeWithFid = None
-                mergeWithGeom = None
-                max = 0
-                min = -1
-                selFeat = QgsFeature()
-
-                while fit.nextFeature(selFeat):
-                    selGeom = selFeat.geometry()
-
-                    if geom2Eliminate.intersects(selGeom):
-                        # We have a candidate
-                        iGeom = geom2Eliminate.intersection(selGeom)
-
-                        if iGeom is None:
-                            continue
-
-                        if boundary:
-                            selValue = iGeom.length()
-                        else:
-                            # area. We need a common boundary in
-                            # order to merge
-                            if 0 < iGeom.length():
-                                selValue = selGeom.area()
-                            else:
-                                selValue = -1
-
-                        if -1 != selValue:
-                            useThis = True
-
-                            if smallestArea:
-                                if -1 == min:
-                                    min = selValue
-                                else:
-                                    if selValue < min:
-                                        min = selValue
-                                    else:
-                                        useThis = False
-                            else:
-                                if selValue > max:
-                                    max = selValue
-                                else:
-                                    useThis = False
-
-                            if useThis:
-                                mergeWithFid = selFeat.id()
-                                mergeWithGeom = QgsGeometry(selGeom)
-                # End while fit
-
-                if mergeWithFid is not None:
-                    # A successful candidate
-                    newGeom = mergeWithGeom.combine(geom2Eliminate)
-
-                    if inLayer.changeGeometry(mergeWithFid, newGeom):
-                        madeProgress = True
-                    else:
-                        raise GeoAlgorithmExecutionException(
-                            self.tr('Could not replace geometry of feature with id %s' % mergeWithFid))
-
-                    start = start + add
-                    progress.setPercentage(start)
-                else:
-                    featNotEliminated.append(feat)
-
-            # End for featToEliminate
-
-            featToEliminate = featNotEliminated
-
-        # End while
-
-        # Create output
         provider = inLayer.dataProvider()
         output = self.getOutputFromName(self.OUTPUT)
         writer = output.getVectorWriter(provider.fields(),
                                         provider.geometryType(), inLayer.crs())
-
-        # Write all features that are left over to output layer
-        iterator = inLayer.getFeatures()
-        for feature in iterator:
+        self.eliminate(inLayer, inLayer.selectedFeaturesIds(),
+                       self.getParameterValue(self.MODE), writer, progress)
+        del writer
+
+    def selectionExpression(self, attribute, comparison, value, selectType):
+        """Returns a filter expression selecting the features whose
+        attribute compares as requested with the (converted) value.
+        """
+        column = QgsExpression.quotedColumnRef(attribute)
+        if selectType == 14:
+            literal = 'to_date(%s)' % QgsExpression.quotedString(value.toString('yyyy-MM-dd'))
+        elif selectType == 10:
+            literal = QgsExpression.quotedString(value)
+        else:
+            literal = repr(value)
+
+        if comparison == 'begins with':
+            return 'left(%s, %d) = %s' % (column, len(value), literal)
+        elif comparison == 'contains':
+            if not value:
+                return '%s IS NOT NULL' % column
+            return "length(replace(%s, %s, '')) < length(%s)" % (column, literal, column)
+        operators = {'==': '=', '!=': '<>'}
+        return '%s %s %s' % (column, operators.get(comparison, comparison), literal)
+
+    def eliminate(self, inLayer, sliverIds, mode, writer, progress):
+        """Merges each sliver with one of its neighbours, writing the
+        result to writer.
+
+        The adjacency graph of slivers and their neighbours, with the
+        length of the boundary they share, is built once with a spatial
+        index of the slivers. Slivers are then merged starting with
+        those next to a polygon that is not a sliver, and the graph is
+        updated with each merge: the neighbours of a merged sliver
+        become neighbours of the polygon it was merged into. Polygons
+        not next to any sliver are written as they are read.
+        """
+        sliverIds = set(sliverIds)
+        slivers = {}
+        index = QgsSpatialIndex()
+        request = QgsFeatureRequest().setFilterFids(list(sliverIds))
+        for feature in inLayer.getFeatures(request):
+            slivers[feature.id()] = QgsFeature(feature)
+            index.insertFeature(feature)
+
+        # The geometry whose neighbours are searched is prepared once,
+        # so that candidates with overlapping bounding boxes that do
+        # not touch it are rejected before measuring the boundary
+        engine = vector.GeometryPredicates(['intersects'])
+
+        def sharedBoundary(other):
+            if other is None or not engine.intersects(other):
+                return 0
+            iGeom = engine.geom.intersection(other)
+            return iGeom.length() if iGeom is not None else 0
+
+        # Neighbours of each sliver, with the length of the shared
+        # boundary
+        sliverNeighbours = defaultdict(dict)
+        polygonNeighbours = defaultdict(dict)
+        for fid, feature in slivers.iteritems():
+            geom = feature.geometry()
+            if geom is None:
+                continue
+            candidates = [other for other in index.intersects(geom.boundingBox())
+                          if other > fid]
+            if not candidates:
+                continue
+            engine.prepare(geom)
+            for other in candidates:
+                length = sharedBoundary(slivers[other].geometry())
+                if length > 0:
+                    sliverNeighbours[fid][other] = length
+                    sliverNeighbours[other][fid] = length
+        progress.setPercentage(10)
+
+        # Polygons next to slivers are kept to merge them, and the
+        # rest are written right away
+        polygons = {}
+        total = 50.0 / max(inLayer.featureCount(), 1)
+        for current, feature in enumerate(inLayer.getFeatures()):
+            fid = feature.id()
+            if fid in sliverIds:
+                continue
+            geom = feature.geometry()
+            neighbour = False
+            candidates = index.intersects(geom.boundingBox()) if geom is not None else []
+            if candidates:
+                engine.prepare(geom)
+                for sliver in candidates:
+                    length = sharedBoundary(slivers[sliver].geometry())
+                    if length > 0:
+                        polygonNeighbours[sliver][fid] = length
+                        neighbour = True
+            if neighbour:
+                polygons[fid] = QgsFeature(feature)
+            else:
+                writer.addFeature(feature)
+            progress.setPercentage(10 + int(current * total))
+
+        areas = dict((fid, feature.geometry().area())
+                     for fid, feature in polygons.iteritems())
+        merged = defaultdict(list)
+        mergedInto = {}
+
+        # Slivers next to a polygon come first, then those next to
+        # slivers merged before them, and so on
+        queue = [(0, sliver) for sliver in polygonNeighbours]
+        heapq.heapify(queue)
+        while queue:
+            rank, fid = heapq.heappop(queue)
+            if fid in mergedInto:
+                continue
+            candidates = polygonNeighbours[fid]
+            if mode == self.MODE_BOUNDARY:
+                target = max(candidates, key=lambda c: (candidates[c], -c))
+            elif mode == self.MODE_SMALLEST_AREA:
+                target = min(candidates, key=lambda c: (areas[c], c))
+            else:
+                target = max(candidates, key=lambda c: (areas[c], -c))
+            mergedInto[fid] = target
+            merged[target].append(fid)
+            areas[target] += slivers[fid].geometry().area()
+            for other, length in sliverNeighbours[fid].iteritems():
+                if other not in mergedInto:
+                    neighbours = polygonNeighbours[other]
+                    neighbours[target] = neighbours.get(target, 0) + length
+                    heapq.heappush(queue, (rank + 1, other))
+        progress.setPercentage(70)
+
+        total = 30.0 / max(len(polygons), 1)
+        for current, (fid, feature) in enumerate(polygons.iteritems()):
+            if fid in merged:
+                geoms = [feature.geometry()]
+                geoms.extend(slivers[sliver].geometry() for sliver in merged[fid])
+                newGeom = vector.cascadedUnion(geoms)
+                if newGeom is None:
+                    raise GeoAlgorithmExecutionException(
+                        self.tr('Could not replace geometry of feature with id %s' % fid))
+                feature.setGeometry(newGeom)
             writer.addFeature(feature)
+            progress.setPercentage(70 + int(current * total))
 
-        # Leave inLayer untouched
-        inLayer.rollBack()
-
-        for feature in featNotEliminated:
-            writer.addFeature(feature)
+        # Slivers that could not be merged are kept as they are
+        for fid, feature in slivers.iteritems():
+            if fid not in mergedInto:
+                writer.addFeature(feature)
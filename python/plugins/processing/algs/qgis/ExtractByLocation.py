@@ -25,7 +25,7 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
-from qgis.core import QGis, QgsFeatureRequest, QgsGeometry
+from qgis.core import QGis
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterGeometryPredicate
@@ -67,62 +67,39 @@ class ExtractByLocation(GeoAlgorithm):
         predicates = self.getParameterValue(self.PREDICATE)
         precision = self.getParameterValue(self.PRECISION)
 
-        index = vector.spatialindex(layer)
+        store = vector.FeatureStore(layer, [], precision=precision)
+        engine = vector.GeometryPredicates(predicates, converse=True)
 
         output = self.getOutputFromName(self.OUTPUT)
         writer = output.getVectorWriter(layer.pendingFields(),
                                         layer.dataProvider().geometryType(), layer.crs())
 
-        if 'disjoint' in predicates:
-            disjoinSet = []
-            for feat in vector.features(layer):
-                disjoinSet.append(feat.id())
+        disjoint = 'disjoint' in predicates
+        if disjoint:
+            disjoinSet = set(f.id() for f in
+                             vector.features(layer, [], geometry=False))
 
-        geom = QgsGeometry()
-        selectedSet = []
-        current = 0
-        features = vector.features(selectLayer)
+        selectedSet = set()
+        features = vector.features(selectLayer, [])
         featureCount = len(features)
         total = 100.0 / float(len(features))
         for current, f in enumerate(features):
             geom = vector.snapToPrecision(f.geometry(), precision)
             bbox = vector.bufferedBoundingBox(geom.boundingBox(), 0.51 * precision)
-            intersects = index.intersects(bbox)
-            for i in intersects:
-                request = QgsFeatureRequest().setFilterFid(i)
-                feat = layer.getFeatures(request).next()
-                tmpGeom = vector.snapToPrecision(feat.geometry(), precision)
-                res = False
-                for predicate in predicates:
-                    if predicate == 'disjoint':
-                        if tmpGeom.intersects(geom):
-                            try:
-                                disjoinSet.remove(feat.id())
-                            except:
-                                pass  # already removed
-                    else:
-                        if predicate == 'intersects':
-                            res = tmpGeom.intersects(geom)
-                        elif predicate == 'contains':
-                            res = tmpGeom.contains(geom)
-                        elif predicate == 'equals':
-                            res = tmpGeom.equals(geom)
-                        elif predicate == 'touches':
-                            res = tmpGeom.touches(geom)
-                        elif predicate == 'overlaps':
-                            res = tmpGeom.overlaps(geom)
-                        elif predicate == 'within':
-                            res = tmpGeom.within(geom)
-                        elif predicate == 'crosses':
-                            res = tmpGeom.crosses(geom)
-                        if res:
-                            selectedSet.append(feat.id())
-                            break
+            engine.prepare(geom)
+
+            for feat in store.features(store.intersects(bbox)):
+                fid = feat.id()
+                tmpGeom = feat.geometry()
+                if disjoint and fid in disjoinSet and engine.intersects(tmpGeom):
+                    disjoinSet.remove(fid)
+                if fid not in selectedSet and engine.matches(tmpGeom):
+                    selectedSet.add(fid)
 
             progress.setPercentage(int(current * total))
 
-        if 'disjoint' in predicates:
-            selectedSet = selectedSet + disjoinSet
+        if disjoint:
+            selectedSet.update(disjoinSet)
 
         for i, f in enumerate(vector.features(layer)):
             if f.id() in selectedSet:
@@ -26,7 +26,7 @@ __copyright__ = '(C) 2010, Michael Minn'
 __revision__ = '$Format:%H$'
 
 from PyQt4.QtCore import QVariant
-from qgis.core import QGis, QgsField, QgsGeometry, QgsDistanceArea, QgsFeature
+from qgis.core import QGis, QgsField, QgsGeometry, QgsDistanceArea, QgsFeature, QgsSpatialIndex
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.core.parameters import ParameterVector
@@ -106,12 +106,22 @@ class HubDistance(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(
             fields, geomType, layerPoints.crs())
 
-        # Create array of hubs in memory
+        # Create array of hubs in memory, with a spatial index over them
+        # whose feature ids are positions in the array
         hubs = []
-        features = vector.features(layerHubs)
+        index = QgsSpatialIndex()
+        features = vector.features(layerHubs, [fieldName])
         for f in features:
-            hubs.append(Hub(f.geometry().boundingBox().center(),
-                            unicode(f[fieldName])))
+            hub = Hub(f.geometry().boundingBox().center(),
+                      unicode(f[fieldName]))
+            feat = QgsFeature(len(hubs))
+            feat.setGeometry(QgsGeometry.fromPoint(hub.point))
+            index.insertFeature(feat)
+            hubs.append(hub)
+
+        if not hubs:
+            raise GeoAlgorithmExecutionException(
+                self.tr('Hub layer has no features'))
 
         distance = QgsDistanceArea()
         distance.setSourceCrs(layerPoints.crs().srsid())
@@ -120,18 +130,10 @@ class HubDistance(GeoAlgorithm):
         # Scan source points, find nearest hub, and write to output file
         features = vector.features(layerPoints)
         count = len(features)
-        total = 100.0 / float(count)
+        total = 100.0 / float(count) if count else 0
         for count, f in enumerate(features):
             src = f.geometry().boundingBox().center()
-
-            closest = hubs[0]
-            hubDist = distance.measureLine(src, closest.point)
-
-            for hub in hubs:
-                dist = distance.measureLine(src, hub.point)
-                if dist < hubDist:
-                    closest = hub
-                    hubDist = dist
+            closest, hubDist = nearestHub(src, hubs, index, distance)
 
             attributes = f.attributes()
             attributes.append(closest.name)
@@ -162,6 +164,25 @@ class HubDistance(GeoAlgorithm):
         del writer
 
 
+def nearestHub(point, hubs, index, distance):
+    """Returns the hub closest to a point, and its distance.
+
+    The spatial index returns the nearest hubs in layer coordinates
+    (more than one if there are ties), and only those candidates are
+    measured. No ellipsoid is set in the distance calculator, so the
+    measure is planar and the index ordering is exact.
+    """
+    closest = None
+    hubDist = None
+    for i in sorted(index.nearestNeighbor(point, 1)):
+        hub = hubs[i]
+        dist = distance.measureLine(point, hub.point)
+        if hubDist is None or dist < hubDist:
+            closest = hub
+            hubDist = dist
+    return closest, hubDist
+
+
 class Hub:
 
     def __init__(self, point, name):
@@ -73,32 +73,29 @@ class HubLines(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(
             layerSpoke.pendingFields(), QGis.WKBLineString, layerSpoke.crs())
 
+        # Index hub positions by id, keeping the first hub for each id
+        hubs = {}
+        for hubpoint in vector.features(layerHub, [fieldHub]):
+            hubId = unicode(hubpoint[fieldHub])
+            if hubId not in hubs:
+                hubs[hubId] = hubpoint.geometry().boundingBox().center()
+
         spokes = vector.features(layerSpoke)
-        hubs = vector.features(layerHub)
 
         count = len(spokes)
-        total = 100.0 / float(count)
+        total = 100.0 / float(count) if count else 0
 
         for count, spokepoint in enumerate(spokes):
-            p = spokepoint.geometry().boundingBox().center()
-            spokeX = p.x()
-            spokeY = p.y()
             spokeId = unicode(spokepoint[fieldSpoke])
-
-            for hubpoint in hubs:
-                hubId = unicode(hubpoint[fieldHub])
-                if hubId == spokeId:
-                    p = hubpoint.geometry().boundingBox().center()
-                    hubX = p.x()
-                    hubY = p.y()
-
-                    f = QgsFeature()
-                    f.setAttributes(spokepoint.attributes())
-                    f.setGeometry(QgsGeometry.fromPolyline(
-                        [QgsPoint(spokeX, spokeY), QgsPoint(hubX, hubY)]))
-                    writer.addFeature(f)
-
-                    break
+            hubPoint = hubs.get(spokeId)
+            if hubPoint is not None:
+                p = spokepoint.geometry().boundingBox().center()
+
+                f = QgsFeature()
+                f.setAttributes(spokepoint.attributes())
+                f.setGeometry(QgsGeometry.fromPolyline(
+                    [QgsPoint(p.x(), p.y()), QgsPoint(hubPoint.x(), hubPoint.y())]))
+                writer.addFeature(f)
 
             progress.setPercentage(int(count * total))
 
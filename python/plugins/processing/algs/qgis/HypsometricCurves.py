@@ -34,11 +34,13 @@ from osgeo import gdal, ogr, osr
 from qgis.core import QgsRectangle, QgsGeometry
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.core.parameters import ParameterRaster
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterNumber
 from processing.core.parameters import ParameterBoolean
 from processing.core.outputs import OutputDirectory
+from processing.core.outputs import OutputTable
 
 from processing.tools import raster
 from processing.tools import dataobjects
@@ -51,7 +53,10 @@ class HypsometricCurves(GeoAlgorithm):
     BOUNDARY_LAYER = 'BOUNDARY_LAYER'
     STEP = 'STEP'
     USE_PERCENTAGE = 'USE_PERCENTAGE'
+    SINGLE_PASS = 'SINGLE_PASS'
+    FEATURE_FILES = 'FEATURE_FILES'
     OUTPUT_DIRECTORY = 'OUTPUT_DIRECTORY'
+    OUTPUT_TABLE = 'OUTPUT_TABLE'
 
     def defineCharacteristics(self):
         self.name, self.i18n_name = self.trAlgorithm('Hypsometric curves')
@@ -65,9 +70,17 @@ class HypsometricCurves(GeoAlgorithm):
                                           self.tr('Step'), 0.0, 999999999.999999, 100.0))
         self.addParameter(ParameterBoolean(self.USE_PERCENTAGE,
                                            self.tr('Use % of area instead of absolute value'), False))
+        self.addParameter(ParameterBoolean(self.SINGLE_PASS,
+                                           self.tr('Compute all features together, reading the DEM by strips (features must not overlap)'),
+                                           False))
+        self.addParameter(ParameterBoolean(self.FEATURE_FILES,
+                                           self.tr('Write a file for each feature to the output directory'),
+                                           True))
 
         self.addOutput(OutputDirectory(self.OUTPUT_DIRECTORY,
                                        self.tr('Hypsometric curves')))
+        self.addOutput(OutputTable(self.OUTPUT_TABLE,
+                                   self.tr('Hypsometric curves table')))
 
     def processAlgorithm(self, progress):
         rasterPath = self.getParameterValue(self.INPUT_DEM)
@@ -75,6 +88,12 @@ class HypsometricCurves(GeoAlgorithm):
             self.getParameterValue(self.BOUNDARY_LAYER))
         step = self.getParameterValue(self.STEP)
         percentage = self.getParameterValue(self.USE_PERCENTAGE)
+        singlePass = self.getParameterValue(self.SINGLE_PASS)
+        featureFiles = self.getParameterValue(self.FEATURE_FILES)
+
+        if step <= 0:
+            raise GeoAlgorithmExecutionException(
+                self.tr('Step must be greater than zero'))
 
         outputPath = self.getOutputValue(self.OUTPUT_DIRECTORY)
 
@@ -88,129 +107,193 @@ class HypsometricCurves(GeoAlgorithm):
         rasterXSize = rasterDS.RasterXSize
         rasterYSize = rasterDS.RasterYSize
 
-        rasterBBox = QgsRectangle(geoTransform[0], geoTransform[3] - cellYSize
-                                  * rasterYSize, geoTransform[0] + cellXSize
-                                  * rasterXSize, geoTransform[3])
-        rasterGeom = QgsGeometry.fromRect(rasterBBox)
-
-        crs = osr.SpatialReference()
-        crs.ImportFromProj4(str(layer.crs().toProj4()))
-
-        memVectorDriver = ogr.GetDriverByName('Memory')
-        memRasterDriver = gdal.GetDriverByName('MEM')
+        with self.getOutputFromName(self.OUTPUT_TABLE).getTableWriter(
+                ['fid', self.tr('Area'), self.tr('Elevation')]) as table:
+
+            def writeCurve(fid, curve):
+                table.addRecords([fid, area, elevation] for (area, elevation) in curve)
+                if featureFiles:
+                    fName = os.path.join(
+                        outputPath, 'hystogram_%s_%s.csv' % (layer.name(), fid))
+                    with vector.TableWriter(fName, 'utf-8', [self.tr('Area'), self.tr('Elevation')]) as writer:
+                        writer.addRecords(curve)
+
+            if singlePass:
+                self.processSinglePass(layer, rasterDS, rasterBand, cellXSize,
+                                       cellYSize, percentage, step, writeCurve,
+                                       progress)
+                rasterDS = None
+                return
+
+            rasterBBox = QgsRectangle(geoTransform[0], geoTransform[3] - cellYSize
+                                      * rasterYSize, geoTransform[0] + cellXSize
+                                      * rasterXSize, geoTransform[3])
+            rasterGeom = QgsGeometry.fromRect(rasterBBox)
+
+            crs = osr.SpatialReference()
+            crs.ImportFromProj4(str(layer.crs().toProj4()))
+
+            memVectorDriver = ogr.GetDriverByName('Memory')
+            memRasterDriver = gdal.GetDriverByName('MEM')
+
+            features = vector.features(layer)
+            count = len(features)
+            total = 100.0 / float(count)
+
+            for count, f in enumerate(features):
+                geom = f.geometry()
+                intersectedGeom = rasterGeom.intersection(geom)
+
+                if intersectedGeom.isGeosEmpty():
+                    progress.setInfo(
+                        self.tr('Feature %d does not intersect raster or '
+                                'entirely located in NODATA area' % f.id()))
+                    continue
+
+                ogrGeom = ogr.CreateGeometryFromWkt(intersectedGeom.exportToWkt())
+                bbox = intersectedGeom.boundingBox()
+                xMin = bbox.xMinimum()
+                xMax = bbox.xMaximum()
+                yMin = bbox.yMinimum()
+                yMax = bbox.yMaximum()
+
+                (startColumn, startRow) = raster.mapToPixel(xMin, yMax, geoTransform)
+                (endColumn, endRow) = raster.mapToPixel(xMax, yMin, geoTransform)
+
+                width = endColumn - startColumn
+                height = endRow - startRow
+
+                srcOffset = (startColumn, startRow, width, height)
+                srcArray = rasterBand.ReadAsArray(*srcOffset)
+
+                if srcOffset[2] == 0 or srcOffset[3] == 0:
+                    progress.setInfo(
+                        self.tr('Feature %d is smaller than raster '
+                                'cell size' % f.id()))
+                    continue
+
+                newGeoTransform = (
+                    geoTransform[0] + srcOffset[0] * geoTransform[1],
+                    geoTransform[1],
+                    0.0,
+                    geoTransform[3] + srcOffset[1] * geoTransform[5],
+                    0.0,
+                    geoTransform[5]
+                )
+
+                memVDS = memVectorDriver.CreateDataSource('out')
+                memLayer = memVDS.CreateLayer('poly', crs, ogr.wkbPolygon)
+
+                ft = ogr.Feature(memLayer.GetLayerDefn())
+                ft.SetGeometry(ogrGeom)
+                memLayer.CreateFeature(ft)
+                ft.Destroy()
+
+                rasterizedDS = memRasterDriver.Create('', srcOffset[2],
+                                                      srcOffset[3], 1, gdal.GDT_Byte)
+                rasterizedDS.SetGeoTransform(newGeoTransform)
+                gdal.RasterizeLayer(rasterizedDS, [1], memLayer, burn_values=[1])
+                rasterizedArray = rasterizedDS.ReadAsArray()
+
+                srcArray = numpy.nan_to_num(srcArray)
+                masked = numpy.ma.MaskedArray(srcArray,
+                                              mask=numpy.logical_or(srcArray == noData,
+                                                                    numpy.logical_not(rasterizedArray)))
+
+                d = masked.compressed()
+                if d.size == 0:
+                    progress.setInfo(
+                        self.tr('Feature %d does not intersect raster or '
+                                'entirely located in NODATA area' % f.id()))
+                else:
+                    writeCurve(f.id(), self.calculateHypsometry(
+                        d, cellXSize, cellYSize, percentage, step))
+
+                memVDS = None
+                rasterizedDS = None
+                progress.setPercentage(int(count * total))
 
-        features = vector.features(layer)
-        count = len(features)
-        total = 100.0 / float(count)
-
-        for count, f in enumerate(features):
-            geom = f.geometry()
-            intersectedGeom = rasterGeom.intersection(geom)
+        rasterDS = None
 
-            if intersectedGeom.isGeosEmpty():
+    def processSinglePass(self, layer, rasterDS, rasterBand, pX, pY,
+                          percentage, step, writeCurve, progress):
+        """Burns all features into a label raster, strip by strip, and
+        accumulates their histograms with numpy.bincount.
+
+        The DEM is read twice, the first time to find the elevation
+        range of each feature, which sets its bins.
+        """
+        rasterizer = raster.ZoneRasterizer(rasterDS.GetGeoTransform(),
+                                           rasterDS.RasterXSize,
+                                           rasterDS.RasterYSize)
+        fids = [None]
+        for f in vector.features(layer):
+            rasterizer.addZone(f.geometry())
+            fids.append(f.id())
+
+        strips = list(raster.rasterStrips(rasterBand))
+        total = 50.0 / len(strips) if strips else 0
+
+        zoneCount = len(fids)
+        minimum = numpy.empty(zoneCount)
+        minimum.fill(numpy.inf)
+        maximum = numpy.empty(zoneCount)
+        maximum.fill(-numpy.inf)
+        cells = numpy.zeros(zoneCount, numpy.int64)
+        for current, (yOffset, ySize) in enumerate(strips):
+            labels, values = raster.stripZoneValues(rasterizer, rasterBand,
+                                                    yOffset, ySize)
+            numpy.minimum.at(minimum, labels, values)
+            numpy.maximum.at(maximum, labels, values)
+            cells += numpy.bincount(labels, minlength=zoneCount)
+            progress.setPercentage(int(current * total))
+
+        # The bins of each zone follow those of the previous one
+        found = cells > 0
+        steps = numpy.zeros(zoneCount, numpy.int64)
+        steps[found] = numpy.ceil((maximum[found] - minimum[found]) / step)
+        offsets = numpy.concatenate(([0], numpy.cumsum(steps)))
+        counts = numpy.zeros(offsets[-1], numpy.int64)
+        for current, (yOffset, ySize) in enumerate(strips):
+            labels, values = raster.stripZoneValues(rasterizer, rasterBand,
+                                                    yOffset, ySize)
+            bins = numpy.floor((values - minimum[labels]) / step).astype(numpy.int64)
+            # The maximum value itself falls out of the last half-open bin
+            inRange = bins < steps[labels]
+            stripCounts = numpy.bincount(offsets[labels[inRange]] + bins[inRange])
+            counts[:stripCounts.size] += stripCounts
+            progress.setPercentage(50 + int(current * total))
+
+        for zone in xrange(1, zoneCount):
+            if found[zone]:
+                writeCurve(fids[zone], self.hypsometry(
+                    counts[offsets[zone]:offsets[zone + 1]], minimum[zone],
+                    cells[zone], pX, pY, percentage, step))
+            else:
                 progress.setInfo(
                     self.tr('Feature %d does not intersect raster or '
-                            'entirely located in NODATA area' % f.id()))
-                continue
-
-            fName = os.path.join(
-                outputPath, 'hystogram_%s_%s.csv' % (layer.name(), f.id()))
-
-            ogrGeom = ogr.CreateGeometryFromWkt(intersectedGeom.exportToWkt())
-            bbox = intersectedGeom.boundingBox()
-            xMin = bbox.xMinimum()
-            xMax = bbox.xMaximum()
-            yMin = bbox.yMinimum()
-            yMax = bbox.yMaximum()
-
-            (startColumn, startRow) = raster.mapToPixel(xMin, yMax, geoTransform)
-            (endColumn, endRow) = raster.mapToPixel(xMax, yMin, geoTransform)
-
-            width = endColumn - startColumn
-            height = endRow - startRow
-
-            srcOffset = (startColumn, startRow, width, height)
-            srcArray = rasterBand.ReadAsArray(*srcOffset)
-
-            if srcOffset[2] == 0 or srcOffset[3] == 0:
-                progress.setInfo(
-                    self.tr('Feature %d is smaller than raster '
-                            'cell size' % f.id()))
-                continue
-
-            newGeoTransform = (
-                geoTransform[0] + srcOffset[0] * geoTransform[1],
-                geoTransform[1],
-                0.0,
-                geoTransform[3] + srcOffset[1] * geoTransform[5],
-                0.0,
-                geoTransform[5]
-            )
-
-            memVDS = memVectorDriver.CreateDataSource('out')
-            memLayer = memVDS.CreateLayer('poly', crs, ogr.wkbPolygon)
-
-            ft = ogr.Feature(memLayer.GetLayerDefn())
-            ft.SetGeometry(ogrGeom)
-            memLayer.CreateFeature(ft)
-            ft.Destroy()
-
-            rasterizedDS = memRasterDriver.Create('', srcOffset[2],
-                                                  srcOffset[3], 1, gdal.GDT_Byte)
-            rasterizedDS.SetGeoTransform(newGeoTransform)
-            gdal.RasterizeLayer(rasterizedDS, [1], memLayer, burn_values=[1])
-            rasterizedArray = rasterizedDS.ReadAsArray()
-
-            srcArray = numpy.nan_to_num(srcArray)
-            masked = numpy.ma.MaskedArray(srcArray,
-                                          mask=numpy.logical_or(srcArray == noData,
-                                                                numpy.logical_not(rasterizedArray)))
-
-            self.calculateHypsometry(f.id(), fName, progress, masked,
-                                     cellXSize, cellYSize, percentage, step)
-
-            memVDS = None
-            rasterizedDS = None
-            progress.setPercentage(int(count * total))
-
-        rasterDS = None
-
-    def calculateHypsometry(self, fid, fName, progress, data, pX, pY,
-                            percentage, step):
-        out = dict()
-        d = data.compressed()
-        if d.size == 0:
-            progress.setInfo(
-                self.tr('Feature %d does not intersect raster or '
-                        'entirely located in NODATA area' % fid))
-            return
+                            'entirely located in NODATA area' % fids[zone]))
 
+    def calculateHypsometry(self, d, pX, pY, percentage, step):
+        """Returns the (cumulated area, elevation) pairs of the curve
+        for an array of elevations, one step apart.
+        """
+        d = numpy.asarray(d, numpy.float64)
         minValue = d.min()
-        maxValue = d.max()
-        startValue = minValue
-        tmpValue = minValue + step
-        while startValue < maxValue:
-            out[tmpValue] = ((startValue <= d) & (d < tmpValue)).sum()
-            startValue = tmpValue
-            tmpValue += step
-
+        steps = int(numpy.ceil((d.max() - minValue) / step))
+        bins = numpy.floor((d - minValue) / step).astype(numpy.int64)
+        # The maximum value itself falls out of the last half-open bin
+        counts = numpy.bincount(bins[bins < steps], minlength=max(steps, 1))[:steps]
+        return self.hypsometry(counts, minValue, d.size, pX, pY,
+                               percentage, step)
+
+    def hypsometry(self, counts, minValue, cellCount, pX, pY, percentage,
+                   step):
         if percentage:
-            multiplier = 100.0 / float(len(d.flat))
+            multiplier = 100.0 / float(cellCount)
         else:
             multiplier = pX * pY
 
-        for k, v in out.iteritems():
-            out[k] = v * multiplier
-
-        prev = None
-        for i in sorted(out.items()):
-            if prev is None:
-                out[i[0]] = i[1]
-            else:
-                out[i[0]] = i[1] + out[prev]
-            prev = i[0]
-
-        writer = vector.TableWriter(fName, 'utf-8', [self.tr('Area'), self.tr('Elevation')])
-        for i in sorted(out.items()):
-            writer.addRecord([i[1], i[0]])
-        del writer
+        areas = numpy.cumsum(counts) * multiplier
+        elevations = minValue + step * numpy.arange(1, len(counts) + 1)
+        return zip(areas.tolist(), elevations.tolist())
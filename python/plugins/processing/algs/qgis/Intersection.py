@@ -25,7 +25,7 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
-from qgis.core import QGis, QgsFeatureRequest, QgsFeature, QgsGeometry, QgsWKBTypes
+from qgis.core import QGis, QgsFeature, QgsGeometry, QgsWKBTypes
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.ProcessingLog import ProcessingLog
 from processing.core.parameters import ParameterVector
@@ -61,7 +61,7 @@ class Intersection(GeoAlgorithm):
         inFeatA = QgsFeature()
         inFeatB = QgsFeature()
         outFeat = QgsFeature()
-        index = vector.spatialindex(vlayerB)
+        store = vector.FeatureStore(vlayerB)
         nElement = 0
         selectionA = vector.features(vlayerA)
         nFeat = len(selectionA)
@@ -70,10 +70,8 @@ class Intersection(GeoAlgorithm):
             progress.setPercentage(nElement / float(nFeat) * 100)
             geom = QgsGeometry(inFeatA.geometry())
             atMapA = inFeatA.attributes()
-            intersects = index.intersects(geom.boundingBox())
-            for i in intersects:
-                request = QgsFeatureRequest().setFilterFid(i)
-                inFeatB = vlayerB.getFeatures(request).next()
+            intersects = store.intersects(geom.boundingBox())
+            for inFeatB in store.features(intersects):
                 tmpGeom = QgsGeometry(inFeatB.geometry())
                 try:
                     if geom.intersects(tmpGeom):
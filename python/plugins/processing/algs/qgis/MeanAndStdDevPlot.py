@@ -71,7 +71,8 @@ class MeanAndStdDevPlot(GeoAlgorithm):
 
         output = self.getOutputValue(self.OUTPUT)
 
-        values = vector.values(layer, namefieldname, meanfieldname, stddevfieldname)
+        values = vector.values(layer, namefieldname, meanfieldname,
+                               stddevfieldname, asNumpy=True)
         plt.close()
         ind = np.arange(len(values[namefieldname]))
         width = 0.8
@@ -27,7 +27,7 @@ __revision__ = '$Format:%H$'
 
 import math
 import codecs
-from qgis.core import QgsFeatureRequest, QgsFeature, QgsDistanceArea
+from qgis.core import QgsFeature, QgsDistanceArea
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.outputs import OutputHTML
@@ -70,7 +70,7 @@ class NearestNeighbourAnalysis(GeoAlgorithm):
         layer = dataobjects.getObjectFromUri(self.getParameterValue(self.POINTS))
         output = self.getOutputValue(self.OUTPUT)
 
-        spatialIndex = vector.spatialindex(layer)
+        store = vector.FeatureStore(layer, [])
 
         neighbour = QgsFeature()
         distance = QgsDistanceArea()
@@ -84,10 +84,9 @@ class NearestNeighbourAnalysis(GeoAlgorithm):
         count = len(features)
         total = 100.0 / float(len(features))
         for feat in features:
-            neighbourID = spatialIndex.nearestNeighbor(
+            neighbourID = store.nearestNeighbor(
                 feat.geometry().asPoint(), 2)[1]
-            request = QgsFeatureRequest().setFilterFid(neighbourID)
-            neighbour = layer.getFeatures(request).next()
+            neighbour = store.feature(neighbourID)
             sumDist += distance.measureLine(neighbour.geometry().asPoint(),
                                             feat.geometry().asPoint())
 
@@ -26,7 +26,7 @@ __copyright__ = '(C) 2012, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import math
-from qgis.core import QgsFeatureRequest, QgsFeature, QgsGeometry, QgsDistanceArea
+from qgis.core import QgsFeature, QgsGeometry, QgsDistanceArea
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterNumber
 from processing.core.parameters import ParameterVector
@@ -86,20 +86,19 @@ class PointDistance(GeoAlgorithm):
         if nPoints < 1:
             nPoints = len(vector.features(targetLayer))
 
-        self.writer = outputFile.getTableWriter([])
-
-        if matType == 0:
-            # Linear distance matrix
-            self.linearMatrix(inLayer, inField, targetLayer, targetField,
-                              matType, nPoints, progress)
-        elif matType == 1:
-            # Standard distance matrix
-            self.regularMatrix(inLayer, inField, targetLayer, targetField,
-                               nPoints, progress)
-        elif matType == 2:
-            # Summary distance matrix
-            self.linearMatrix(inLayer, inField, targetLayer, targetField,
-                              matType, nPoints, progress)
+        with outputFile.getTableWriter([]) as self.writer:
+            if matType == 0:
+                # Linear distance matrix
+                self.linearMatrix(inLayer, inField, targetLayer, targetField,
+                                  matType, nPoints, progress)
+            elif matType == 1:
+                # Standard distance matrix
+                self.regularMatrix(inLayer, inField, targetLayer, targetField,
+                                   nPoints, progress)
+            elif matType == 2:
+                # Summary distance matrix
+                self.linearMatrix(inLayer, inField, targetLayer, targetField,
+                                  matType, nPoints, progress)
 
     def linearMatrix(self, inLayer, inField, targetLayer, targetField,
                      matType, nPoints, progress):
@@ -108,7 +107,7 @@ class PointDistance(GeoAlgorithm):
         else:
             self.writer.addRecord(['InputID', 'MEAN', 'STDDEV', 'MIN', 'MAX'])
 
-        index = vector.spatialindex(targetLayer)
+        store = vector.FeatureStore(targetLayer, [targetField])
 
         inIdx = inLayer.fieldNameIndex(inField)
         outIdx = targetLayer.fieldNameIndex(targetField)
@@ -124,12 +123,10 @@ class PointDistance(GeoAlgorithm):
         for inFeat in features:
             inGeom = inFeat.geometry()
             inID = unicode(inFeat.attributes()[inIdx])
-            featList = index.nearestNeighbor(inGeom.asPoint(), nPoints)
+            featList = store.nearestNeighbor(inGeom.asPoint(), nPoints)
             distList = []
             vari = 0.0
-            for i in featList:
-                request = QgsFeatureRequest().setFilterFid(i)
-                outFeat = targetLayer.getFeatures(request).next()
+            for outFeat in store.features(featList):
                 outID = outFeat.attributes()[outIdx]
                 outGeom = outFeat.geometry()
                 dist = distArea.measureLine(inGeom.asPoint(),
@@ -153,7 +150,7 @@ class PointDistance(GeoAlgorithm):
 
     def regularMatrix(self, inLayer, inField, targetLayer, targetField,
                       nPoints, progress):
-        index = vector.spatialindex(targetLayer)
+        store = vector.FeatureStore(targetLayer, [])
 
         inIdx = inLayer.fieldNameIndex(inField)
 
@@ -170,7 +167,7 @@ class PointDistance(GeoAlgorithm):
         for inFeat in features:
             inGeom = inFeat.geometry()
             inID = unicode(inFeat.attributes()[inIdx])
-            featList = index.nearestNeighbor(inGeom.asPoint(), nPoints)
+            featList = store.nearestNeighbor(inGeom.asPoint(), nPoints)
             if first:
                 first = False
                 data = ['ID']
@@ -179,9 +176,7 @@ class PointDistance(GeoAlgorithm):
                 self.writer.addRecord(data)
 
             data = [inID]
-            for i in featList:
-                request = QgsFeatureRequest().setFilterFid(i)
-                outFeat = targetLayer.getFeatures(request).next()
+            for outFeat in store.features(featList):
                 outGeom = outFeat.geometry()
                 dist = distArea.measureLine(inGeom.asPoint(),
                                             outGeom.asPoint())
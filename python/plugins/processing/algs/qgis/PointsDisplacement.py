@@ -25,8 +25,8 @@ __copyright__ = '(C) 2013, Alexander Bruy'
 
 __revision__ = '$Format:%H$'
 
-import math
-from qgis.core import QgsFeatureRequest, QgsFeature, QgsGeometry, QgsPoint
+import numpy
+from qgis.core import QGis, QgsFeature, QgsGeometry
 from processing.tools import dataobjects, vector
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
@@ -40,6 +40,7 @@ class PointsDisplacement(GeoAlgorithm):
     INPUT_LAYER = 'INPUT_LAYER'
     DISTANCE = 'DISTANCE'
     HORIZONTAL = 'HORIZONTAL'
+    PRECISION = 'PRECISION'
     OUTPUT_LAYER = 'OUTPUT_LAYER'
 
     def defineCharacteristics(self):
@@ -53,11 +54,15 @@ class PointsDisplacement(GeoAlgorithm):
                                           0.00001, 999999999.999990, 0.00015))
         self.addParameter(ParameterBoolean(self.HORIZONTAL,
                                            self.tr('Horizontal distribution for two point case')))
+        self.addParameter(ParameterNumber(self.PRECISION,
+                                          self.tr('Precision'),
+                                          0.0, None, 0.0))
         self.addOutput(OutputVector(self.OUTPUT_LAYER, self.tr('Displaced')))
 
     def processAlgorithm(self, progress):
         radius = self.getParameterValue(self.DISTANCE)
         horizontal = self.getParameterValue(self.HORIZONTAL)
+        precision = self.getParameterValue(self.PRECISION)
         output = self.getOutputFromName(self.OUTPUT_LAYER)
 
         layer = dataobjects.getObjectFromUri(self.getParameterValue(self.INPUT_LAYER))
@@ -71,55 +76,64 @@ class PointsDisplacement(GeoAlgorithm):
         current = 0
         total = 100.0 / len(features)
 
+        # Features at each location. Points are keyed by their
+        # coordinates, rounded to the precision if it is not zero, and
+        # other geometries by their WKB
         duplicates = dict()
         for f in features:
-            wkt = f.geometry().exportToWkt()
-            if wkt not in duplicates:
-                duplicates[wkt] = [f.id()]
+            geom = f.geometry()
+            if geom is None:
+                writer.addFeature(f)
             else:
-                duplicates[wkt].extend([f.id()])
+                duplicates.setdefault(self.locationKey(geom, precision), []).append(f)
 
             current += 1
             progress.setPercentage(int(current * total))
 
         current = 0
-        total = 100.0 / len(duplicates)
+        total = 100.0 / len(duplicates) if duplicates else 0
         progress.setPercentage(0)
 
-        fullPerimeter = 2 * math.pi
-
-        request = QgsFeatureRequest()
-        for (geom, fids) in duplicates.iteritems():
-            count = len(fids)
+        rings = dict()
+        outFeat = QgsFeature()
+        for group in duplicates.itervalues():
+            count = len(group)
             if count == 1:
-                f = layer.getFeatures(request.setFilterFid(fids[0])).next()
-                writer.addFeature(f)
+                writer.addFeature(group[0])
             else:
-                angleStep = fullPerimeter / count
-                if count == 2 and horizontal:
-                    currentAngle = math.pi / 2
-                else:
-                    currentAngle = 0
-
-                old_point = QgsGeometry.fromWkt(geom).asPoint()
-                for fid in fids:
-                    sinusCurrentAngle = math.sin(currentAngle)
-                    cosinusCurrentAngle = math.cos(currentAngle)
-                    dx = radius * sinusCurrentAngle
-                    dy = radius * cosinusCurrentAngle
-
-                    f = layer.getFeatures(request.setFilterFid(fid)).next()
-
-                    new_point = QgsPoint(old_point.x() + dx, old_point.y()
-                                         + dy)
-                    out_feature = QgsFeature()
-                    out_feature.setGeometry(QgsGeometry.fromPoint(new_point))
-                    out_feature.setAttributes(f.attributes())
-
-                    writer.addFeature(out_feature)
-                    currentAngle += angleStep
+                if count not in rings:
+                    dx, dy = self.ring(count, radius, horizontal)
+                    rings[count] = zip(dx.tolist(), dy.tolist())
+                # The ring is centred on the first feature, as nearby
+                # points grouped by the precision differ slightly
+                centre = group[0].geometry()
+                for f, (dx, dy) in zip(group, rings[count]):
+                    geom = QgsGeometry(centre)
+                    geom.translate(dx, dy)
+                    outFeat.setGeometry(geom)
+                    outFeat.setAttributes(f.attributes())
+                    writer.addFeature(outFeat)
 
             current += 1
             progress.setPercentage(int(current * total))
 
         del writer
+
+    def locationKey(self, geom, precision):
+        if geom.wkbType() != QGis.WKBPoint:
+            return geom.asWkb()
+        point = geom.asPoint()
+        if precision:
+            return (round(point.x() / precision), round(point.y() / precision))
+        return (point.x(), point.y())
+
+    def ring(self, count, radius, horizontal):
+        """Returns the x and y offsets of count points evenly spread
+        on a circle, clockwise from the top.
+        """
+        if count == 2 and horizontal:
+            startAngle = numpy.pi / 2
+        else:
+            startAngle = 0
+        angles = startAngle + numpy.arange(count) * (2 * numpy.pi / count)
+        return radius * numpy.sin(angles), radius * numpy.cos(angles)
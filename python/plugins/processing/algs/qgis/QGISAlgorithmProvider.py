@@ -145,6 +145,10 @@ class QGISAlgorithmProvider(AlgorithmProvider):
 
     def __init__(self):
         AlgorithmProvider.__init__(self)
+        # Created the first time algorithms are loaded
+        self.alglist = None
+
+    def createAlgsList(self):
         self.alglist = [SumLines(), PointsInPolygon(),
                         PointsInPolygonWeighted(), PointsInPolygonUnique(),
                         BasicStatisticsStrings(), BasicStatisticsNumbers(),
@@ -224,6 +228,8 @@ class QGISAlgorithmProvider(AlgorithmProvider):
         return self._icon
 
     def _loadAlgorithms(self):
+        if self.alglist is None:
+            self.createAlgsList()
         self.algs = self.alglist
 
     def supportsNonFileBasedOutput(self):
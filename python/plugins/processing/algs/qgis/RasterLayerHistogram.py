@@ -25,6 +25,7 @@ __copyright__ = '(C) 2013, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
+import numpy
 import matplotlib.pyplot as plt
 import matplotlib.pylab as lab
 
@@ -67,21 +68,36 @@ class RasterLayerHistogram(GeoAlgorithm):
         outputplot = self.getOutputValue(self.PLOT)
         outputtable = self.getOutputFromName(self.TABLE)
 
-        values = raster.scanraster(layer, progress)
+        # A first pass finds the value range, a second one counts the
+        # values of each block into the bins spanning it
+        minvalue = None
+        maxvalue = None
+        for block in raster.scanrasterblocks(layer):
+            if block.count() == 0:
+                continue
+            if minvalue is None:
+                minvalue = float(block.min())
+                maxvalue = float(block.max())
+            else:
+                minvalue = min(float(block.min()), minvalue)
+                maxvalue = max(float(block.max()), maxvalue)
+        if minvalue is None:
+            minvalue = maxvalue = 0.0
+
+        bins = numpy.histogram([], nbins, (minvalue, maxvalue))[1]
+        n = numpy.zeros(nbins)
+        for block in raster.scanrasterblocks(layer, progress):
+            n += numpy.histogram(block.compressed(), bins)[0]
 
-        # ALERT: this is potentially blocking if the layer is too big
         plt.close()
-        valueslist = []
-        for v in values:
-            if v is not None:
-                valueslist.append(v)
-        (n, bins, values) = plt.hist(valueslist, nbins)
+        plt.hist(bins[:-1], bins, weights=n)
 
         fields = [QgsField('CENTER_VALUE', QVariant.Double),
                   QgsField('NUM_ELEM', QVariant.Double)]
         writer = outputtable.getTableWriter(fields)
-        for i in xrange(len(values)):
+        for i in xrange(len(n)):
             writer.addRecord([unicode(bins[i]) + '-' + unicode(bins[i + 1]), n[i]])
+        writer.close()
 
         plotFilename = outputplot + '.png'
         lab.savefig(plotFilename)
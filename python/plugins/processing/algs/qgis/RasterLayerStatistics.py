@@ -27,6 +27,7 @@ __revision__ = '$Format:%H$'
 
 import math
 import codecs
+import numpy
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterRaster
@@ -53,7 +54,6 @@ class RasterLayerStatistics(GeoAlgorithm):
         outputFile = self.getOutputValue(self.OUTPUT_HTML_FILE)
         uri = self.getParameterValue(self.INPUT)
         layer = dataobjects.getObjectFromUri(uri)
-        values = raster.scanraster(layer, progress)
 
         n = 0
         nodata = 0
@@ -63,21 +63,31 @@ class RasterLayerStatistics(GeoAlgorithm):
         minvalue = None
         maxvalue = None
 
-        for v in values:
-            if v is not None:
-                sum += v
-                n = n + 1
-                delta = v - mean
-                mean = mean + delta / n
-                M2 = M2 + delta * (v - mean)
-                if minvalue is None:
-                    minvalue = v
-                    maxvalue = v
-                else:
-                    minvalue = min(v, minvalue)
-                    maxvalue = max(v, maxvalue)
+        for block in raster.scanrasterblocks(layer, progress):
+            values = block.compressed().astype(numpy.float64)
+            nodata += block.size - values.size
+            if values.size == 0:
+                continue
+
+            # Combine the block moments with the running ones
+            blockN = values.size
+            blockMean = float(values.mean())
+            blockM2 = float(((values - blockMean) ** 2).sum())
+            delta = blockMean - mean
+            total = n + blockN
+            mean = mean + delta * blockN / total
+            M2 = M2 + blockM2 + delta * delta * n * blockN / total
+            n = total
+            sum += float(values.sum())
+
+            blockMin = float(values.min())
+            blockMax = float(values.max())
+            if minvalue is None:
+                minvalue = blockMin
+                maxvalue = blockMax
             else:
-                nodata += 1
+                minvalue = min(blockMin, minvalue)
+                maxvalue = max(blockMax, maxvalue)
 
         variance = M2 / (n - 1)
         stddev = math.sqrt(variance)
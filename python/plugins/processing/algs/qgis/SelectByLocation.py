@@ -25,7 +25,7 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
-from qgis.core import QGis, QgsGeometry, QgsFeatureRequest
+from qgis.core import QGis
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterSelection
 from processing.core.parameters import ParameterVector
@@ -80,65 +80,41 @@ class SelectByLocation(GeoAlgorithm):
 
         oldSelection = set(inputLayer.selectedFeaturesIds())
         inputLayer.removeSelection()
-        index = vector.spatialindex(inputLayer)
+        store = vector.FeatureStore(inputLayer, [], precision=precision)
+        engine = vector.GeometryPredicates(predicates, converse=True)
 
-        if 'disjoint' in predicates:
-            disjoinSet = []
-            for feat in vector.features(inputLayer):
-                disjoinSet.append(feat.id())
+        disjoint = 'disjoint' in predicates
+        if disjoint:
+            disjoinSet = set(f.id() for f in
+                             vector.features(inputLayer, [], geometry=False))
 
-        geom = QgsGeometry()
-        selectedSet = []
+        selectedSet = set()
         current = 0
-        features = vector.features(selectLayer)
+        features = vector.features(selectLayer, [])
         total = 100.0 / float(len(features))
         for f in features:
             geom = vector.snapToPrecision(f.geometry(), precision)
             bbox = vector.bufferedBoundingBox(geom.boundingBox(), 0.51 * precision)
-            intersects = index.intersects(bbox)
-
-            for i in intersects:
-                request = QgsFeatureRequest().setFilterFid(i)
-                feat = inputLayer.getFeatures(request).next()
-                tmpGeom = vector.snapToPrecision(feat.geometry(), precision)
-
-                res = False
-                for predicate in predicates:
-                    if predicate == 'disjoint':
-                        if tmpGeom.intersects(geom):
-                            try:
-                                disjoinSet.remove(feat.id())
-                            except:
-                                pass  # already removed
-                    else:
-                        if predicate == 'intersects':
-                            res = tmpGeom.intersects(geom)
-                        elif predicate == 'contains':
-                            res = tmpGeom.contains(geom)
-                        elif predicate == 'equals':
-                            res = tmpGeom.equals(geom)
-                        elif predicate == 'touches':
-                            res = tmpGeom.touches(geom)
-                        elif predicate == 'overlaps':
-                            res = tmpGeom.overlaps(geom)
-                        elif predicate == 'within':
-                            res = tmpGeom.within(geom)
-                        elif predicate == 'crosses':
-                            res = tmpGeom.crosses(geom)
-                        if res:
-                            selectedSet.append(feat.id())
-                            break
+            engine.prepare(geom)
+
+            for feat in store.features(store.intersects(bbox)):
+                fid = feat.id()
+                tmpGeom = feat.geometry()
+                if disjoint and fid in disjoinSet and engine.intersects(tmpGeom):
+                    disjoinSet.remove(fid)
+                if fid not in selectedSet and engine.matches(tmpGeom):
+                    selectedSet.add(fid)
 
             current += 1
             progress.setPercentage(int(current * total))
 
-        if 'disjoint' in predicates:
-            selectedSet = selectedSet + disjoinSet
+        if disjoint:
+            selectedSet.update(disjoinSet)
 
         if method == 1:
-            selectedSet = list(oldSelection.union(selectedSet))
+            selectedSet = oldSelection.union(selectedSet)
         elif method == 2:
-            selectedSet = list(oldSelection.difference(selectedSet))
+            selectedSet = oldSelection.difference(selectedSet)
 
-        inputLayer.setSelectedFeatures(selectedSet)
+        inputLayer.setSelectedFeatures(list(selectedSet))
         self.setOutputValue(self.OUTPUT, filename)
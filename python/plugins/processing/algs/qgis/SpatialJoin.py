@@ -136,12 +136,8 @@ class SpatialJoin(GeoAlgorithm):
         inFeatB = QgsFeature()
         inGeom = QgsGeometry()
 
-        index = vector.spatialindex(join)
-
-        mapP2 = dict()
-        features = vector.features(join)
-        for f in features:
-            mapP2[f.id()] = QgsFeature(f)
+        store = vector.FeatureStore(join, precision=precision)
+        engine = vector.GeometryPredicates(predicates)
 
         features = vector.features(target)
         total = 100.0 / len(features)
@@ -156,33 +152,12 @@ class SpatialJoin(GeoAlgorithm):
             else:
                 bbox = inGeom.boundingBox()
             bufferedBox = vector.bufferedBoundingBox(bbox, 0.51 * precision)
-            joinList = index.intersects(bufferedBox)
+            joinList = store.intersects(bufferedBox)
             if len(joinList) > 0:
+                engine.prepare(inGeom)
                 count = 0
-                for i in joinList:
-                    inFeatB = mapP2[i]
-                    inGeomB = vector.snapToPrecision(inFeatB.geometry(), precision)
-
-                    res = False
-                    for predicate in predicates:
-                        if predicate == 'intersects':
-                            res = inGeom.intersects(inGeomB)
-                        elif predicate == 'contains':
-                            res = inGeom.contains(inGeomB)
-                        elif predicate == 'equals':
-                            res = inGeom.equals(inGeomB)
-                        elif predicate == 'touches':
-                            res = inGeom.touches(inGeomB)
-                        elif predicate == 'overlaps':
-                            res = inGeom.overlaps(inGeomB)
-                        elif predicate == 'within':
-                            res = inGeom.within(inGeomB)
-                        elif predicate == 'crosses':
-                            res = inGeom.crosses(inGeomB)
-                        if res:
-                            break
-
-                    if res:
+                for inFeatB in store.features(joinList):
+                    if engine.matches(inFeatB.geometry()):
                         count = count + 1
                         none = False
                         atMap2 = inFeatB.attributes()
@@ -64,13 +64,14 @@ class StatisticsByCategories(GeoAlgorithm):
         valuesField = layer.fieldNameIndex(valuesFieldName)
         categoriesField = layer.fieldNameIndex(categoriesFieldName)
 
-        features = vector.features(layer)
+        features = vector.features(layer, [valuesField, categoriesField],
+                                   geometry=False)
         nFeats = len(features)
         values = {}
         nFeat = 0
         for feat in features:
             nFeat += 1
-            progress.setPercentage(int(100 * nFeats / nFeat))
+            progress.setPercentage(int(100 * nFeat / nFeats))
             attrs = feat.attributes()
             try:
                 value = float(attrs[valuesField])
@@ -91,3 +92,4 @@ class StatisticsByCategories(GeoAlgorithm):
             stat.calculate(v)
             record = [cat, stat.min(), stat.max(), stat.mean(), stat.sampleStDev(), stat.sum(), stat.count()]
             writer.addRecord(record)
+        writer.close()
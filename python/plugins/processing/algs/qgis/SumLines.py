@@ -25,7 +25,7 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
-from qgis.core import QgsFeature, QgsGeometry, QgsFeatureRequest, QgsDistanceArea
+from qgis.core import QgsFeature, QgsGeometry, QgsDistanceArea
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterString
@@ -72,7 +72,7 @@ class SumLines(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(
             fieldList.toList(), polyProvider.geometryType(), polyProvider.crs())
 
-        spatialIndex = vector.spatialindex(lineLayer)
+        lineStore = vector.FeatureStore(lineLayer, [])
 
         ftLine = QgsFeature()
         ftPoly = QgsFeature()
@@ -91,14 +91,12 @@ class SumLines(GeoAlgorithm):
             count = 0
             length = 0
             hasIntersections = False
-            lines = spatialIndex.intersects(inGeom.boundingBox())
+            lines = lineStore.intersects(inGeom.boundingBox())
             if len(lines) > 0:
                 hasIntersections = True
 
             if hasIntersections:
-                for i in lines:
-                    request = QgsFeatureRequest().setFilterFid(i)
-                    ftLine = lineLayer.getFeatures(request).next()
+                for ftLine in lineStore.features(lines):
                     tmpGeom = QgsGeometry(ftLine.geometry())
                     if inGeom.intersects(tmpGeom):
                         outGeom = inGeom.intersection(tmpGeom)
@@ -25,7 +25,7 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
-from qgis.core import QGis, QgsFeatureRequest, QgsFeature, QgsGeometry, QgsWKBTypes
+from qgis.core import QGis, QgsFeature, QgsGeometry, QgsWKBTypes
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.ProcessingLog import ProcessingLog
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
@@ -55,8 +55,8 @@ class Union(GeoAlgorithm):
         inFeatA = QgsFeature()
         inFeatB = QgsFeature()
         outFeat = QgsFeature()
-        indexA = vector.spatialindex(vlayerB)
-        indexB = vector.spatialindex(vlayerA)
+        storeA = vector.FeatureStore(vlayerB)
+        storeB = vector.FeatureStore(vlayerA)
 
         count = 0
         nElement = 0
@@ -68,7 +68,7 @@ class Union(GeoAlgorithm):
             lstIntersectingB = []
             geom = QgsGeometry(inFeatA.geometry())
             atMapA = inFeatA.attributes()
-            intersects = indexA.intersects(geom.boundingBox())
+            intersects = storeA.intersects(geom.boundingBox())
             if len(intersects) < 1:
                 try:
                     outFeat.setGeometry(geom)
@@ -80,10 +80,8 @@ class Union(GeoAlgorithm):
                     raise GeoAlgorithmExecutionException(
                         self.tr('Feature exception while computing union'))
             else:
-                for id in intersects:
+                for inFeatB in storeA.features(intersects):
                     count += 1
-                    request = QgsFeatureRequest().setFilterFid(id)
-                    inFeatB = vlayerB.getFeatures(request).next()
                     atMapB = inFeatB.attributes()
                     tmpGeom = QgsGeometry(inFeatB.geometry())
 
@@ -147,7 +145,7 @@ class Union(GeoAlgorithm):
             diff_geom = QgsGeometry(geom)
             atMap = [None] * length
             atMap.extend(inFeatA.attributes())
-            intersects = indexB.intersects(geom.boundingBox())
+            intersects = storeB.intersects(geom.boundingBox())
 
             if len(intersects) < 1:
                 try:
@@ -158,9 +156,7 @@ class Union(GeoAlgorithm):
                     raise GeoAlgorithmExecutionException(
                         self.tr('Feature exception while computing union'))
             else:
-                for id in intersects:
-                    request = QgsFeatureRequest().setFilterFid(id)
-                    inFeatB = vlayerA.getFeatures(request).next()
+                for inFeatB in storeB.features(intersects):
                     atMapB = inFeatB.attributes()
                     tmpGeom = QgsGeometry(inFeatB.geometry())
                     try:
@@ -25,6 +25,7 @@ __copyright__ = '(C) 2013, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
+import numpy
 import matplotlib.pyplot as plt
 import matplotlib.pylab as lab
 
@@ -66,9 +67,9 @@ class VectorLayerHistogram(GeoAlgorithm):
 
         output = self.getOutputValue(self.OUTPUT)
 
-        values = vector.values(layer, fieldname)
+        values = vector.values(layer, fieldname, asNumpy=True)[fieldname]
         plt.close()
-        plt.hist(values[fieldname], bins)
+        plt.hist(values[~numpy.isnan(values)], bins)
         plotFilename = output + '.png'
         lab.savefig(plotFilename)
         f = open(output, 'w')
@@ -67,7 +67,7 @@ class VectorLayerScatterplot(GeoAlgorithm):
 
         output = self.getOutputValue(self.OUTPUT)
 
-        values = vector.values(layer, xfieldname, yfieldname)
+        values = vector.values(layer, xfieldname, yfieldname, asNumpy=True)
         plt.close()
         plt.scatter(values[xfieldname], values[yfieldname])
         plt.ylabel(yfieldname)
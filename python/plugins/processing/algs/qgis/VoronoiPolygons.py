@@ -25,9 +25,7 @@ __copyright__ = '(C) 2012, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
-from sets import Set
-
-from qgis.core import QGis, QgsFeatureRequest, QgsFeature, QgsGeometry, QgsPoint
+from qgis.core import QGis, QgsFeature, QgsGeometry, QgsPoint, QgsRectangle
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
@@ -35,6 +33,7 @@ from processing.core.parameters import ParameterVector
 from processing.core.parameters import ParameterNumber
 from processing.core.outputs import OutputVector
 import voronoi
+import triangulation
 from processing.tools import dataobjects, vector
 
 
@@ -63,59 +62,63 @@ class VoronoiPolygons(GeoAlgorithm):
         writer = self.getOutputFromName(self.OUTPUT).getVectorWriter(
             layer.pendingFields().toList(), QGis.WKBPolygon, layer.crs())
 
-        inFeat = QgsFeature()
         outFeat = QgsFeature()
         extent = layer.extent()
         extraX = extent.height() * (buf / 100.0)
         extraY = extent.width() * (buf / 100.0)
-        height = extent.height()
-        width = extent.width()
-        c = voronoi.Context()
+
+        # Attributes of the first feature at each distinct point are
+        # kept, so features don't have to be fetched again
         pts = []
-        ptDict = {}
-        ptNdx = -1
-
-        features = vector.features(layer)
-        for inFeat in features:
-            geom = QgsGeometry(inFeat.geometry())
-            point = geom.asPoint()
-            x = point.x() - extent.xMinimum()
-            y = point.y() - extent.yMinimum()
-            pts.append((x, y))
-            ptNdx += 1
-            ptDict[ptNdx] = inFeat.id()
-
-        if len(pts) < 3:
+        attributes = []
+        seen = set()
+        count = 0
+        for inFeat in vector.features(layer):
+            point = inFeat.geometry().asPoint()
+            xy = (point.x(), point.y())
+            count += 1
+            if xy not in seen:
+                seen.add(xy)
+                pts.append(xy)
+                attributes.append(inFeat.attributes())
+
+        if count < 3:
             raise GeoAlgorithmExecutionException(
                 self.tr('Input file should contain at least 3 points. Choose '
                         'another file and try again.'))
 
-        uniqueSet = Set(item for item in pts)
-        ids = [pts.index(item) for item in uniqueSet]
-        sl = voronoi.SiteList([voronoi.Site(i[0], i[1], sitenum=j) for (j,
-                              i) in enumerate(uniqueSet)])
-        voronoi.voronoi(sl, c)
-        inFeat = QgsFeature()
-
-        current = 0
-        total = 100.0 / float(len(c.polygons))
-
-        for (site, edges) in c.polygons.iteritems():
-            request = QgsFeatureRequest().setFilterFid(ptDict[ids[site]])
-            inFeat = layer.getFeatures(request).next()
-            lines = self.clip_voronoi(edges, c, width, height, extent, extraX, extraY)
+        clip = QgsRectangle(extent.xMinimum() - extraX,
+                            extent.yMinimum() - extraY,
+                            extent.xMaximum() + extraX,
+                            extent.yMaximum() + extraY)
+        cells = triangulation.voronoiCells(pts, clip)
+        if cells is None:
+            cells = self.sweepCells(pts, extent, extraX, extraY)
 
-            geom = QgsGeometry.fromMultiPoint(lines)
-            geom = QgsGeometry(geom.convexHull())
+        total = 100.0 / len(pts)
+        for current, (site, geom) in enumerate(cells):
             outFeat.setGeometry(geom)
-            outFeat.setAttributes(inFeat.attributes())
+            outFeat.setAttributes(attributes[site])
             writer.addFeature(outFeat)
-
-            current += 1
-            progress.setPercentage(int(current * total))
+            progress.setPercentage(int((current + 1) * total))
 
         del writer
 
+    def sweepCells(self, pts, extent, extraX, extraY):
+        """Yields (index, geometry) for the cell of each point, computed
+        with the pure Python sweep line in voronoi.py.
+        """
+        c = voronoi.Context()
+        sl = voronoi.SiteList([voronoi.Site(x - extent.xMinimum(),
+                                            y - extent.yMinimum())
+                               for (x, y) in pts])
+        voronoi.voronoi(sl, c)
+        for (site, edges) in c.polygons.iteritems():
+            lines = self.clip_voronoi(edges, c, extent.width(), extent.height(),
+                                      extent, extraX, extraY)
+            geom = QgsGeometry.fromMultiPoint(lines)
+            yield site, QgsGeometry(geom.convexHull())
+
     def clip_voronoi(self, edges, c, width, height, extent, exX, exY):
         """Clip voronoi function based on code written for Inkscape.
         Copyright (C) 2010 Alvin Penner, penner@vaxxine.com
@@ -43,7 +43,7 @@ from processing.core.parameters import ParameterString
 from processing.core.parameters import ParameterNumber
 from processing.core.parameters import ParameterBoolean
 from processing.core.outputs import OutputVector
-from processing.tools.raster import mapToPixel
+from processing.tools.raster import mapToPixel, zoneValues, ZoneRasterizer
 from processing.tools import dataobjects, vector
 
 
@@ -54,6 +54,7 @@ class ZonalStatistics(GeoAlgorithm):
     INPUT_VECTOR = 'INPUT_VECTOR'
     COLUMN_PREFIX = 'COLUMN_PREFIX'
     GLOBAL_EXTENT = 'GLOBAL_EXTENT'
+    SINGLE_PASS = 'SINGLE_PASS'
     OUTPUT_LAYER = 'OUTPUT_LAYER'
 
     def defineCharacteristics(self):
@@ -71,6 +72,9 @@ class ZonalStatistics(GeoAlgorithm):
                                           self.tr('Output column prefix'), '_'))
         self.addParameter(ParameterBoolean(self.GLOBAL_EXTENT,
                                            self.tr('Load whole raster in memory')))
+        self.addParameter(ParameterBoolean(self.SINGLE_PASS,
+                                           self.tr('Compute all zones in a single pass (zones must not overlap)'),
+                                           False))
         self.addOutput(OutputVector(self.OUTPUT_LAYER, self.tr('Zonal statistics')))
 
     def processAlgorithm(self, progress):
@@ -84,6 +88,7 @@ class ZonalStatistics(GeoAlgorithm):
         bandNumber = self.getParameterValue(self.RASTER_BAND)
         columnPrefix = self.getParameterValue(self.COLUMN_PREFIX)
         useGlobalExtent = self.getParameterValue(self.GLOBAL_EXTENT)
+        singlePass = self.getParameterValue(self.SINGLE_PASS)
 
         rasterDS = gdal.Open(rasterPath, gdal.GA_ReadOnly)
         geoTransform = rasterDS.GetGeoTransform()
@@ -165,6 +170,18 @@ class ZonalStatistics(GeoAlgorithm):
         outFeat.initAttributes(len(fields))
         outFeat.setFields(fields)
 
+        indices = [idxMin, idxMax, idxSum, idxCount, idxMean, idxStd,
+                   idxUnique, idxRange, idxVar, idxMedian]
+        if hasSciPy:
+            indices.append(idxMode)
+
+        if singlePass:
+            self.processSinglePass(layer, rasterDS, rasterBand, writer,
+                                   outFeat, indices, progress)
+            rasterDS = None
+            del writer
+            return
+
         current = 0
         features = vector.features(layer)
         total = 100.0 / len(features)
@@ -189,6 +206,10 @@ class ZonalStatistics(GeoAlgorithm):
                 height = endRow - startRow
 
                 if width == 0 or height == 0:
+                    self.writeZone(f, noStatistics(hasSciPy), writer,
+                                   outFeat, indices)
+                    current += 1
+                    progress.setPercentage(int(current * total))
                     continue
 
                 srcOffset = (startColumn, startRow, width, height)
@@ -225,6 +246,15 @@ class ZonalStatistics(GeoAlgorithm):
                                           mask=numpy.logical_or(srcArray == noData,
                                                                 numpy.logical_not(rasterizedArray)))
 
+            if masked.count() == 0:
+                self.writeZone(f, noStatistics(hasSciPy), writer, outFeat,
+                               indices)
+                memVDS = None
+                rasterizedDS = None
+                current += 1
+                progress.setPercentage(int(current * total))
+                continue
+
             outFeat.setGeometry(geom)
 
             attrs = f.attributes()
@@ -253,3 +283,130 @@ class ZonalStatistics(GeoAlgorithm):
         rasterDS = None
 
         del writer
+
+    def processSinglePass(self, layer, rasterDS, rasterBand, writer,
+                          outFeat, indices, progress):
+        """Burns all zones into one label raster per strip and computes
+        the statistics of every zone while streaming the band once.
+
+        The values of a zone are kept only until the last strip it
+        touches has been read, then its statistics are computed
+        together with all the other zones finishing in that strip.
+        """
+        rasterizer = ZoneRasterizer(rasterDS.GetGeoTransform(),
+                                    rasterDS.RasterXSize, rasterDS.RasterYSize)
+        zones = {}
+        for f in vector.features(layer):
+            zones[f.id()] = rasterizer.addZone(f.geometry())
+
+        stats = ZoneStatistics(rasterizer.zoneCount())
+        for labels, values in zoneValues(rasterizer, rasterBand, progress):
+            stats.update(labels, values)
+
+        for f in vector.features(layer):
+            self.writeZone(f, stats.attributes(zones[f.id()], hasSciPy),
+                           writer, outFeat, indices)
+
+    def writeZone(self, f, statistics, writer, outFeat, indices):
+        outFeat.setGeometry(f.geometry())
+        attrs = f.attributes()
+        for idx, value in zip(indices, statistics):
+            attrs.insert(idx, value)
+        outFeat.setAttributes(attrs)
+        writer.addFeature(outFeat)
+
+
+def noStatistics(withMode):
+    """Returns the statistics written for a zone without valid cells,
+    in the order of the output fields of the algorithm.
+    """
+    attrs = [None, None, None, 0, None, None, 0, None, None, None]
+    if withMode:
+        attrs.append(None)
+    return attrs
+
+
+class ZoneStatistics:
+
+    """Per-zone statistics arrays, indexed by zone label.
+
+    Zones without valid cells keep NULL statistics and a zero count.
+    """
+
+    def __init__(self, zoneCount):
+        size = zoneCount + 1
+        self.count = numpy.zeros(size, numpy.int64)
+        self.min = numpy.empty(size)
+        self.max = numpy.empty(size)
+        self.sum = numpy.empty(size)
+        self.mean = numpy.empty(size)
+        self.std = numpy.empty(size)
+        self.var = numpy.empty(size)
+        self.unique = numpy.zeros(size, numpy.int64)
+        self.median = numpy.empty(size)
+        self.mode = numpy.empty(size)
+
+    def update(self, labels, values):
+        """Computes the statistics of the zones present in labels,
+        using all their values at once.
+        """
+        order = numpy.lexsort((values, labels))
+        labels = labels[order]
+        values = values[order]
+
+        newZone = numpy.empty(labels.size, bool)
+        newZone[0] = True
+        newZone[1:] = labels[1:] != labels[:-1]
+        starts = numpy.flatnonzero(newZone)
+        counts = numpy.diff(numpy.append(starts, labels.size))
+        ends = starts + counts - 1
+        zones = labels[starts]
+
+        sums = numpy.add.reduceat(values, starts)
+        means = sums / counts
+        deviations = values - numpy.repeat(means, counts)
+        variances = numpy.add.reduceat(deviations * deviations, starts) / counts
+
+        middle = starts + (counts - 1) // 2
+        medians = numpy.where(counts % 2 == 1, values[middle],
+                              (values[middle] + values[numpy.minimum(middle + 1, ends)]) / 2.0)
+
+        newValue = newZone.copy()
+        newValue[1:] |= values[1:] != values[:-1]
+        runStarts = numpy.flatnonzero(newValue)
+        runLengths = numpy.diff(numpy.append(runStarts, labels.size))
+        runLabels = labels[runStarts]
+        runValues = values[runStarts]
+        # Longest run first, smallest value on ties, as scipy's mode does
+        runOrder = numpy.lexsort((runValues, -runLengths, runLabels))
+        firstRun = numpy.empty(runOrder.size, bool)
+        firstRun[0] = True
+        firstRun[1:] = runLabels[runOrder][1:] != runLabels[runOrder][:-1]
+
+        self.count[zones] = counts
+        self.min[zones] = values[starts]
+        self.max[zones] = values[ends]
+        self.sum[zones] = sums
+        self.mean[zones] = means
+        self.var[zones] = variances
+        self.std[zones] = numpy.sqrt(variances)
+        self.unique[zones] = numpy.add.reduceat(newValue.astype(numpy.int64), starts)
+        self.median[zones] = medians
+        self.mode[zones] = runValues[runOrder][firstRun]
+
+    def attributes(self, zone, withMode):
+        """Returns the statistics of a zone, in the order of the
+        output fields of the algorithm.
+        """
+        count = int(self.count[zone])
+        if count == 0:
+            return noStatistics(withMode)
+
+        attrs = [float(self.min[zone]), float(self.max[zone]),
+                 float(self.sum[zone]), count, float(self.mean[zone]),
+                 float(self.std[zone]), int(self.unique[zone]),
+                 float(self.max[zone]) - float(self.min[zone]),
+                 float(self.var[zone]), float(self.median[zone])]
+        if withMode:
+            attrs.append(float(self.mode[zone]))
+        return attrs
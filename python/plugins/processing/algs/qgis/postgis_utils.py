@@ -456,6 +456,25 @@ class GeoDB:
         self._exec_sql_and_commit(sql)
         return True
 
+    def copy_from(self, table, columns, stream, schema=None):
+        """Bulk load rows into a table using COPY.
+
+        'stream' is a file-like object with one tab-separated line per
+        row, in PostgreSQL COPY text format, with values in the order
+        of 'columns'.
+        """
+
+        table_name = self._table_name(schema, table)
+        sql = 'COPY %s (%s) FROM STDIN' % (
+            table_name, ', '.join(self._quote(c) for c in columns))
+        try:
+            c = self.con.cursor()
+            c.copy_expert(sql, stream)
+            self.con.commit()
+        except psycopg2.Error as e:
+            self.con.rollback()
+            raise DbError(e.message, sql)
+
     def delete_table(self, table, schema=None):
         """Delete table from the database."""
 
@@ -30,3 +30,4 @@ for i, feat in enumerate(feats):
 
 for c in counts:
     writer.addRecord(list(c) + [counts[c]])
+writer.close()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    triangulation.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2026 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2026, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+
+'''
+Delaunay triangulations and Voronoi diagrams of point sets, computed
+with Qhull through scipy.spatial when it is available and with the
+sweep line implementation in voronoi.py otherwise.
+'''
+import numpy
+
+try:
+    from scipy.spatial import Delaunay, Voronoi
+    hasSciPy = True
+except:
+    hasSciPy = False
+
+from qgis.core import QgsGeometry, QgsPoint
+
+import voronoi
+
+
+def uniquePoints(points):
+    """Returns the distinct (x, y) tuples of a list, in order of first
+    appearance, along with the index in the list of the first
+    occurrence of each of them.
+    """
+    unique = []
+    ids = []
+    seen = set()
+    for i, point in enumerate(points):
+        if point not in seen:
+            seen.add(point)
+            unique.append(point)
+            ids.append(i)
+    return unique, ids
+
+
+def delaunayTriangles(points):
+    """Returns the Delaunay triangles of a list of distinct (x, y)
+    tuples, as 3-tuples of indices in the list.
+    """
+    if hasSciPy:
+        try:
+            triangulation = Delaunay(numpy.array(points, dtype=numpy.float64))
+            return [tuple(t) for t in triangulation.simplices.tolist()]
+        except Exception:
+            # Qhull fails for degenerate inputs such as collinear
+            # points, which the sweep handles
+            pass
+    sites = [voronoi.Site(x, y) for x, y in points]
+    return voronoi.computeDelaunayTriangulation(sites)
+
+
+def voronoiCells(points, clip):
+    """Returns an iterator over (index, geometry) for the Voronoi cell
+    of each of the distinct (x, y) tuples in a list, clipped to the
+    given rectangle, or None if the cells cannot be computed with
+    scipy, so that the caller can fall back to the sweep line
+    implementation.
+    """
+    if not hasSciPy:
+        return None
+    # Four far away points surrounding all the others make every cell
+    # of the input points bounded, with the added bisectors well
+    # outside the clipping rectangle
+    cx = (clip.xMinimum() + clip.xMaximum()) / 2.0
+    cy = (clip.yMinimum() + clip.yMaximum()) / 2.0
+    radius = 4 * max(clip.width(), clip.height(), 1.0)
+    far = [(cx - radius, cy), (cx + radius, cy),
+           (cx, cy - radius), (cx, cy + radius)]
+    try:
+        diagram = Voronoi(numpy.array(points + far, dtype=numpy.float64))
+    except Exception:
+        return None
+    return _clippedCells(diagram, len(points), QgsGeometry.fromRect(clip))
+
+
+def _clippedCells(diagram, count, clipGeometry):
+    vertices = diagram.vertices
+    for i in xrange(count):
+        region = diagram.regions[diagram.point_region[i]]
+        # Cells are convex, so the hull of their vertices is the
+        # polygon, whatever order Qhull returns them in
+        cell = QgsGeometry.fromMultiPoint(
+            [QgsPoint(vertices[v][0], vertices[v][1]) for v in region])
+        cell = QgsGeometry(cell.convexHull())
+        yield i, cell.intersection(clipGeometry)
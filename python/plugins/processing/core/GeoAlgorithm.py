@@ -27,12 +27,12 @@ __copyright__ = '(C) 2012, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import os.path
+import time
 import traceback
-import subprocess
 import copy
 
 from PyQt4.QtGui import QIcon
-from PyQt4.QtCore import QCoreApplication, QSettings
+from PyQt4.QtCore import QCoreApplication
 from qgis.core import QGis, QgsRasterFileWriter
 
 from processing.core.ProcessingLog import ProcessingLog
@@ -41,7 +41,7 @@ from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecution
 from processing.core.parameters import ParameterRaster, ParameterVector, ParameterMultipleInput, ParameterTable, Parameter
 from processing.core.outputs import OutputVector, OutputRaster, OutputTable, OutputHTML, Output
 from processing.algs.gdal.GdalUtils import GdalUtils
-from processing.tools import dataobjects, vector
+from processing.tools import dataobjects, vector, profiling
 from processing.tools.system import setTempOutput
 from processing.algs.help import shortHelp
 
@@ -86,6 +86,16 @@ class GeoAlgorithm:
         # when running as part of a model
         self.model = None
 
+        # Set to True to profile executions of the algorithm even if
+        # profiling is not enabled in the configuration. The profile of
+        # the last execution is then stored in profileResults
+        self.profiling = False
+        self.profileResults = None
+
+        # Seconds spent converting outputs to their final format in
+        # the last execution
+        self.conversionTime = 0.0
+
         self.defineCharacteristics()
 
     def getCopy(self):
@@ -195,16 +205,32 @@ class GeoAlgorithm:
         wrong.
         """
         self.model = model
+        profile = None
+        if self.profiling or ProcessingConfig.getSetting(ProcessingConfig.PROFILE_ALGORITHMS):
+            profile = profiling.Profile().start()
         try:
-            self.setOutputCRS()
-            self.resolveTemporaryOutputs()
-            self.resolveDataObjects()
-            self.checkOutputFileExtensions()
-            self.runPreExecutionScript(progress)
-            self.processAlgorithm(progress)
+            with profiling.phase(profile, 'setOutputCRS'):
+                self.setOutputCRS()
+            with profiling.phase(profile, 'resolveTemporaryOutputs'):
+                self.resolveTemporaryOutputs()
+            with profiling.phase(profile, 'resolveDataObjects'):
+                self.resolveDataObjects()
+            with profiling.phase(profile, 'checkOutputFileExtensions'):
+                self.checkOutputFileExtensions()
+            self.releaseOutputLayers()
+            with profiling.phase(profile, 'preExecutionScript'):
+                self.runPreExecutionScript(progress)
+            with profiling.phase(profile, 'processAlgorithm'):
+                with vector.WriterScope() as writers:
+                    self.processAlgorithm(progress)
+                    # Writers the algorithm did not close are closed
+                    # here, so that errors are not lost in __del__
+                    writers.close()
             progress.setPercentage(100)
-            self.convertUnsupportedFormats(progress)
-            self.runPostExecutionScript(progress)
+            with profiling.phase(profile, 'convertUnsupportedFormats'):
+                self.convertUnsupportedFormats(progress)
+            with profiling.phase(profile, 'postExecutionScript'):
+                self.runPostExecutionScript(progress)
         except GeoAlgorithmExecutionException as gaee:
             ProcessingLog.addToLog(ProcessingLog.LOG_ERROR, gaee.msg)
             raise gaee
@@ -216,6 +242,12 @@ class GeoAlgorithm:
             ProcessingLog.addToLog(ProcessingLog.LOG_ERROR, lines)
             raise GeoAlgorithmExecutionException(
                 unicode(e) + self.tr('\nSee log for more details'))
+        finally:
+            if profile is not None:
+                profile.stop()
+                self.profileResults = profile.asDict()
+                ProcessingLog.addToLog(ProcessingLog.LOG_INFO,
+                                       self.tr('Profile of %s:\n%s') % (self.name, profile.summary()))
 
     def _checkParameterValuesBeforeExecuting(self):
         for param in self.parameters:
@@ -260,61 +292,83 @@ class GeoAlgorithm:
             pass
 
     def convertUnsupportedFormats(self, progress):
-        i = 0
+        """Writes to their final format the outputs that the algorithm
+        has created in a different format it supports (see
+        getCompatibleFileName), and stores the time it takes in
+        conversionTime.
+        """
+        self.conversionTime = 0.0
+        outputs = [out for out in self.outputs
+                   if getattr(out, 'compatible', None) is not None]
+        if not outputs:
+            return
         progress.setText(self.tr('Converting outputs'))
-        for out in self.outputs:
-            if isinstance(out, OutputVector):
-                if out.compatible is not None:
-                    layer = dataobjects.getObjectFromUri(out.compatible)
-                    if layer is None:
-                        # For the case of memory layer, if the
-                        # getCompatible method has been called
-                        continue
-                    provider = layer.dataProvider()
-                    writer = out.getVectorWriter(
-                        provider.fields(),
-                        provider.geometryType(), layer.crs()
-                    )
-                    features = vector.features(layer)
-                    for feature in features:
-                        writer.addFeature(feature)
-            elif isinstance(out, OutputRaster):
-                if out.compatible is not None:
-                    layer = dataobjects.getObjectFromUri(out.compatible)
-                    format = self.getFormatShortNameFromFilename(out.value)
-                    orgFile = out.compatible
-                    destFile = out.value
-                    crsid = layer.crs().authid()
-                    settings = QSettings()
-                    path = unicode(settings.value('/GdalTools/gdalPath', ''))
-                    envval = unicode(os.getenv('PATH'))
-                    if not path.lower() in envval.lower().split(os.pathsep):
-                        envval += '%s%s' % (os.pathsep, path)
-                        os.putenv('PATH', envval)
-                    command = 'gdal_translate -of %s -a_srs %s %s %s' % (format, crsid, orgFile, destFile)
-                    if os.name == 'nt':
-                        command = command.split(" ")
-                    else:
-                        command = [command]
-                    proc = subprocess.Popen(
-                        command,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stdin=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        universal_newlines=False,
-                    )
-                    proc.communicate()
-
-            elif isinstance(out, OutputTable):
-                if out.compatible is not None:
-                    layer = dataobjects.getObjectFromUri(out.compatible)
-                    provider = layer.dataProvider()
-                    writer = out.getTableWriter(provider.fields())
-                    features = vector.features(layer)
-                    for feature in features:
-                        writer.addRecord(feature)
-            progress.setPercentage(100 * i / float(len(self.outputs)))
+        for out in outputs:
+            start = time.time()
+            with profiling.phase(profiling.active(), 'convert %s' % out.name):
+                converted = self.convertOutput(out, progress)
+            if converted:
+                elapsed = time.time() - start
+                self.conversionTime += elapsed
+                progress.setInfo(self.tr('Output %s converted in %0.2f seconds')
+                                 % (out.name, elapsed))
+
+    def convertOutput(self, out, progress):
+        """Copies out.compatible to out.value, renaming the files when
+        both have the same format, and otherwise converting them in a
+        single bulk operation when GDAL allows it.
+
+        Returns False if there was nothing to convert.
+        """
+        source = out.compatible
+        destination = out.value
+        if isinstance(out, OutputVector):
+            driverName = vector.ogrDriverName(destination)
+            if driverName is not None and os.path.isfile(source):
+                if driverName == vector.ogrDriverName(source):
+                    GdalUtils.moveDataset(source, destination)
+                    return True
+                options = []
+                if driverName == 'ESRI Shapefile' and out.encoding \
+                        and out.encoding != 'System':
+                    options.append('ENCODING=%s' % out.encoding)
+                if GdalUtils.translateVector(source, destination, driverName,
+                                             options, progress):
+                    return True
+            layer = dataobjects.getObjectFromUri(source)
+            if layer is None:
+                # For the case of memory layer, if the
+                # getCompatible method has been called
+                return False
+            provider = layer.dataProvider()
+            writer = out.getVectorWriter(
+                provider.fields(),
+                provider.geometryType(), layer.crs()
+            )
+            for feature in vector.features(layer):
+                writer.addFeature(feature)
+            del writer
+        elif isinstance(out, OutputRaster):
+            driverName = self.getFormatShortNameFromFilename(destination)
+            if driverName == self.getFormatShortNameFromFilename(source):
+                GdalUtils.moveDataset(source, destination)
+                return True
+            layer = dataobjects.getObjectFromUri(source)
+            srs = layer.crs().authid() if layer is not None else None
+            GdalUtils.translateRaster(source, destination, driverName,
+                                      srs or None, progress)
+        elif isinstance(out, OutputTable):
+            if os.path.splitext(source)[1] == os.path.splitext(destination)[1]:
+                GdalUtils.moveDataset(source, destination)
+                return True
+            layer = dataobjects.getObjectFromUri(source)
+            provider = layer.dataProvider()
+            with out.getTableWriter(provider.fields()) as writer:
+                for feature in vector.features(layer):
+                    writer.addRecord(feature)
+        else:
+            return False
+        return True
 
     def getFormatShortNameFromFilename(self, filename):
         ext = filename[filename.rfind('.') + 1:]
@@ -325,6 +379,15 @@ class GeoAlgorithm:
                 return name
         return 'GTiff'
 
+    def releaseOutputLayers(self):
+        """Removes the layers at the output paths from the cache of
+        layers opened by dataobjects.getObjectFromUri, as they are
+        about to be overwritten.
+        """
+        for out in self.outputs:
+            if isinstance(out.value, basestring) and out.value:
+                dataobjects.releaseLoadedLayer(out.value)
+
     def checkOutputFileExtensions(self):
         """Checks if the values of outputs are correct and have one of
         the supported output extensions.
@@ -343,6 +406,9 @@ class GeoAlgorithm:
                     exts = \
                         dataobjects.getSupportedOutputVectorLayerExtensions()
                 elif isinstance(out, OutputTable):
+                    if out.value.lower().endswith('.csv.gz'):
+                        # Compressed CSV, handled by TableWriter
+                        continue
                     exts = dataobjects.getSupportedOutputTableExtensions()
                 elif isinstance(out, OutputHTML):
                     exts = ['html', 'htm']
@@ -365,7 +431,6 @@ class GeoAlgorithm:
                 setTempOutput(out, self)
 
     def setOutputCRS(self):
-        layers = dataobjects.getAllLayers()
         for param in self.parameters:
             if isinstance(param, (ParameterRaster, ParameterVector, ParameterMultipleInput)):
                 if param.value:
@@ -374,10 +439,6 @@ class GeoAlgorithm:
                     else:
                         inputlayers = [param.value]
                     for inputlayer in inputlayers:
-                        for layer in layers:
-                            if layer.source() == inputlayer:
-                                self.crs = layer.crs()
-                                return
                         p = dataobjects.getObjectFromUri(inputlayer)
                         if p is not None:
                             self.crs = p.crs()
@@ -390,7 +451,6 @@ class GeoAlgorithm:
             pass
 
     def resolveDataObjects(self):
-        layers = dataobjects.getAllLayers()
         for param in self.parameters:
             if isinstance(param, (ParameterRaster, ParameterVector, ParameterTable,
                                   ParameterMultipleInput)):
@@ -400,10 +460,9 @@ class GeoAlgorithm:
                     else:
                         inputlayers = [param.value]
                     for i, inputlayer in enumerate(inputlayers):
-                        for layer in layers:
-                            if layer.name() == inputlayer:
-                                inputlayers[i] = layer.source()
-                                break
+                        layer = dataobjects.getObjectFromName(inputlayer)
+                        if layer is not None:
+                            inputlayers[i] = layer.source()
                     param.setValue(";".join(inputlayers))
 
     def checkInputCRS(self):
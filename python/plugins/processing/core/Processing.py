@@ -26,6 +26,7 @@ __copyright__ = '(C) 2012, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import sys
+from collections import defaultdict
 
 from PyQt4.QtCore import Qt, QCoreApplication
 from PyQt4.QtGui import QApplication, QCursor
@@ -58,15 +59,125 @@ from processing.algs.taudem.TauDEMAlgorithmProvider import TauDEMAlgorithmProvid
 from processing.tools import dataobjects
 
 
+class ProviderAlgorithms(dict):
+
+    """Dictionary of algorithms in which keys are names of providers
+    and values are dictionaries with the algorithms of each provider,
+    keyed by command line name.
+
+    Providers are registered by name only, and their algorithms are
+    loaded (which for some providers means parsing hundreds of
+    description files) the first time they are accessed.
+    """
+
+    def __init__(self, loader):
+        dict.__init__(self)
+        self.loader = loader
+
+    def register(self, providerName):
+        dict.__setitem__(self, providerName, None)
+
+    def isLoaded(self, providerName):
+        return dict.get(self, providerName) is not None
+
+    def __getitem__(self, providerName):
+        algs = dict.__getitem__(self, providerName)
+        if algs is None:
+            # Set before loading, in case the provider looks up its
+            # own algorithms while loading them
+            dict.__setitem__(self, providerName, {})
+            algs = self.loader(providerName)
+            dict.__setitem__(self, providerName, algs)
+        return algs
+
+    def get(self, providerName, default=None):
+        if providerName in self:
+            return self[providerName]
+        return default
+
+    def values(self):
+        return [self[name] for name in self.keys()]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+
+class AlgorithmSearchIndex:
+
+    """Case-insensitive substring search over the names, command line
+    names and short help of algorithms.
+
+    Texts are indexed by their trigrams, so a query is only checked
+    against the algorithms that contain all of its trigrams. Queries
+    that extend the previous one (as when typing in a search box) only
+    check the previous results.
+    """
+
+    def __init__(self):
+        # Command line name -> lower case text to search in
+        self.texts = {}
+        self.trigrams = defaultdict(set)
+        self.lastQuery = None
+        self.lastResults = None
+
+    def add(self, alg):
+        name = alg.commandLineName()
+        texts = [AlgorithmClassification.getDisplayName(alg), alg.name,
+                 name, alg.shortHelp()]
+        text = '\n'.join(t.lower() for t in texts if t)
+        self.texts[name] = text
+        for i in xrange(len(text) - 2):
+            self.trigrams[text[i:i + 3]].add(name)
+        self.lastQuery = None
+
+    def search(self, query):
+        """Returns the set of command line names of the algorithms
+        matching the query.
+        """
+        query = query.lower()
+        if self.lastQuery is not None and query.startswith(self.lastQuery):
+            candidates = self.lastResults
+        elif len(query) < 3:
+            candidates = self.texts.keys()
+        else:
+            sets = sorted((self.trigrams.get(query[i:i + 3], set())
+                           for i in xrange(len(query) - 2)), key=len)
+            candidates = sets[0].intersection(*sets[1:])
+        results = set(name for name in candidates if query in self.texts[name])
+        self.lastQuery = query
+        self.lastResults = results
+        return results
+
+
 class Processing:
 
     listeners = []
     providers = []
 
     # A dictionary of algorithms. Keys are names of providers
-    # and values are list with all algorithms from that provider
+    # and values are dicts with all algorithms from that provider,
+    # loaded when first accessed
     algs = {}
 
+    # Algorithms of the loaded providers indexed by command line name
+    # and by name. The first algorithm loaded wins if several share
+    # the same name
+    algsByCommandLineName = {}
+    algsByName = {}
+
+    # AlgorithmSearchIndex with all algorithms, created on first search
+    searchIndex = None
+
+    # Providers whose name is not the prefix of the command line name
+    # of their algorithms
+    COMMAND_LINE_PREFIXES = {'grass7': 'grass70', 'modeler': 'model'}
+
     # Same structure as algs
     actions = {}
 
@@ -167,9 +278,11 @@ class Processing:
 
     @staticmethod
     def updateProviders():
-        providers = [p for p in Processing.providers if p.getName() != "model"]
-        for provider in providers:
-            provider.loadAlgorithms()
+        """Loads the algorithms of all the providers that have not
+        been loaded yet.
+        """
+        for providerName in Processing.algs.keys():
+            Processing.algs[providerName]
 
     @staticmethod
     def addAlgListListener(listener):
@@ -195,29 +308,44 @@ class Processing:
 
     @staticmethod
     def loadAlgorithms():
-        Processing.algs = {}
-        Processing.updateProviders()
-        providers = [p for p in Processing.providers if p.getName() != "model"]
-        for provider in providers:
-            providerAlgs = provider.algs
-            algs = {}
-            for alg in providerAlgs:
-                algs[alg.commandLineName()] = alg
-            Processing.algs[provider.getName()] = algs
-
+        """Registers the providers, whose algorithms are loaded when
+        they are first needed. Use updateProviders() to load all of
+        them at once.
+        """
+        Processing.algs = ProviderAlgorithms(Processing.loadProviderAlgorithms)
+        Processing.algsByCommandLineName = {}
+        Processing.algsByName = {}
+        Processing.searchIndex = None
         provs = {}
         for provider in Processing.providers:
             provs[provider.getName()] = provider
+            Processing.algs.register(provider.getName())
+        Processing.algs.register(Processing.modeler.getName())
 
         ModelerUtils.allAlgs = Processing.algs
         ModelerUtils.providers = provs
 
-        Processing.modeler.loadAlgorithms()
-
+    @staticmethod
+    def loadProviderAlgorithms(providerName):
+        """Loads the algorithms of a provider, returning them in a
+        dict keyed by command line name.
+        """
+        provider = Processing.getProviderFromName(providerName)
+        try:
+            provider.loadAlgorithms()
+        except:
+            ProcessingLog.addToLog(
+                ProcessingLog.LOG_ERROR,
+                Processing.tr('Could not load algorithms from provider: %s\n%s')
+                % (provider.getDescription(), unicode(sys.exc_info()[1])))
+            return {}
         algs = {}
-        for alg in Processing.modeler.algs:
-            algs[alg.commandLineName()] = alg
-        Processing.algs[Processing.modeler.getName()] = algs
+        for alg in provider.algs:
+            name = alg.commandLineName()
+            algs[name] = alg
+            Processing.algsByCommandLineName.setdefault(name, alg)
+            Processing.algsByName.setdefault(alg.name, alg)
+        return algs
 
     @staticmethod
     def loadActions():
@@ -240,18 +368,41 @@ class Processing:
 
     @staticmethod
     def getAlgorithm(name):
-        for provider in Processing.algs.values():
-            if name in provider:
-                return provider[name]
-        return None
+        alg = Processing.algsByCommandLineName.get(name)
+        if alg is None:
+            # Command line names start with the name of the provider,
+            # so usually only that provider has to be loaded
+            prefix = name.split(':')[0]
+            providerName = Processing.COMMAND_LINE_PREFIXES.get(prefix, prefix)
+            if providerName in Processing.algs:
+                Processing.algs[providerName]
+                alg = Processing.algsByCommandLineName.get(name)
+        if alg is None:
+            Processing.updateProviders()
+            alg = Processing.algsByCommandLineName.get(name)
+        return alg
 
     @staticmethod
     def getAlgorithmFromFullName(name):
-        for provider in Processing.algs.values():
-            for alg in provider.values():
-                if alg.name == name:
-                    return alg
-        return None
+        alg = Processing.algsByName.get(name)
+        if alg is None:
+            Processing.updateProviders()
+            alg = Processing.algsByName.get(name)
+        return alg
+
+    @staticmethod
+    def searchAlgorithms(text):
+        """Returns the set of command line names of the algorithms
+        whose name, command line name or short help contain the given
+        text, ignoring case.
+        """
+        if Processing.searchIndex is None:
+            Processing.updateProviders()
+            index = AlgorithmSearchIndex()
+            for alg in Processing.algsByCommandLineName.itervalues():
+                index.add(alg)
+            Processing.searchIndex = index
+        return Processing.searchIndex.search(text)
 
     @staticmethod
     def getObject(uri):
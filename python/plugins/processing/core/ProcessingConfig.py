@@ -52,6 +52,9 @@ class ProcessingConfig:
     WARN_UNMATCHING_CRS = 'WARN_UNMATCHING_CRS'
     DEFAULT_OUTPUT_RASTER_LAYER_EXT = 'DEFAULT_OUTPUT_RASTER_LAYER_EXT'
     DEFAULT_OUTPUT_VECTOR_LAYER_EXT = 'DEFAULT_OUTPUT_VECTOR_LAYER_EXT'
+    MAX_WORKER_PROCESSES = 'MAX_WORKER_PROCESSES'
+    STRUCTURED_LOG = 'STRUCTURED_LOG'
+    PROFILE_ALGORITHMS = 'PROFILE_ALGORITHMS'
 
     settings = {}
     settingIcons = {}
@@ -123,6 +126,18 @@ class ProcessingConfig:
             ProcessingConfig.POST_EXECUTION_SCRIPT,
             ProcessingConfig.tr('Post-execution script'), '',
             valuetype=Setting.FILE))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.MAX_WORKER_PROCESSES,
+            ProcessingConfig.tr('Maximum number of worker processes (1 to disable parallel execution)'), 1))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.STRUCTURED_LOG,
+            ProcessingConfig.tr('Log executed algorithms with parameters and timings (JSON lines)'), False))
+        ProcessingConfig.addSetting(Setting(
+            ProcessingConfig.tr('General'),
+            ProcessingConfig.PROFILE_ALGORITHMS,
+            ProcessingConfig.tr('Profile algorithm executions'), False))
         ProcessingConfig.addSetting(Setting(
             ProcessingConfig.tr('General'),
             ProcessingConfig.RECENT_ALGORITHMS,
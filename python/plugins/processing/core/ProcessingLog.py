@@ -27,13 +27,101 @@ __revision__ = '$Format:%H$'
 
 import re
 import os
+import json
+import time
+import atexit
 import codecs
 import datetime
-from processing.tools.system import userFolder
+from collections import deque
+from processing.tools.system import userFolder, peakMemory
 from processing.core.ProcessingConfig import ProcessingConfig
 from qgis.core import *
 
 
+class LogFile:
+
+    """An append-only log file that is kept open between writes.
+
+    Writes are buffered and flushed at most every FLUSH_INTERVAL
+    seconds, before the file is read and at exit. Once the file grows
+    beyond maxSize bytes it is rotated, keeping BACKUPS older files
+    (with .1, .2... appended to their names).
+    """
+
+    BUFFER_SIZE = 64 * 1024
+    FLUSH_INTERVAL = 5
+    BACKUPS = 3
+
+    def __init__(self, filename, maxSize):
+        self.filename = filename
+        self.maxSize = maxSize
+        self.file = None
+        self.lastFlush = time.time()
+
+    def write(self, text):
+        if self.file is None:
+            self.file = codecs.open(self.filename, 'a', encoding='utf-8',
+                                    buffering=self.BUFFER_SIZE)
+        self.file.write(text)
+        if time.time() - self.lastFlush > self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.lastFlush = time.time()
+        if self.file is not None:
+            self.file.flush()
+            if self.file.tell() > self.maxSize:
+                self.rotate()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def rotate(self):
+        self.close()
+        for i in xrange(self.BACKUPS, 0, -1):
+            older = '%s.%d' % (self.filename, i)
+            newer = '%s.%d' % (self.filename, i - 1) if i > 1 else self.filename
+            if os.path.isfile(newer):
+                if os.path.isfile(older):
+                    os.remove(older)
+                os.rename(newer, older)
+
+    def remove(self):
+        self.close()
+        if os.path.isfile(self.filename):
+            os.unlink(self.filename)
+
+
+class PendingLog:
+
+    """Keeps the lines written to a log in memory. Worker processes
+    use it instead of a LogFile, and send the lines to the process
+    that owns the log files.
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def remove(self):
+        self.lines = []
+
+    def take(self):
+        lines = self.lines
+        self.lines = []
+        return lines
+
+
 class ProcessingLog:
 
     LOG_ERROR = 'ERROR'
@@ -41,26 +129,72 @@ class ProcessingLog:
     LOG_WARNING = 'WARNING'
     LOG_ALGORITHM = 'ALGORITHM'
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+    MAX_LOG_SIZE = 10 * 1024 * 1024
+    RECENT_ALGORITHMS_COUNT = 6
     recentAlgs = []
+    _log = None
+    _records = None
 
     @staticmethod
     def startLogging():
-        if os.path.isfile(ProcessingLog.logFilename()):
-            logfile = codecs.open(ProcessingLog.logFilename(), 'a',
-                                  encoding='utf-8')
-        else:
-            logfile = codecs.open(ProcessingLog.logFilename(), 'w',
-                                  encoding='utf-8')
-        logfile.write('Started logging at ' +
-                      datetime.datetime.now().strftime(
-                          ProcessingLog.DATE_FORMAT) + '\n')
-        logfile.close()
+        ProcessingLog.log().write('Started logging at ' +
+                                  datetime.datetime.now().strftime(
+                                      ProcessingLog.DATE_FORMAT) + '\n')
+        ProcessingLog.log().flush()
 
     @staticmethod
     def logFilename():
         batchfile = userFolder() + os.sep + 'processing.log'
         return batchfile
 
+    @staticmethod
+    def recordsFilename():
+        return userFolder() + os.sep + 'processing.jsonl'
+
+    @staticmethod
+    def log():
+        if ProcessingLog._log is None:
+            ProcessingLog._log = LogFile(ProcessingLog.logFilename(),
+                                         ProcessingLog.MAX_LOG_SIZE)
+        return ProcessingLog._log
+
+    @staticmethod
+    def records():
+        if ProcessingLog._records is None:
+            ProcessingLog._records = LogFile(ProcessingLog.recordsFilename(),
+                                             ProcessingLog.MAX_LOG_SIZE)
+        return ProcessingLog._records
+
+    @staticmethod
+    def flush():
+        for logfile in (ProcessingLog._log, ProcessingLog._records):
+            if logfile is not None:
+                logfile.flush()
+
+    @staticmethod
+    def keepPending():
+        """Keeps log entries and records in memory instead of writing
+        them to the log files, until they are taken with takePending().
+        Entries not yet written by this process are discarded.
+        """
+        ProcessingLog._log = PendingLog()
+        ProcessingLog._records = PendingLog()
+
+    @staticmethod
+    def takePending():
+        return ProcessingLog._log.take(), ProcessingLog._records.take()
+
+    @staticmethod
+    def writePending(pending):
+        """Writes the entries and records returned by takePending() in
+        another process.
+        """
+        logLines, recordLines = pending
+        for line in logLines:
+            ProcessingLog.log().write(line)
+        for line in recordLines:
+            ProcessingLog.records().write(line)
+
     @staticmethod
     def addToLog(msgtype, msg):
         try:
@@ -72,18 +206,10 @@ class ProcessingLog:
                 line = msgtype + '|' + datetime.datetime.now().strftime(
                     ProcessingLog.DATE_FORMAT) + '|' \
                     + msg + '\n'
-                logfile = codecs.open(ProcessingLog.logFilename(), 'a',
-                                      encoding='utf-8')
-                logfile.write(line)
-                logfile.close()
+                ProcessingLog.log().write(line)
                 algname = msg[len('Processing.runalg("'):]
                 algname = algname[:algname.index('"')]
-                if algname not in ProcessingLog.recentAlgs:
-                    ProcessingLog.recentAlgs.append(algname)
-                    recentAlgsString = ';'.join(ProcessingLog.recentAlgs[-6:])
-                    ProcessingConfig.setSettingValue(
-                        ProcessingConfig.RECENT_ALGORITHMS,
-                        recentAlgsString)
+                ProcessingLog.addRecentAlgorithm(algname)
             else:
                 if isinstance(msg, list):
                     msg = '\n'.join([m for m in msg])
@@ -94,8 +220,74 @@ class ProcessingLog:
         except:
             pass
 
+    @staticmethod
+    def addRecentAlgorithm(algname):
+        """Moves an algorithm to the end of the list of recently
+        executed ones. The setting is only saved if the list of the
+        last RECENT_ALGORITHMS_COUNT algorithms changes.
+        """
+        recent = ProcessingLog.recentAlgs
+        last = recent[-ProcessingLog.RECENT_ALGORITHMS_COUNT:]
+        if algname in recent:
+            recent.remove(algname)
+        recent.append(algname)
+        del recent[:-ProcessingLog.RECENT_ALGORITHMS_COUNT]
+        if recent != last:
+            ProcessingConfig.setSettingValue(
+                ProcessingConfig.RECENT_ALGORITHMS, ';'.join(recent))
+
+    @staticmethod
+    def addAlgorithmRecord(alg, wallTime, executed, **extra):
+        """Adds a JSON line describing an execution of an algorithm to
+        the structured log, if it is enabled in the configuration.
+        Additional items can be passed as keyword arguments.
+        """
+        if not ProcessingConfig.getSetting(ProcessingConfig.STRUCTURED_LOG):
+            return
+        try:
+            record = {
+                'date': datetime.datetime.now().strftime(ProcessingLog.DATE_FORMAT),
+                'algorithm': alg.commandLineName(),
+                'parameters': dict((param.name, param.value) for param in alg.parameters),
+                'outputs': dict((out.name, out.value) for out in alg.outputs),
+                'command': alg.getAsCommand(),
+                'executed': executed,
+                'wallTime': round(wallTime, 3),
+                'peakMemory': peakMemory(),
+            }
+            record.update(extra)
+            ProcessingLog.records().write(json.dumps(record, default=unicode) + '\n')
+        except:
+            # As in addToLog, logging must not break the algorithm
+            pass
+
+    @staticmethod
+    def getAlgorithmRecords(algorithm=None, limit=200):
+        """Returns the last records (as dicts) in the structured log,
+        oldest first, optionally only those of the algorithm with the
+        given command line name.
+        """
+        ProcessingLog.flush()
+        records = deque(maxlen=limit)
+        filename = ProcessingLog.recordsFilename()
+        if not os.path.isfile(filename):
+            return []
+        if algorithm is not None:
+            key = '"algorithm": %s' % json.dumps(algorithm)
+        with codecs.open(filename, encoding='utf-8') as f:
+            for line in f:
+                # Cheap test before parsing the line
+                if algorithm is not None and key not in line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+        return list(records)
+
     @staticmethod
     def getLogEntries():
+        ProcessingLog.flush()
         entries = {}
         errors = []
         algorithms = []
@@ -117,22 +309,48 @@ class ProcessingLog:
             elif line.startswith(ProcessingLog.LOG_INFO):
                 info.append(LogEntry(tokens[1], text))
 
+        if ProcessingConfig.getSetting(ProcessingConfig.STRUCTURED_LOG):
+            ProcessingLog.matchRecords(algorithms)
         entries[ProcessingLog.LOG_ALGORITHM] = algorithms
+        for category, categoryEntries in ((ProcessingLog.LOG_ERROR, errors),
+                                          (ProcessingLog.LOG_WARNING, warnings),
+                                          (ProcessingLog.LOG_INFO, info)):
+            if categoryEntries:
+                entries[category] = categoryEntries
         return entries
 
+    @staticmethod
+    def matchRecords(entries):
+        """Attaches to each algorithm entry of the text log the first
+        record of the structured log with the same command that was
+        added after it. Records of batch rows and iterations, which
+        have no entry of their own, are left out.
+        """
+        pending = {}
+        for record in ProcessingLog.getAlgorithmRecords():
+            if record.get('command'):
+                pending.setdefault(record['command'], deque()).append(record)
+        for entry in entries:
+            records = pending.get(entry.text)
+            while records and records[0]['date'] < entry.date:
+                records.popleft()
+            if records:
+                entry.record = records.popleft()
+
     @staticmethod
     def getRecentAlgorithms():
         recentAlgsSetting = ProcessingConfig.getSetting(
             ProcessingConfig.RECENT_ALGORITHMS)
         try:
-            ProcessingLog.recentAlgs = recentAlgsSetting.split(';')
+            ProcessingLog.recentAlgs = [name for name in recentAlgsSetting.split(';') if name]
         except:
             pass
         return ProcessingLog.recentAlgs
 
     @staticmethod
     def clearLog():
-        os.unlink(ProcessingLog.logFilename())
+        ProcessingLog.log().remove()
+        ProcessingLog.records().remove()
         ProcessingLog.startLogging()
 
     @staticmethod
@@ -144,11 +362,15 @@ class ProcessingLog:
                     f.write('%s|%s|%s\n' % (k, entry.date, entry.text))
 
 
+atexit.register(ProcessingLog.flush)
+
+
 class LogEntry:
 
-    def __init__(self, date, text):
+    def __init__(self, date, text, record=None):
         self.date = date
         self.text = text
+        self.record = record
 
 """
 ***************************************************************************
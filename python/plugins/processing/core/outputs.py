@@ -200,7 +200,7 @@ class OutputTable(Output):
     compatible = None
 
     def getFileFilter(self, alg):
-        exts = ['csv']
+        exts = ['csv', 'csv.gz']
         for i in range(len(exts)):
             exts[i] = exts[i].upper() + ' files(*.' + exts[i].lower() + ')'
         return ';;'.join(exts)
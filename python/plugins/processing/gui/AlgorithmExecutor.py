@@ -26,17 +26,28 @@ __copyright__ = '(C) 2012, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import sys
+import time
+import uuid
+from multiprocessing import TimeoutError
 
+from osgeo import gdal
 from PyQt4.QtCore import QSettings, QCoreApplication
-from qgis.core import QgsFeature, QgsVectorFileWriter
+from qgis.core import QgsFeatureRequest, QgsVectorFileWriter, QgsVectorLayer
+from processing.core.ProcessingConfig import ProcessingConfig
 from processing.core.ProcessingLog import ProcessingLog
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.gui.Postprocessing import handleAlgorithmResults
+from processing.core.parameters import ParameterVector, ParameterTable, ParameterMultipleInput
+from processing.core.outputs import OutputVector
 from processing.tools import dataobjects
-from processing.tools.system import getTempFilename
+from processing.tools.system import getTempFilename, processPool, canForkWorkers
 from processing.tools import vector
 from processing.gui.SilentProgress import SilentProgress
 
+# Seconds between checks for the cancelation of a batch while waiting
+# for worker processes
+CANCEL_CHECK_INTERVAL = 0.5
+
 
 def runalg(alg, progress=None):
     """Executes a given algorithm, showing its progress in the
@@ -47,57 +58,289 @@ def runalg(alg, progress=None):
     """
     if progress is None:
         progress = SilentProgress()
+    start = time.time()
     try:
         alg.execute(progress)
-        return True
+        executed = True
     except GeoAlgorithmExecutionException as e:
         ProcessingLog.addToLog(sys.exc_info()[0], ProcessingLog.LOG_ERROR)
         progress.error(e.msg)
-        return False
+        executed = False
+    finally:
+        # Layers opened during the execution are not kept, so that
+        # their files are closed and their selections are not reused
+        dataobjects.resetLoadedLayers()
+    ProcessingLog.addAlgorithmRecord(alg, time.time() - start, executed,
+                                     conversionTime=round(alg.conversionTime, 3),
+                                     profile=alg.profileResults)
+    return executed
+
+
+def runalgBatch(algs, progress=None, workers=None, stopOnError=False,
+                prepare=None, canceled=None):
+    """Executes a list of independent algorithms, which must have all
+    their parameter and output values set.
+
+    If more than one worker process can be used (see
+    processing.tools.system.processPool), the algorithms are run in a
+    pool of worker processes, each of them with its own Processing
+    initialization. Messages sent by the algorithms to their progress
+    objects are passed on to the progress object passed along once
+    each algorithm finishes, and output values are copied back to the
+    algorithms in the list. The algorithms are run in this process
+    instead if the QGIS GUI is running (except on Windows) or if an
+    input is a memory layer, a layer being edited or a layer with
+    selected features to use.
+
+    If prepare is not None, it is a list with a function for each
+    algorithm. prepare[i](alg) is called right before running the i-th
+    algorithm, in the process that runs it, and the function it
+    returns (if any) is called right after. They must be picklable to
+    be sent to worker processes.
+
+    Returns a list with True for each algorithm that was executed
+    correctly and False for the rest. If stopOnError is True, no more
+    algorithms are started after one fails. If canceled is not None,
+    it is a function returning True once the user cancels the batch:
+    no more algorithms are started then, and the worker processes are
+    stopped.
+    """
+    if progress is None:
+        progress = SilentProgress()
+    results = [False] * len(algs)
+    pool = None
+    if canForkWorkers() and all(_canRunInWorker(alg) for alg in algs):
+        # Workers start with a copy of this process, so nothing must be
+        # left in the log buffers for them to write again
+        ProcessingLog.flush()
+        pool = processPool(workers, _initWorker)
+
+    if pool is None:
+        for i, alg in enumerate(algs):
+            if canceled is not None and canceled():
+                break
+            progress.setText(tr('Executing algorithm %d/%d...') % (i + 1, len(algs)))
+            progress.setInfo(tr('<b>Algorithm %s starting...</b>') % alg.name)
+            results[i] = _runPrepared(alg, prepare and prepare[i], progress)
+            if stopOnError and not results[i]:
+                break
+        return results
+
+    tasks = [(i, alg.commandLineName(),
+              [(param.name, param.value) for param in alg.parameters],
+              [(out.name, out.value) for out in alg.outputs],
+              prepare and prepare[i])
+             for i, alg in enumerate(algs)]
+    try:
+        done = 0
+        iterator = pool.imap_unordered(_runTask, tasks)
+        while done < len(tasks):
+            if canceled is not None and canceled():
+                break
+            try:
+                i, ok, outputs, messages, log = iterator.next(CANCEL_CHECK_INTERVAL)
+            except TimeoutError:
+                continue
+            done += 1
+            ProcessingLog.writePending(log)
+            progress.setText(tr('Algorithm %d/%d finished (%d/%d done)...')
+                             % (i + 1, len(algs), done, len(algs)))
+            for name, value in outputs:
+                algs[i].setOutputValue(name, value)
+            for method, msg in messages:
+                getattr(progress, method)(msg)
+            progress.setPercentage(done * 100 / len(algs))
+            results[i] = ok
+            if stopOnError and not ok:
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
+def _canRunInWorker(alg):
+    # Workers open the inputs again from their sources, so they would
+    # miss memory layers, the selection used by the algorithm and
+    # unsaved edits, which only exist in this process
+    useSelected = ProcessingConfig.getSetting(ProcessingConfig.USE_SELECTED)
+    for param in alg.parameters:
+        if isinstance(param, (ParameterVector, ParameterTable,
+                              ParameterMultipleInput)) and param.value:
+            for value in unicode(param.value).split(';'):
+                layer = dataobjects.getObjectFromUri(value, False)
+                if not isinstance(layer, QgsVectorLayer):
+                    continue
+                if layer.providerType() == 'memory' or layer.isEditable():
+                    return False
+                if useSelected and layer.selectedFeatureCount() > 0:
+                    return False
+    for out in alg.outputs:
+        if isinstance(out, OutputVector) and out.value \
+                and unicode(out.value).startswith('memory:'):
+            return False
+    return True
+
+
+def _initWorker():
+    from qgis.core import QgsApplication
+    from processing.core.Processing import Processing
+    if QgsApplication.instance() is None:
+        _initWorker.app = QgsApplication([], False)
+        _initWorker.app.initQgis()
+    if not Processing.algs:
+        Processing.initialize()
+    # Only the parent process writes to the log files
+    ProcessingLog.keepPending()
+
+
+def _runTask(task):
+    from processing.core.Processing import Processing
+    i, name, params, outputs, prepare = task
+    progress = RecordingProgress()
+    alg = Processing.getAlgorithm(name)
+    progress.setInfo(tr('<b>Algorithm %s starting...</b>') % (alg.name if alg else name))
+    if alg is None:
+        progress.error(tr('Error: Algorithm %s not found') % name)
+        return i, False, [], progress.messages, ProcessingLog.takePending()
+    alg = alg.getCopy()
+    for paramName, value in params:
+        alg.setParameterValue(paramName, value)
+    for outName, value in outputs:
+        alg.setOutputValue(outName, value)
+    try:
+        ok = _runPrepared(alg, prepare, progress)
+    except Exception as e:
+        progress.error(unicode(e))
+        ok = False
+    outputs = [(out.name, out.value) for out in alg.outputs
+               if out.value is None or isinstance(out.value, (basestring, int, long, float, bool))]
+    return i, ok, outputs, progress.messages, ProcessingLog.takePending()
+
+
+def _runPrepared(alg, prepare, progress):
+    release = prepare(alg) if prepare else None
+    try:
+        return runalg(alg, progress)
+    finally:
+        if release is not None:
+            release()
+
+
+class RecordingProgress(SilentProgress):
+
+    """Progress that keeps the messages it receives, so they can be
+    sent to another process and replayed on a different progress
+    object.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def error(self, msg):
+        self.messages.append(('error', msg))
+
+    def setText(self, text):
+        self.messages.append(('setText', text))
+
+    def setInfo(self, msg):
+        self.messages.append(('setInfo', msg))
+
+    def setCommand(self, cmd):
+        self.messages.append(('setCommand', cmd))
+
+    def setDebugInfo(self, msg):
+        self.messages.append(('setDebugInfo', msg))
+
+    def setConsoleInfo(self, msg):
+        self.messages.append(('setConsoleInfo', msg))
 
 
 def runalgIterating(alg, paramToIter, progress):
-    # Generate all single-feature layers
-    settings = QSettings()
-    systemEncoding = settings.value('/UI/encoding', 'System')
     layerfile = alg.getParameterValue(paramToIter)
     layer = dataobjects.getObjectFromUri(layerfile, False)
-    feat = QgsFeature()
-    filelist = []
-    outputs = {}
-    provider = layer.dataProvider()
-    features = vector.features(layer)
-    for feat in features:
-        output = getTempFilename('shp')
-        filelist.append(output)
-        writer = QgsVectorFileWriter(output, systemEncoding,
-                                     provider.fields(), provider.geometryType(), layer.crs())
-        writer.addFeature(feat)
-        del writer
+    fids = [f.id() for f in vector.features(layer, [], geometry=False)]
+
+    # Single-feature layers are created right before each iteration
+    # and removed after it. Algorithms in the QGIS provider can read
+    # them from GDAL's in-memory file system, but others might pass
+    # them to external applications, so they get a temporary file
+    inMemory = alg.provider.getName() == 'qgis'
+    inputs = [IterationInput(paramToIter, layerfile, fid, i, inMemory)
+              for i, fid in enumerate(fids)]
 
     # store output values to use them later as basenames for all outputs
+    outputs = {}
     for out in alg.outputs:
         outputs[out.name] = out.value
 
     # now run all the algorithms
-    for i, f in enumerate(filelist):
-        alg.setParameterValue(paramToIter, f)
-        for out in alg.outputs:
+    algs = []
+    for i in xrange(len(fids)):
+        iteration = alg.getCopy()
+        for out in iteration.outputs:
             filename = outputs[out.name]
             if filename:
                 filename = filename[:filename.rfind('.')] + '_' + unicode(i) \
                     + filename[filename.rfind('.'):]
             out.value = filename
-        progress.setText(tr('Executing iteration %s/%s...' % (unicode(i), unicode(len(filelist)))))
-        progress.setPercentage(i * 100 / len(filelist))
-        if runalg(alg):
-            handleAlgorithmResults(alg, None, False)
-        else:
+        algs.append(iteration)
+
+    progress.setText(tr('Executing %s iterations...' % unicode(len(fids))))
+    results = runalgBatch(algs, progress, stopOnError=True,
+                          prepare=inputs)
+    for iteration, ok in zip(algs, results):
+        if not ok:
             return False
+        handleAlgorithmResults(iteration, None, False)
 
     return True
 
 
+class IterationInput(object):
+
+    """Sets the iterated parameter of an algorithm to a layer with
+    a single feature of the iterated layer. It is used as a prepare
+    function of runalgBatch, so the layer of each iteration is only
+    written when the iteration runs, and deleted after it.
+    """
+
+    def __init__(self, paramName, source, fid, iteration, inMemory):
+        self.paramName = paramName
+        self.source = source
+        self.fid = fid
+        self.iteration = iteration
+        self.inMemory = inMemory
+
+    def __call__(self, alg):
+        layer = dataobjects.getObjectFromUri(self.source)
+        request = QgsFeatureRequest().setFilterFid(self.fid)
+        feat = layer.getFeatures(request).next()
+
+        if self.inMemory:
+            output = '/vsimem/processing_%s/iteration_%d.shp' % (uuid.uuid4().hex, self.iteration)
+        else:
+            output = getTempFilename('shp')
+        systemEncoding = QSettings().value('/UI/encoding', 'System')
+        provider = layer.dataProvider()
+        writer = QgsVectorFileWriter(output, systemEncoding,
+                                     provider.fields(), provider.geometryType(), layer.crs())
+        writer.addFeature(feat)
+        del writer
+
+        alg.setParameterValue(self.paramName, output)
+        return lambda: self.release(output)
+
+    def release(self, output):
+        dataobjects.releaseLoadedLayer(output)
+        if self.inMemory:
+            folder = output[:output.rfind('/')]
+            for name in gdal.ReadDir(folder) or []:
+                gdal.Unlink(folder + '/' + name)
+        else:
+            QgsVectorFileWriter.deleteShapeFile(output)
+
+
 def tr(string, context=''):
     if context == '':
         context = 'AlgorithmExecutor'
@@ -30,7 +30,7 @@ from PyQt4.QtCore import Qt
 
 from processing.gui.BatchPanel import BatchPanel
 from processing.gui.AlgorithmDialogBase import AlgorithmDialogBase
-from processing.gui.AlgorithmExecutor import runalg
+from processing.gui.AlgorithmExecutor import runalgBatch
 from processing.gui.Postprocessing import handleAlgorithmResults
 
 from processing.core.ProcessingResults import ProcessingResults
@@ -151,7 +151,7 @@ class BatchAlgorithmDialog(AlgorithmDialogBase):
         QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
         self.mainWidget.setEnabled(False)
 
-        self.progressBar.setMaximum(len(self.algs))
+        self.progressBar.setMaximum(100)
         # Make sure the Log tab is visible before executing the algorithm
         try:
             self.tabWidget.setCurrentIndex(1)
@@ -159,10 +159,11 @@ class BatchAlgorithmDialog(AlgorithmDialogBase):
         except:
             pass
 
+        self.setInfo(self.tr('<b>Algorithm %s starting...</b>' % self.alg.name))
+        results = runalgBatch(self.algs, self, stopOnError=True,
+                              canceled=lambda: self.canceled)
         for count, alg in enumerate(self.algs):
-            self.setText(self.tr('\nProcessing algorithm %d/%d...') % (count + 1, len(self.algs)))
-            self.setInfo(self.tr('<b>Algorithm %s starting...</b>' % alg.name))
-            if runalg(alg, self) and not self.canceled:
+            if results[count] and not self.canceled:
                 if self.load[count]:
                     handleAlgorithmResults(alg, self, False)
                 self.setInfo(self.tr('Algorithm %s correctly executed...') % alg.name)
@@ -98,11 +98,9 @@ class CommanderWindow(QDialog):
         self.combo.clear()
 
         # Add algorithms
-        for providerName in Processing.algs.keys():
-            provider = Processing.algs[providerName]
-            algs = provider.values()
-            for alg in algs:
-                self.combo.addItem('Processing algorithm: ' + alg.name)
+        Processing.updateProviders()
+        for name in sorted(Processing.algsByName):
+            self.combo.addItem('Processing algorithm: ' + name)
 
         # Add functions
         for command in dir(self.commands):
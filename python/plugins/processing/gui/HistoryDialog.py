@@ -111,7 +111,7 @@ class HistoryDialog(BASE, WIDGET):
     def executeAlgorithm(self):
         item = self.tree.currentItem()
         if isinstance(item, TreeLogEntryItem):
-            if item.isAlg:
+            if item.isAlg and item.entry.text.startswith('processing.runalg('):
                 script = 'import processing\n'
                 script += item.entry.text.replace('runalg(', 'runandload(')
                 exec(script)
@@ -119,7 +119,14 @@ class HistoryDialog(BASE, WIDGET):
     def changeText(self):
         item = self.tree.currentItem()
         if isinstance(item, TreeLogEntryItem):
-            self.text.setText(item.entry.text.replace('|', '\n'))
+            text = item.entry.text.replace('|', '\n')
+            record = item.entry.record
+            if record is not None:
+                text += '\n\n' + self.tr('Executed: %s\nWall time: %s s\nPeak memory: %s KB') % (
+                    record.get('executed'), record.get('wallTime'), record.get('peakMemory'))
+                if record.get('conversionTime'):
+                    text += '\n' + self.tr('Output conversion time: %s s') % record['conversionTime']
+            self.text.setText(text)
 
     def createTest(self):
         item = self.tree.currentItem()
@@ -93,38 +93,37 @@ class ProcessingToolbox(BASE, WIDGET):
         text = self.searchBox.text().strip(' ').lower()
         for item in self.disabledProviderItems.values():
             item.setHidden(True)
-        self._filterItem(self.algorithmTree.invisibleRootItem(), text)
+        matches = Processing.searchAlgorithms(text) if text else None
+        self._filterItem(self.algorithmTree.invisibleRootItem(), text, matches)
         if text:
             self.algorithmTree.expandAll()
             self.disabledWithMatchingAlgs = []
             for providerName, provider in Processing.algs.iteritems():
                 name = 'ACTIVATE_' + providerName.upper().replace(' ', '_')
                 if not ProcessingConfig.getSetting(name):
-                    for alg in provider.values():
-                        if text in alg.name:
-                            self.disabledWithMatchingAlgs.append(providerName)
-                            break
+                    if not matches.isdisjoint(provider):
+                        self.disabledWithMatchingAlgs.append(providerName)
             self.txtDisabled.setVisible(bool(self.disabledWithMatchingAlgs))
         else:
             self.algorithmTree.collapseAll()
             self.algorithmTree.invisibleRootItem().child(0).setExpanded(True)
             self.txtDisabled.setVisible(False)
 
-    def _filterItem(self, item, text):
+    def _filterItem(self, item, text, matches):
         if (item.childCount() > 0):
             show = False
             for i in xrange(item.childCount()):
                 child = item.child(i)
-                showChild = self._filterItem(child, text)
+                showChild = self._filterItem(child, text, matches)
                 show = (showChild or show) and not item in self.disabledProviderItems.values()
             item.setHidden(not show)
             return show
-        elif isinstance(item, (TreeAlgorithmItem, TreeActionItem)):
+        elif isinstance(item, TreeAlgorithmItem):
+            hide = bool(text) and item.alg.commandLineName() not in matches
+            item.setHidden(hide)
+            return not hide
+        elif isinstance(item, TreeActionItem):
             hide = bool(text) and (text not in item.text(0).lower())
-            if isinstance(item, TreeAlgorithmItem):
-                hide = hide and (text not in item.alg.commandLineName())
-                if item.alg.shortHelp() is not None:
-                    hide = hide and (text not in item.alg.shortHelp())
             item.setHidden(hide)
             return not hide
         else:
@@ -15,3 +15,6 @@ writer = processing.VectorWriter(output_file, None, fields,
 
 ##Create a new table
 writer = processing.TableWriter(output_file, None, ['field1', 'field2'])
+writer.addRecord(['value1', 'value2'])
+# Records are buffered until the writer is closed
+writer.close()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    Benchmarks.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2026 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2026, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+
+'''
+Timings of the faster code paths in Processing against the ones they
+replace. They are not run as part of the test suite; call
+runBenchmarks() from the QGIS Python console instead.
+'''
+import math
+import random
+import time
+
+from qgis.core import QgsGeometry, QgsRectangle
+
+from processing.algs.qgis import triangulation, voronoi
+from processing.core.Processing import Processing
+from processing.tools import vector
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def gridCells(count):
+    """Returns a list of square cell geometries covering a grid of
+    the passed number of cells.
+    """
+    side = int(math.ceil(math.sqrt(count)))
+    return [QgsGeometry.fromRect(QgsRectangle(i % side, i // side,
+                                              i % side + 1, i // side + 1))
+            for i in xrange(count)]
+
+
+def chainedUnion(geoms):
+    union = QgsGeometry(geoms[0])
+    for geom in geoms[1:]:
+        union = union.combine(geom)
+    return union
+
+
+def benchmarkDissolve(sizes=(10000, 100000, 1000000), chainLimit=100000):
+    """Compares dissolving a grid of cells by combining them one at a
+    time with the cascaded union used by the Dissolve algorithm.
+
+    The chained union is quadratic, so it is skipped for grids larger
+    than chainLimit cells.
+    """
+    results = []
+    for size in sizes:
+        cells = gridCells(size)
+        chained = timed(chainedUnion, cells) if size <= chainLimit else None
+        cascaded = timed(vector.cascadedUnion, cells)
+        results.append(('Dissolve %d cells' % size, chained, cascaded))
+    return results
+
+
+def randomPoints(count):
+    return [(random.random() * 1000, random.random() * 1000)
+            for i in xrange(count)]
+
+
+def sweepVoronoi(points):
+    context = voronoi.Context()
+    voronoi.voronoi(voronoi.SiteList([voronoi.Site(x, y) for x, y in points]),
+                    context)
+    return context
+
+
+def sweepDelaunay(points):
+    return voronoi.computeDelaunayTriangulation(
+        [voronoi.Site(x, y) for x, y in points])
+
+
+def qhullVoronoi(points):
+    clip = QgsRectangle(0, 0, 1000, 1000)
+    for cell in triangulation.voronoiCells(points, clip):
+        pass
+
+
+def benchmarkVoronoi(sizes=(10000, 100000, 1000000), sweepLimit=100000):
+    """Compares the pure Python sweep line in voronoi.py with the Qhull
+    engine used when scipy is available, computing the Voronoi cells
+    and the Delaunay triangulation of random points.
+
+    The sweep is skipped for more than sweepLimit points, and the Qhull
+    engine if scipy is not installed.
+    """
+    results = []
+    for size in sizes:
+        points = triangulation.uniquePoints(randomPoints(size))[0]
+        sweep = timed(sweepVoronoi, points) if size <= sweepLimit else None
+        qhull = timed(qhullVoronoi, points) if triangulation.hasSciPy else None
+        results.append(('Voronoi %d points' % size, sweep, qhull))
+        sweep = timed(sweepDelaunay, points) if size <= sweepLimit else None
+        qhull = timed(triangulation.delaunayTriangles, points) if triangulation.hasSciPy else None
+        results.append(('Delaunay %d points' % size, sweep, qhull))
+    return results
+
+
+def initializeProcessing(algorithms=None):
+    """Initializes Processing from scratch and then looks up the
+    passed algorithms, or loads the algorithms of every provider if
+    algorithms is None, as initialize() used to do.
+    """
+    Processing.providers = []
+    Processing.initialize()
+    if algorithms is None:
+        Processing.updateProviders()
+    else:
+        for name in algorithms:
+            Processing.getAlgorithm(name)
+
+
+def benchmarkStartup(algorithms=('qgis:fixeddistancebuffer', 'qgis:dissolve')):
+    """Compares initializing Processing and loading all providers with
+    initializing it and looking up only the algorithms a headless
+    script would use.
+    """
+    eager = timed(initializeProcessing)
+    lazy = timed(initializeProcessing, algorithms)
+    return [('Startup for %d algorithms' % len(algorithms), eager, lazy)]
+
+
+def runBenchmarks():
+    results = benchmarkDissolve() + benchmarkStartup() + benchmarkVoronoi()
+    for name, before, after in results:
+        before = '%.2fs' % before if before is not None else 'skipped'
+        after = '%.2fs' % after if after is not None else 'skipped'
+        print '%s: %s -> %s' % (name.ljust(40), before, after)
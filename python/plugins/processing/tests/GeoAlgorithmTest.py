@@ -28,6 +28,9 @@ __revision__ = '$Format:%H$'
 import unittest
 
 import processing
+from processing.core.Processing import Processing
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.gui.AlgorithmExecutor import runalg, _canRunInWorker
 from processing.tools import dataobjects
 from processing.tools.system import getTempFilename
 
@@ -58,6 +61,67 @@ class GeoAlgorithmTest(unittest.TestCase):
         values = [unicode(attr) for attr in attrs]
         self.assertEqual(expectedvalues, values)
 
+    def testProfiling(self):
+        alg = Processing.getAlgorithm('qgis:countpointsinpolygon').getCopy()
+        alg.setParameterValue('POLYGONS', polygons())
+        alg.setParameterValue('POINTS', points())
+        alg.setParameterValue('FIELD', 'NUMPOINTS')
+        alg.setOutputValue('OUTPUT', getTempFilename('shp'))
+        alg.profiling = True
+        self.assertTrue(runalg(alg))
+        profile = alg.profileResults
+        self.assertIn('processAlgorithm', profile['phases'])
+        self.assertEqual(2, sum(profile['featuresWritten'].values()))
+        self.assertGreater(profile['calls']['vector.features'], 0)
+
+    def testProvidersAreLoadedLazily(self):
+        Processing.loadAlgorithms()
+        self.assertIn('gdalogr', Processing.algs)
+        self.assertFalse(Processing.algs.isLoaded('qgis'))
+        alg = Processing.getAlgorithm('qgis:countpointsinpolygon')
+        self.assertIsNotNone(alg)
+        self.assertTrue(Processing.algs.isLoaded('qgis'))
+        self.assertFalse(Processing.algs.isLoaded('gdalogr'))
+        self.assertIn('gdalogr:information', Processing.algs['gdalogr'])
+
+    def testAlgorithmIndexes(self):
+        alg = Processing.getAlgorithm('qgis:countpointsinpolygon')
+        self.assertIs(alg, Processing.getAlgorithmFromFullName('Count points in polygon'))
+        self.assertIn('qgis:countpointsinpolygon', Processing.searchAlgorithms('POINTS IN POL'))
+        self.assertIn('qgis:countpointsinpolygon', Processing.searchAlgorithms('countpoints'))
+        self.assertNotIn('qgis:countpointsinpolygon', Processing.searchAlgorithms('countpointsx'))
+
+    def testSelectionAndEditsAreNotSentToWorkers(self):
+        alg = Processing.getAlgorithm('qgis:countpointsinpolygon').getCopy()
+        alg.setParameterValue('POLYGONS', polygons())
+        alg.setParameterValue('POINTS', points())
+        alg.setParameterValue('FIELD', 'NUMPOINTS')
+        alg.setOutputValue('OUTPUT', getTempFilename('shp'))
+        layer = dataobjects.getObjectFromUri(points())
+        self.assertTrue(_canRunInWorker(alg))
+
+        useSelected = ProcessingConfig.getSetting(ProcessingConfig.USE_SELECTED)
+        ProcessingConfig.setSettingValue(ProcessingConfig.USE_SELECTED, True)
+        layer.setSelectedFeatures([layer.getFeatures().next().id()])
+        self.assertFalse(_canRunInWorker(alg))
+        ProcessingConfig.setSettingValue(ProcessingConfig.USE_SELECTED, False)
+        self.assertTrue(_canRunInWorker(alg))
+        ProcessingConfig.setSettingValue(ProcessingConfig.USE_SELECTED, useSelected)
+        layer.setSelectedFeatures([])
+
+        layer.startEditing()
+        self.assertFalse(_canRunInWorker(alg))
+        layer.rollBack()
+        self.assertTrue(_canRunInWorker(alg))
+
+    def testOverwrittenOutputIsLoadedAgain(self):
+        output = getTempFilename('shp')
+        for field in ('NUMPOINTS', 'NUMPOINTS2'):
+            processing.runalg('qgis:countpointsinpolygon', polygons(),
+                              points(), field, output)
+            layer = dataobjects.getObjectFromUri(output)
+            self.assertEqual(field, layer.pendingFields()[-1].name())
+
 
 def suite():
     suite = unittest.makeSuite(GeoAlgorithmTest, 'test')
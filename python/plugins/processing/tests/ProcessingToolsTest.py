@@ -26,10 +26,19 @@ __copyright__ = '(C) 2013, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import unittest
+import numpy
+from osgeo import gdal
+from PyQt4.QtCore import QDate, QDateTime, QTime, QVariant
+from qgis.core import QGis, QgsFeature, QgsField, QgsGeometry, \
+    QgsCoordinateReferenceSystem, QgsRectangle
 
 import processing
-from processing.tools.vector import values
-from processing.tools.dataobjects import getObjectFromName
+from processing.tools import vector
+from processing.tools.vector import values, uniqueValues, FeatureStore, GeometryPredicates
+from processing.tools.dataobjects import getObjectFromName, getObjectFromUri
+from processing.tools.raster import RasterWriter, ZoneRasterizer, \
+    scanrasterblocks, stripZoneValues, zoneValues
+from processing.tools.system import getTempFilename
 
 from processing.tests.TestData import points, polygons
 
@@ -46,6 +55,11 @@ class ProcessingToolsTest(unittest.TestCase):
         layer = processing.getObject('points')
         self.assertIsNotNone(layer)
 
+    def test_getobjectFromUriIsCached(self):
+        layer = getObjectFromUri(points())
+        self.assertIsNotNone(layer)
+        self.assertIs(layer, getObjectFromUri(points()))
+
     def test_runandload(self):
         processing.runandload('qgis:countpointsinpolygon', polygons(),
                               points(), 'NUMPOINTS', None)
@@ -66,6 +80,13 @@ class ProcessingToolsTest(unittest.TestCase):
         self.assertEqual(1, len(features))
         layer.setSelectedFeatures([])
 
+    def test_featuresWithExpression(self):
+        layer = processing.getObject(points())
+        features = processing.features(layer, ['ID'], geometry=False,
+                                       expression='"PT_ST_A" = \'a\'')
+        ids = [int(f['ID']) for f in features]
+        self.assertEqual([1, 4, 6, 9, 11], ids)
+
     def test_attributeValues(self):
         layer = processing.getObject(points())
         attributeValues = values(layer, 'ID')
@@ -75,6 +96,158 @@ class ProcessingToolsTest(unittest.TestCase):
             i += 1
         self.assertEquals(13, i)
 
+    def test_attributeValuesAsNumpy(self):
+        layer = processing.getObject(points())
+        attributeValues = values(layer, 'ID', 'PT_ST_A', asNumpy=True)
+        self.assertEqual(range(1, 13), attributeValues['ID'].tolist())
+        self.assertTrue(numpy.isnan(attributeValues['PT_ST_A']).all())
+
+    def test_uniqueValues(self):
+        layer = processing.getObject(points())
+        self.assertEqual(['a', 'b', 'c'], uniqueValues(layer, 'PT_ST_A'))
+        self.assertEqual(['a', 'b', 'c'],
+                         sorted(uniqueValues(layer, 'PT_ST_A', True)))
+
+    def test_featureStore(self):
+        layer = processing.getObject(points())
+        cached = FeatureStore(layer, ['ID'])
+        fetched = FeatureStore(layer, ['ID'], memoryBudget=0)
+        fids = cached.intersects(layer.extent())
+        self.assertEqual(12, len(fids))
+        self.assertEqual(0, len(fetched.cache))
+        self.assertEqual([f['ID'] for f in cached.features(fids)],
+                         [f['ID'] for f in fetched.features(fids)])
+
+    def test_geometryPredicates(self):
+        square = QgsGeometry.fromWkt('POLYGON((0 0, 2 0, 2 2, 0 2, 0 0))')
+        inside = QgsGeometry.fromWkt('POINT(1 1)')
+        outside = QgsGeometry.fromWkt('POINT(3 3)')
+        engine = GeometryPredicates(['contains'])
+        engine.prepare(square)
+        self.assertTrue(engine.matches(inside))
+        self.assertFalse(engine.matches(outside))
+        engine = GeometryPredicates(['within', 'disjoint'], converse=True)
+        engine.prepare(square)
+        self.assertTrue(engine.matches(inside))
+        self.assertFalse(engine.intersects(outside))
+
+    def test_writeDates(self):
+        self.assertEqual('2015-01-31', vector._copyValue(QDate(2015, 1, 31)))
+        self.assertEqual('2015-01-31T10:20:30', vector._copyValue(
+            QDateTime(QDate(2015, 1, 31), QTime(10, 20, 30))))
+        self.assertEqual('10:20:30', vector._copyValue(QTime(10, 20, 30)))
+
+        # Buffered features are written when the scope is closed
+        with vector.WriterScope() as writers:
+            writer = vector.VectorWriter('memory:', None,
+                                         [QgsField('DATE', QVariant.Date)],
+                                         QGis.WKBPoint,
+                                         QgsCoordinateReferenceSystem('EPSG:4326'))
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromWkt('POINT(1 1)'))
+            feature.setAttributes([QDate(2015, 1, 31)])
+            writer.addFeature(feature)
+            self.assertEqual(0, writer.layer.featureCount())
+            writers.close()
+            self.assertEqual(1, writer.layer.featureCount())
+
+    def test_tableWriterLeftOpen(self):
+        filename = getTempFilename('csv')
+        with vector.WriterScope() as writers:
+            writer = vector.TableWriter(filename, None, ['A', 'B'])
+            writer.addRecord([1, 'one'])
+            del writer
+            writers.close()
+        with open(filename) as f:
+            self.assertEqual(['A,B', '1,one'], f.read().splitlines())
+
+    def rasterWriter(self, tiled):
+        # 10 x 7 cells of size 1 with the origin at (0, 7). The first
+        # band holds 10 * row + column, except a no-data cell at (1, 0),
+        # and the second one holds 5, except a 7 at (2, 3)
+        filename = getTempFilename('tif')
+        writer = RasterWriter(filename, 0, 0, 10, 7, 1, 2,
+                              QgsCoordinateReferenceSystem('EPSG:23030'),
+                              tiled=tiled, tileSize=4, cacheTiles=2)
+        for y in xrange(7):
+            for x in xrange(10):
+                if (x, y) != (1, 0):
+                    writer.setValue(10 * y + x, x, y)
+        writer.fill(5, 1)
+        writer.setValue(7, 2, 3, 1)
+        # In tiled mode these tiles were evicted from the cache
+        self.assertEqual(34, writer.getValue(4, 3))
+        self.assertEqual(RasterWriter.NODATA, writer.getValue(1, 0))
+        writer.close()
+        return filename
+
+    def test_rasterWriter(self):
+        first = numpy.arange(70, dtype=numpy.float32).reshape(7, 10)
+        first[0, 1] = RasterWriter.NODATA
+        second = numpy.empty((7, 10), numpy.float32)
+        second[:] = 5
+        second[3, 2] = 7
+        for tiled in (False, True):
+            dataset = gdal.Open(self.rasterWriter(tiled))
+            self.assertEqual((10, 7, 2), (dataset.RasterXSize,
+                                          dataset.RasterYSize,
+                                          dataset.RasterCount))
+            self.assertEqual((0, 1, 0, 7, 0, -1), dataset.GetGeoTransform())
+            band = dataset.GetRasterBand(1)
+            self.assertEqual(RasterWriter.NODATA, band.GetNoDataValue())
+            self.assertEqual(first.tolist(), band.ReadAsArray().tolist())
+            self.assertEqual(second.tolist(),
+                             dataset.GetRasterBand(2).ReadAsArray().tolist())
+            if tiled:
+                self.assertEqual([4, 4], band.GetBlockSize())
+            dataset = None
+
+    def test_scanrasterblocks(self):
+        layer = getObjectFromUri(self.rasterWriter(True))
+        # 3 x 2 tiles, with the no-data cell masked
+        blocks = list(scanrasterblocks(layer))
+        self.assertEqual(6, len(blocks))
+        self.assertEqual(69, sum(block.count() for block in blocks))
+        self.assertEqual(sum(range(70)) - 1, sum(block.sum() for block in blocks))
+        blocks = list(scanrasterblocks(layer, bandNumber=2))
+        self.assertEqual(70, sum(block.count() for block in blocks))
+        self.assertEqual(69 * 5 + 7, sum(block.sum() for block in blocks))
+
+    def test_zoneValues(self):
+        dataset = gdal.Open(self.rasterWriter(True))
+        band = dataset.GetRasterBand(1)
+        rasterizer = ZoneRasterizer(dataset.GetGeoTransform(),
+                                    dataset.RasterXSize, dataset.RasterYSize)
+        # Columns 0 to 2 of rows 0 and 1, and columns 5 to 8 of rows 3
+        # to 6
+        self.assertEqual(1, rasterizer.addZone(
+            QgsGeometry.fromRect(QgsRectangle(0, 5, 3, 7))))
+        self.assertEqual(2, rasterizer.addZone(
+            QgsGeometry.fromRect(QgsRectangle(5, 0, 9, 4))))
+        self.assertEqual(2, rasterizer.zoneCount())
+        expected = {1: [0, 2, 10, 11, 12],
+                    2: [10 * y + x for y in xrange(3, 7) for x in xrange(5, 9)]}
+
+        labels = rasterizer.labels(0, 7)
+        self.assertEqual((7, 10), labels.shape)
+        self.assertEqual(6 + 16, (labels > 0).sum())
+        self.assertEqual([1, 1, 1, 0], labels[1, :4].tolist())
+        self.assertEqual([0, 2, 2, 2, 2, 0], labels[3, 4:].tolist())
+
+        values = {1: [], 2: []}
+        for y in xrange(7):
+            for label, value in zip(*stripZoneValues(rasterizer, band, y, 1)):
+                values[label].append(value)
+        self.assertEqual(expected, dict((zone, sorted(v)) for zone, v in values.iteritems()))
+
+        # Each zone comes in a single pair, with all its values
+        values = {}
+        for labels, pairValues in zoneValues(rasterizer, band):
+            for zone in set(labels.tolist()):
+                self.assertNotIn(zone, values)
+                values[zone] = sorted(pairValues[labels == zone].tolist())
+        self.assertEqual(expected, values)
+
     def test_extent(self):
         pass
 
@@ -25,12 +25,18 @@ __copyright__ = '(C) 2013, Victor Olaya'
 
 __revision__ = '$Format:%H$'
 
+import os
+import csv
 import unittest
+import numpy
 import processing
+from processing.core.Processing import Processing
 from processing.tools import dataobjects
 
+from qgis.core import QGis
+
 from processing.tests.TestData import points, points2, polygons, polygons2, \
-    lines, union, table
+    lines, union, table, raster, layerFromWkt
 
 
 class QgisAlgsTest(unittest.TestCase):
@@ -1124,6 +1130,197 @@ class QgisAlgsTest(unittest.TestCase):
         wkt = 'POINT(270839.65586926 4458983.16267036)'
         self.assertEqual(wkt, unicode(feature.geometry().exportToWkt()))
 
+    def test_qgisdeleteduplicategeometries(self):
+        outputs = processing.runalg('qgis:deleteduplicategeometries',
+                                    points(), 0, None)
+        layer = dataobjects.getObjectFromUri(outputs['OUTPUT'], True)
+        self.assertEqual(12, len(processing.features(layer)))
+        outputs = processing.runalg('qgis:deleteduplicategeometries',
+                                    points(), 1000000, None)
+        layer = dataobjects.getObjectFromUri(outputs['OUTPUT'], True)
+        self.assertEqual(1, len(processing.features(layer)))
+
+    def test_qgisdeleteduplicategeometriesLines(self):
+        layer = layerFromWkt(QGis.WKBLineString, [
+            ('LINESTRING(0 0,10 10)', 'a'),
+            ('LINESTRING(0 0,10 10)', 'same wkb'),
+            ('LINESTRING(10 10,0 0)', 'reversed'),
+            ('LINESTRING(0 10,10 0)', 'same bbox'),
+            ('LINESTRING(0 0,10 10.001)', 'near'),
+            ('LINESTRING(20 20,30 30)', 'far'),
+        ])
+
+        def names(tolerance):
+            outputs = processing.runalg('qgis:deleteduplicategeometries',
+                                        layer, tolerance, None)
+            output = dataobjects.getObjectFromUri(outputs['OUTPUT'], True)
+            return sorted(f['NAME'] for f in processing.features(output))
+
+        self.assertEqual(['a', 'far', 'near', 'same bbox'], names(0))
+        self.assertEqual(['a', 'far', 'same bbox'], names(0.01))
+
+    def slivers(self):
+        # A sliver between A and B, which shares a longer boundary
+        # with A but B is larger, and a chain of two slivers above A
+        return layerFromWkt(QGis.WKBPolygon, [
+            ('POLYGON((0 0,10 0,10 10,0 10,0 0))', 'A'),
+            ('POLYGON((11 0,40 0,40 5,11 5,11 0))', 'B'),
+            ('POLYGON((10 0,11 0,11 10,10 10,10 0))', 'sl%1'),
+            ('POLYGON((0 10,10 10,10 10.5,0 10.5,0 10))', 'sl_2'),
+            ('POLYGON((0 10.5,10 10.5,10 11,0 11,0 10.5))', 'sl_3'),
+        ])
+
+    def eliminate(self, layer, comparison, value, mode):
+        outputs = processing.runalg('qgis:eliminatesliverpolygons', layer,
+                                    False, 'NAME', comparison, value, mode,
+                                    None)
+        output = dataobjects.getObjectFromUri(outputs['OUTPUT'], True)
+        return dict((f['NAME'], f.geometry().area())
+                    for f in processing.features(output))
+
+    def test_qgiseliminatesliverpolygons(self):
+        layer = self.slivers()
+        # begins with 'sl': all three slivers are merged, the chain
+        # into A whatever the mode
+        areas = self.eliminate(layer, 6, 'sl', 0)
+        self.assertEqual(['A', 'B'], sorted(areas))
+        self.assertAlmostEqual(110, areas['A'])
+        self.assertAlmostEqual(155, areas['B'])
+        areas = self.eliminate(layer, 6, 'sl', 1)
+        self.assertAlmostEqual(120, areas['A'])
+        self.assertAlmostEqual(145, areas['B'])
+        areas = self.eliminate(layer, 6, 'sl', 2)
+        self.assertAlmostEqual(120, areas['A'])
+        self.assertAlmostEqual(145, areas['B'])
+
+    def test_qgiseliminatesliverpolygonsWildcards(self):
+        layer = self.slivers()
+        # '_' and '%' are not wildcards
+        areas = self.eliminate(layer, 7, '_', 0)
+        self.assertEqual(['A', 'B', 'sl%1'], sorted(areas))
+        self.assertAlmostEqual(110, areas['A'])
+        areas = self.eliminate(layer, 6, 'sl%', 0)
+        self.assertEqual(['A', 'B', 'sl_2', 'sl_3'], sorted(areas))
+        self.assertAlmostEqual(155, areas['B'])
+
+    def hypsometricCurves(self, singlePass):
+        outputs = processing.runalg('qgis:hypsometriccurves', raster(),
+                                    polygons(), 10, False, singlePass, True,
+                                    None, None)
+        with open(outputs['OUTPUT_TABLE']) as f:
+            rows = list(csv.reader(f))[1:]
+        files = os.listdir(outputs['OUTPUT_DIRECTORY'])
+        return [(int(fid), float(area), float(elevation))
+                for fid, area, elevation in rows], files
+
+    def test_qgishypsometriccurves(self):
+        rows, files = self.hypsometricCurves(False)
+        singlePassRows, singlePassFiles = self.hypsometricCurves(True)
+        self.assertEqual(2, len(files))
+        self.assertEqual(sorted(files), sorted(singlePassFiles))
+        self.assertEqual(len(rows), len(singlePassRows))
+        for row, singlePassRow in zip(sorted(rows), sorted(singlePassRows)):
+            self.assertEqual(row[0], singlePassRow[0])
+            self.assertAlmostEqual(row[1], singlePassRow[1])
+            self.assertAlmostEqual(row[2], singlePassRow[2])
+        # 28 cells between 851 and 881 in the first polygon
+        curve = [row[1:] for row in rows if row[0] == 0]
+        cellArea = 10.236696404106624 * 10.044151671496886
+        self.assertEqual([861, 871, 881], [elevation for area, elevation in curve])
+        self.assertAlmostEqual(5 * cellArea, curve[0][0], 3)
+        self.assertAlmostEqual(25 * cellArea, curve[-1][0], 3)
+
+    def test_qgishypsometriccurvesBins(self):
+        alg = Processing.getAlgorithm('qgis:hypsometriccurves')
+
+        def loop(d, step, percentage):
+            # Stepping loop used before the curves were computed with
+            # numpy.bincount
+            out = {}
+            startValue = d.min()
+            tmpValue = startValue + step
+            while startValue < d.max():
+                out[tmpValue] = ((startValue <= d) & (d < tmpValue)).sum()
+                startValue = tmpValue
+                tmpValue += step
+            multiplier = 100.0 / d.size if percentage else 1
+            area = 0
+            curve = []
+            for elevation, count in sorted(out.items()):
+                area += count * multiplier
+                curve.append((area, elevation))
+            return curve
+
+        for d, step in (([851, 859, 861, 870.5, 881], 10),
+                        ([851, 859, 861, 870.5, 880], 10),
+                        ([0, 0.5, 1, 1.5, 4], 0.5),
+                        ([5, 5, 5], 1)):
+            d = numpy.array(d, numpy.float64)
+            for percentage in (False, True):
+                expected = loop(d, step, percentage)
+                curve = alg.calculateHypsometry(d, 1, 1, percentage, step)
+                self.assertEqual(len(expected), len(curve))
+                for (area, elevation), (expectedArea, expectedElevation) \
+                        in zip(curve, expected):
+                    self.assertAlmostEqual(expectedArea, area)
+                    self.assertAlmostEqual(expectedElevation, elevation)
+
+    def test_qgispointsdisplacementPrecision(self):
+        layer = layerFromWkt(QGis.WKBPoint, [('POINT(0 0)', 'a'),
+                                             ('POINT(0.2 0.1)', 'b'),
+                                             ('POINT(10 10)', 'c')])
+        outputs = processing.runalg('qgis:pointsdisplacement', layer, 1,
+                                    False, 1, None)
+        layer = dataobjects.getObjectFromUri(outputs['OUTPUT_LAYER'], True)
+        displaced = dict((f['NAME'], f.geometry().asPoint())
+                      for f in processing.features(layer))
+        # a and b share a location at this precision, and are spread
+        # around the first of them
+        self.assertEqual(['a', 'b', 'c'], sorted(displaced))
+        for name, x, y in (('a', 0, 1), ('b', 0, -1), ('c', 10, 10)):
+            self.assertAlmostEqual(x, displaced[name].x())
+            self.assertAlmostEqual(y, displaced[name].y())
+
+    def zonalStatistics(self, zones, singlePass):
+        outputs = processing.runalg('qgis:zonalstatistics', raster(), 1,
+                                    zones, '_', False, singlePass, None)
+        layer = dataobjects.getObjectFromUri(outputs['OUTPUT_LAYER'], True)
+        names = [unicode(f.name()) for f in layer.pendingFields()]
+        return [dict(zip(names, f.attributes()))
+                for f in processing.features(layer)]
+
+    def assertSameZones(self, rows, singlePassRows):
+        self.assertEqual(len(rows), len(singlePassRows))
+        for row, singlePassRow in zip(rows, singlePassRows):
+            self.assertEqual(sorted(row), sorted(singlePassRow))
+            for name, value in row.iteritems():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(value, singlePassRow[name], 4)
+                else:
+                    self.assertEqual(value, singlePassRow[name])
+
+    def test_qgiszonalstatistics(self):
+        rows = self.zonalStatistics(polygons(), False)
+        self.assertSameZones(rows, self.zonalStatistics(polygons(), True))
+        # 28 valid cells between 851 and 881 in the first polygon
+        self.assertEqual(28, rows[0]['_count'])
+        self.assertTrue(851 <= rows[0]['_min'] <= rows[0]['_max'] <= 881)
+
+    def test_qgiszonalstatisticsEmptyZones(self):
+        # The second zone is outside the raster
+        zones = layerFromWkt(QGis.WKBPolygon, [
+            ('POLYGON((270760 4458920,270820 4458920,270820 4458990,'
+             '270760 4458990,270760 4458920))', 'in'),
+            ('POLYGON((280000 4450000,280100 4450000,280100 4450100,'
+             '280000 4450100,280000 4450000))', 'out')])
+        rows = self.zonalStatistics(zones, False)
+        self.assertSameZones(rows, self.zonalStatistics(zones, True))
+        self.assertEqual(['in', 'out'], [row['NAME'] for row in rows])
+        self.assertTrue(rows[0]['_count'] > 0)
+        self.assertEqual(0, rows[1]['_count'])
+        for name in ('_min', '_max', '_sum', '_mean', '_median'):
+            self.assertFalse(rows[1][name])
+
     def test_qgisexportaddgeometrycolumnspoints(self):
         outputs = processing.runalg('qgis:exportaddgeometrycolumns', points(),
                                     0, None)
@@ -26,7 +26,11 @@ __copyright__ = '(C) 2013, Victor Olaya'
 __revision__ = '$Format:%H$'
 
 import os.path
+from PyQt4.QtCore import QVariant
+from qgis.core import QgsCoordinateReferenceSystem, QgsFeature, QgsField, \
+    QgsFields, QgsGeometry, QgsVectorFileWriter
 from processing.tools import dataobjects
+from processing.tools.system import getTempFilename
 
 dataFolder = os.path.join(os.path.dirname(__file__), 'data')
 
@@ -67,6 +71,26 @@ def union():
     return os.path.join(dataFolder, 'union.shp')
 
 
+def layerFromWkt(geometryType, rows):
+    """Writes a shapefile with a feature for each (wkt, name) tuple in
+    rows, with an ID and a NAME field, and returns its path.
+    """
+    filename = getTempFilename('shp')
+    fields = QgsFields()
+    fields.append(QgsField('ID', QVariant.Int))
+    fields.append(QgsField('NAME', QVariant.String, '', 20))
+    writer = QgsVectorFileWriter(filename, 'utf-8', fields, geometryType,
+                                 QgsCoordinateReferenceSystem('EPSG:23030'),
+                                 'ESRI Shapefile')
+    for i, (wkt, name) in enumerate(rows):
+        feature = QgsFeature(fields)
+        feature.setGeometry(QgsGeometry.fromWkt(wkt))
+        feature.setAttributes([i + 1, name])
+        writer.addFeature(feature)
+    del writer
+    return filename
+
+
 def loadTestData():
     dataobjects.load(points(), 'points')
     dataobjects.load(points2(), 'points2')
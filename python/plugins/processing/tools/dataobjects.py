@@ -35,17 +35,81 @@ from qgis.utils import iface
 from processing.core.ProcessingConfig import ProcessingConfig
 from processing.algs.gdal.GdalUtils import GdalUtils
 from processing.tools.system import getTempFilenameInTempFolder, getTempFilename, isWindows
+from processing.tools import profiling
 
 ALL_TYPES = [-1]
 
 _loadedLayers = {}
 
+# Layers in the project, by normalized source and by name. They are
+# rebuilt on demand after the registry or a layer name changes
+_layersBySource = None
+_layersByName = None
+_layerIndexConnected = False
+
+# Provider that opened a given (normalized) uri the last time
+_uriProviders = {}
+
 
 def resetLoadedLayers():
     global _loadedLayers
     _loadedLayers = {}
 
 
+def releaseLoadedLayer(uri):
+    """Removes a layer opened by getObjectFromUri from the cache of
+    loaded layers, so it is released once it is no longer used.
+    """
+    source = normalizeLayerSource(uri)
+    _uriProviders.pop(source, None)
+    layer = _loadedLayers.pop(source, None)
+    if layer is not None:
+        for key in [k for k, v in _loadedLayers.iteritems() if v is layer]:
+            del _loadedLayers[key]
+
+
+def _invalidateLayerIndex(*args):
+    global _layersBySource, _layersByName
+    _layersBySource = None
+    _layersByName = None
+
+
+def _layersAdded(layers):
+    for layer in layers:
+        layer.layerNameChanged.connect(_invalidateLayerIndex)
+    _invalidateLayerIndex()
+
+
+def _buildLayerIndex():
+    global _layersBySource, _layersByName, _layerIndexConnected
+    if not _layerIndexConnected:
+        registry = QgsMapLayerRegistry.instance()
+        registry.layersAdded.connect(_layersAdded)
+        registry.layersWillBeRemoved.connect(_invalidateLayerIndex)
+        registry.layersRemoved.connect(_invalidateLayerIndex)
+        for layer in registry.mapLayers().values():
+            layer.layerNameChanged.connect(_invalidateLayerIndex)
+        _layerIndexConnected = True
+
+    # Same precedence as a sequential search: rasters, then vector
+    # layers, then tables, each of them sorted by name
+    _layersBySource = {}
+    for layer in getRasterLayers() + getVectorLayers() + getTables():
+        _layersBySource.setdefault(normalizeLayerSource(layer.source()), layer)
+    _layersByName = {}
+    for layer in getAllLayers():
+        _layersByName.setdefault(layer.name(), layer)
+
+
+def getLayerFromSource(source):
+    """Returns the layer in the current project with the given source,
+    or None if there is no such layer.
+    """
+    if _layersBySource is None:
+        _buildLayerIndex()
+    return _layersBySource.get(normalizeLayerSource(source))
+
+
 def getSupportedOutputVectorLayerExtensions():
     formats = QgsVectorFileWriter.supportedFiltersAndFormats()
     exts = ['shp']  # shp is the default, should be the first
@@ -199,10 +263,9 @@ def load(fileName, name=None, crs=None, style=None):
 
 
 def getObjectFromName(name):
-    layers = getAllLayers()
-    for layer in layers:
-        if layer.name() == name:
-            return layer
+    if _layersByName is None:
+        _buildLayerIndex()
+    return _layersByName.get(name)
 
 
 def getObject(uriorname):
@@ -226,43 +289,41 @@ def getObjectFromUri(uri, forceLoad=True):
     Otherwise, it will return the object only if it is loaded in QGIS.
     """
 
+    profiling.countCall('getObjectFromUri')
     if uri is None:
         return None
-    if uri in _loadedLayers:
-        return _loadedLayers[uri]
-    layers = getRasterLayers()
-    for layer in layers:
-        if normalizeLayerSource(layer.source()) == normalizeLayerSource(uri):
-            return layer
-    layers = getVectorLayers()
-    for layer in layers:
-        if normalizeLayerSource(layer.source()) == normalizeLayerSource(uri):
-            return layer
-    tables = getTables()
-    for table in tables:
-        if normalizeLayerSource(table.source()) == normalizeLayerSource(uri):
-            return table
+    source = normalizeLayerSource(uri)
+    if source in _loadedLayers:
+        return _loadedLayers[source]
+    layer = getLayerFromSource(uri)
+    if layer is not None:
+        return layer
     if forceLoad:
         settings = QSettings()
         prjSetting = settings.value('/Projections/defaultBehaviour')
         settings.setValue('/Projections/defaultBehaviour', '')
 
-        # If is not opened, we open it
-        for provider in ['ogr', 'postgres', 'spatialite', 'virtual']:
-            layer = QgsVectorLayer(uri, uri, provider)
+        # If is not opened, we open it, starting with the provider that
+        # worked the last time for this uri
+        providers = ['ogr', 'postgres', 'spatialite', 'virtual', None]
+        if source in _uriProviders:
+            providers.remove(_uriProviders[source])
+            providers.insert(0, _uriProviders[source])
+        for provider in providers:
+            if provider is None:
+                layer = QgsRasterLayer(uri, uri)
+            else:
+                layer = QgsVectorLayer(uri, uri, provider)
             if layer.isValid():
-                if prjSetting:
-                    settings.setValue('/Projections/defaultBehaviour', prjSetting)
+                _uriProviders[source] = provider
+                _loadedLayers[source] = layer
                 _loadedLayers[normalizeLayerSource(layer.source())] = layer
-                return layer
-        layer = QgsRasterLayer(uri, uri)
-        if layer.isValid():
-            if prjSetting:
-                settings.setValue('/Projections/defaultBehaviour', prjSetting)
-            _loadedLayers[normalizeLayerSource(layer.source())] = layer
-            return layer
+                break
+        else:
+            layer = None
         if prjSetting:
             settings.setValue('/Projections/defaultBehaviour', prjSetting)
+        return layer
     else:
         return None
 
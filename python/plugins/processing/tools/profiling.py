@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    profiling.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2026 by Victor Olaya
+    Email                : volayaf at gmail dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2026, Victor Olaya'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+# Profiles being recorded, innermost (e.g. an algorithm run by a
+# model) last
+_profiles = []
+
+
+def _cpuTime():
+    times = os.times()
+    return times[0] + times[1]
+
+
+class Profile:
+
+    """Execution profile of an algorithm: wall and CPU time of each
+    phase of its execution, calls to some frequently used helpers, and
+    features read from each input and written to each output.
+
+    While a profile is active (between start() and stop()), helpers
+    report to it through active().
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.calls = defaultdict(int)
+        self.featuresRead = defaultdict(int)
+        self.featuresWritten = defaultdict(int)
+
+    def start(self):
+        _profiles.append(self)
+        return self
+
+    def stop(self):
+        if self in _profiles:
+            _profiles.remove(self)
+
+    @contextmanager
+    def phase(self, name):
+        wallTime = time.time()
+        cpuTime = _cpuTime()
+        try:
+            yield
+        finally:
+            self.phases[name] = {'wallTime': time.time() - wallTime,
+                                 'cpuTime': _cpuTime() - cpuTime}
+
+    def asDict(self):
+        return {
+            'phases': OrderedDict(self.phases),
+            'calls': dict(self.calls),
+            'featuresRead': dict(self.featuresRead),
+            'featuresWritten': dict(self.featuresWritten),
+        }
+
+    def summary(self):
+        """Returns a human-readable description of the profile.
+        """
+        lines = []
+        for name, times in self.phases.iteritems():
+            lines.append('%s: %.3f s (CPU %.3f s)'
+                         % (name, times['wallTime'], times['cpuTime']))
+        for name, count in sorted(self.calls.iteritems()):
+            lines.append('%s calls: %d' % (name, count))
+        for source, count in sorted(self.featuresRead.iteritems()):
+            lines.append('Features read from %s: %d' % (source, count))
+        for destination, count in sorted(self.featuresWritten.iteritems()):
+            lines.append('Features written to %s: %d' % (destination, count))
+        return '\n'.join(lines)
+
+
+def active():
+    """Returns the profile being recorded, or None.
+    """
+    if _profiles:
+        return _profiles[-1]
+    return None
+
+
+def countCall(name):
+    if _profiles:
+        _profiles[-1].calls[name] += 1
+
+
+@contextmanager
+def phase(profile, name):
+    """Times a phase in the given profile, which can be None if
+    nothing is being profiled.
+    """
+    if profile is None:
+        yield
+    else:
+        with profile.phase(name):
+            yield
+
+
+def countFeatures(iterator, source):
+    """Yields the features of an iterator, counting them as read from
+    source in the active profile.
+    """
+    profile = active()
+    for f in iterator:
+        profile.featuresRead[source] += 1
+        yield f
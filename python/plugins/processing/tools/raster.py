@@ -25,42 +25,59 @@ __copyright__ = '(C) 2013, Victor Olaya  and Alexander Bruy'
 
 __revision__ = '$Format:%H$'
 
-import struct
+from collections import OrderedDict
+
 import numpy
-from osgeo import gdal
+from osgeo import gdal, ogr
 from osgeo.gdalconst import GA_ReadOnly
 
+# Approximate number of cells read from a band at a time by the
+# strip-based helpers below
+STRIP_PIXELS = 4 * 1024 * 1024
+
 
 def scanraster(layer, progress):
-    filename = unicode(layer.source())
-    dataset = gdal.Open(filename, GA_ReadOnly)
+    """Returns an iterator over the values of the first band of a raster
+    layer, in row-major order, with no-data cells returned as None.
+
+    Prefer scanrasterblocks() for anything but small rasters, as this
+    produces a Python object per cell.
+    """
+    dataset = gdal.Open(unicode(layer.source()), GA_ReadOnly)
     band = dataset.GetRasterBand(1)
     nodata = band.GetNoDataValue()
-    bandtype = gdal.GetDataTypeName(band.DataType)
-    for y in xrange(band.YSize):
-        progress.setPercentage(y / float(band.YSize) * 100)
-        scanline = band.ReadRaster(0, y, band.XSize, 1, band.XSize, 1,
-                                   band.DataType)
-        if bandtype == 'Byte':
-            values = struct.unpack('B' * band.XSize, scanline)
-        elif bandtype == 'Int16':
-            values = struct.unpack('h' * band.XSize, scanline)
-        elif bandtype == 'UInt16':
-            values = struct.unpack('H' * band.XSize, scanline)
-        elif bandtype == 'Int32':
-            values = struct.unpack('i' * band.XSize, scanline)
-        elif bandtype == 'UInt32':
-            values = struct.unpack('I' * band.XSize, scanline)
-        elif bandtype == 'Float32':
-            values = struct.unpack('f' * band.XSize, scanline)
-        elif bandtype == 'Float64':
-            values = struct.unpack('d' * band.XSize, scanline)
+    for (yOffset, ySize) in rasterStrips(band):
+        progress.setPercentage(yOffset / float(band.YSize) * 100)
+        block = band.ReadAsArray(0, yOffset, band.XSize, ySize)
+        for row in block.tolist():
+            for value in row:
+                if value == nodata:
+                    value = None
+                yield value
+
+
+def scanrasterblocks(layer, progress=None, bandNumber=1):
+    """Returns an iterator over the cells of a raster layer band, as
+    blocks aligned to the natural block size of the band.
+
+    Each block is a numpy masked array in which no-data cells are
+    masked. Blocks are not returned in any particular order.
+    """
+    dataset = gdal.Open(unicode(layer.source()), GA_ReadOnly)
+    band = dataset.GetRasterBand(bandNumber)
+    nodata = band.GetNoDataValue()
+    windows = list(rasterBlocks(band))
+    for (i, (xOffset, yOffset, xSize, ySize)) in enumerate(windows):
+        if progress is not None:
+            progress.setPercentage(int(i * 100.0 / len(windows)))
+        data = band.ReadAsArray(xOffset, yOffset, xSize, ySize)
+        if nodata is None:
+            mask = numpy.zeros(data.shape, bool)
+        elif numpy.isnan(nodata):
+            mask = numpy.isnan(data)
         else:
-            raise GeoAlgorithmExecutionException('Raster format not supported')
-        for value in values:
-            if value == nodata:
-                value = None
-            yield value
+            mask = data == nodata
+        yield numpy.ma.MaskedArray(data, mask=mask)
 
 
 def mapToPixel(mX, mY, geoTransform):
@@ -73,42 +90,329 @@ def pixelToMap(pX, pY, geoTransform):
     return gdal.ApplyGeoTransform(geoTransform, pX + 0.5, pY + 0.5)
 
 
+def rasterStrips(band, maxPixels=STRIP_PIXELS):
+    """Returns an iterator of (yOffset, ySize) tuples covering the
+    passed band with full-width strips.
+
+    The strip height is a multiple of the natural block height of the
+    band, so that each block is read from disk only once, and is chosen
+    to keep strips close to maxPixels cells.
+    """
+    blockHeight = max(1, band.GetBlockSize()[1])
+    blocks = max(1, maxPixels // (max(1, band.XSize) * blockHeight))
+    stripHeight = blocks * blockHeight
+    for yOffset in xrange(0, band.YSize, stripHeight):
+        yield (yOffset, min(stripHeight, band.YSize - yOffset))
+
+
+def rasterBlocks(band, maxPixels=STRIP_PIXELS):
+    """Returns an iterator of (xOffset, yOffset, xSize, ySize) windows
+    covering the passed band.
+
+    Tiled bands are covered tile by tile, while bands stored in strips
+    are covered with full-width strips from rasterStrips().
+    """
+    (blockWidth, blockHeight) = band.GetBlockSize()
+    if blockWidth <= 0 or blockWidth >= band.XSize:
+        for (yOffset, ySize) in rasterStrips(band, maxPixels):
+            yield (0, yOffset, band.XSize, ySize)
+        return
+
+    for yOffset in xrange(0, band.YSize, blockHeight):
+        ySize = min(blockHeight, band.YSize - yOffset)
+        for xOffset in xrange(0, band.XSize, blockWidth):
+            yield (xOffset, yOffset, min(blockWidth, band.XSize - xOffset), ySize)
+
+
+class ZoneRasterizer:
+
+    """Burns zone polygons into integer label arrays aligned with a
+    raster, one strip at a time.
+
+    Zones are numbered from 1 in the order they are added; cells that
+    are not covered by any zone are labelled 0. Each cell gets a
+    single label, so zones are expected not to overlap.
+    """
+
+    ZONE_FIELD = 'zone'
+
+    def __init__(self, geoTransform, xSize, ySize):
+        self.geoTransform = geoTransform
+        self.xSize = xSize
+        self.ySize = ySize
+        self.lastRows = [-1]
+
+        self.dataSource = ogr.GetDriverByName('Memory').CreateDataSource('zones')
+        self.layer = self.dataSource.CreateLayer('zones', None, ogr.wkbPolygon)
+        self.layer.CreateField(ogr.FieldDefn(self.ZONE_FIELD, ogr.OFTInteger))
+        self.driver = gdal.GetDriverByName('MEM')
+
+    def addZone(self, geom):
+        """Adds a QgsGeometry as a new zone and returns its label."""
+        zone = len(self.lastRows)
+        bbox = geom.boundingBox()
+        rows = (mapToPixel(bbox.xMinimum(), bbox.yMinimum(), self.geoTransform)[1],
+                mapToPixel(bbox.xMinimum(), bbox.yMaximum(), self.geoTransform)[1])
+        self.lastRows.append(max(rows))
+
+        ft = ogr.Feature(self.layer.GetLayerDefn())
+        ft.SetGeometry(ogr.CreateGeometryFromWkt(geom.exportToWkt()))
+        ft.SetField(self.ZONE_FIELD, zone)
+        self.layer.CreateFeature(ft)
+        ft = None
+        return zone
+
+    def zoneCount(self):
+        return len(self.lastRows) - 1
+
+    def labels(self, yOffset, ySize):
+        """Returns an int32 array with the zone labels for the
+        full-width strip of ySize rows starting at row yOffset.
+        """
+        gt = self.geoTransform
+        stripGeoTransform = (gt[0], gt[1], gt[2],
+                             gt[3] + yOffset * gt[5], gt[4], gt[5])
+        x = (gt[0], gt[0] + self.xSize * gt[1])
+        y = (stripGeoTransform[3], stripGeoTransform[3] + ySize * gt[5])
+        self.layer.SetSpatialFilterRect(min(x), min(y), max(x), max(y))
+
+        ds = self.driver.Create('', self.xSize, ySize, 1, gdal.GDT_Int32)
+        ds.SetGeoTransform(stripGeoTransform)
+        gdal.RasterizeLayer(ds, [1], self.layer,
+                            options=['ATTRIBUTE=%s' % self.ZONE_FIELD])
+        labels = ds.GetRasterBand(1).ReadAsArray()
+        ds = None
+
+        self.layer.SetSpatialFilter(None)
+        return labels
+
+
+def stripZoneValues(rasterizer, band, yOffset, ySize):
+    """Returns a (labels, values) pair of arrays with the valid values
+    of the cells of a strip of a band that are covered by the zones of
+    a ZoneRasterizer, scaled and offset as the band specifies.
+    """
+    noData = band.GetNoDataValue()
+    labels = rasterizer.labels(yOffset, ySize)
+    srcArray = band.ReadAsArray(0, yOffset, band.XSize, ySize)
+    valid = labels > 0
+    if noData is not None:
+        valid &= srcArray != noData
+    srcArray = srcArray[valid].astype(numpy.float64) * (band.GetScale() or 1.0) \
+        + (band.GetOffset() or 0.0)
+    labels = labels[valid]
+    valid = numpy.isfinite(srcArray)
+    if not valid.all():
+        srcArray = srcArray[valid]
+        labels = labels[valid]
+    return labels, srcArray
+
+
+def zoneValues(rasterizer, band, progress=None):
+    """Reads a band once, strip by strip, and yields (labels, values)
+    pairs of arrays with the values returned by stripZoneValues().
+
+    Each zone appears in a single pair, with all its values: the
+    values of a zone are kept only until the last strip it touches has
+    been read, and are then yielded together with those of all the
+    other zones finishing in that strip.
+    """
+    lastRows = numpy.array(rasterizer.lastRows)
+
+    # Each pending chunk holds [smallest last row, labels, values]
+    pending = []
+    strips = list(rasterStrips(band))
+    total = 100.0 / len(strips) if strips else 0
+    for current, (yOffset, ySize) in enumerate(strips):
+        labels, srcArray = stripZoneValues(rasterizer, band, yOffset, ySize)
+        if labels.size > 0:
+            pending.append([lastRows[labels].min(), labels, srcArray])
+
+        stripEnd = yOffset + ySize
+        isLast = current == len(strips) - 1
+        closedLabels = []
+        closedValues = []
+        for chunk in pending:
+            if chunk[0] >= stripEnd and not isLast:
+                continue
+            closing = lastRows[chunk[1]] < stripEnd
+            if isLast or closing.all():
+                closedLabels.append(chunk[1])
+                closedValues.append(chunk[2])
+                chunk[1] = None
+            else:
+                closedLabels.append(chunk[1][closing])
+                closedValues.append(chunk[2][closing])
+                chunk[1] = chunk[1][~closing]
+                chunk[2] = chunk[2][~closing]
+                chunk[0] = lastRows[chunk[1]].min()
+        pending = [chunk for chunk in pending if chunk[1] is not None]
+        if closedLabels:
+            yield (numpy.concatenate(closedLabels),
+                   numpy.concatenate(closedValues))
+
+        if progress is not None:
+            progress.setPercentage(int(current * total))
+
+
 class RasterWriter:
 
+    """Writes a Float32 GeoTIFF with nbands bands, cell by cell.
+
+    By default all bands are kept in memory as numpy matrices and
+    written when the writer is closed. In tiled mode, which is used
+    automatically for outputs larger than MAX_MEMORY bytes, the file is
+    created upfront as a tiled GeoTIFF and cells are edited in tiles
+    held in a least-recently-used cache of cacheTiles tiles, so that
+    outputs larger than the available memory can be written.
+    """
+
     NODATA = -99999.0
 
+    # Largest output, in bytes, that is kept in memory when tiled is
+    # not explicitly set
+    MAX_MEMORY = 512 * 1024 * 1024
+
+    TILED_OPTIONS = ['TILED=YES', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER']
+
     def __init__(self, fileName, minx, miny, maxx, maxy, cellsize,
-                 nbands, crs):
+                 nbands, crs, tiled=None, tileSize=256, cacheTiles=256,
+                 options=None):
         self.fileName = fileName
         self.nx = int((maxx - minx) / float(cellsize))
         self.ny = int((maxy - miny) / float(cellsize))
-        self.nbands = nbands
-        self.matrix = numpy.ones(shape=(self.ny, self.nx), dtype=numpy.float32)
-        self.matrix[:] = self.NODATA
+        self.nbands = max(1, nbands)
         self.cellsize = cellsize
         self.crs = crs
         self.minx = minx
         self.maxy = maxy
+        self.options = options or []
+
+        if tiled is None:
+            tiled = self.nx * self.ny * self.nbands * 4 > self.MAX_MEMORY
+        self.tiled = tiled
+
+        if self.tiled:
+            self.tileSize = tileSize
+            self.cacheTiles = max(1, cacheTiles)
+            self.tiles = OrderedDict()
+            self.dirty = set()
+            self.written = set()
+            self.dataset = self._create(self.TILED_OPTIONS + [
+                'BLOCKXSIZE=%d' % tileSize,
+                'BLOCKYSIZE=%d' % tileSize] + self.options)
+        else:
+            self.matrices = []
+            for i in xrange(self.nbands):
+                matrix = numpy.empty(shape=(self.ny, self.nx), dtype=numpy.float32)
+                matrix[:] = self.NODATA
+                self.matrices.append(matrix)
+            self.matrix = self.matrices[0]
 
     def setValue(self, value, x, y, band=0):
-        try:
-            self.matrix[y, x] = value
-        except IndexError:
-            pass
+        if not self._contains(x, y, band):
+            return
+        if self.tiled:
+            key = (band, x // self.tileSize, y // self.tileSize)
+            self._tile(key)[y % self.tileSize, x % self.tileSize] = value
+            self.dirty.add(key)
+        else:
+            self.matrices[band][y, x] = value
 
     def getValue(self, x, y, band=0):
-        try:
-            return self.matrix[y, x]
-        except IndexError:
+        if not self._contains(x, y, band):
             return self.NODATA
+        if self.tiled:
+            key = (band, x // self.tileSize, y // self.tileSize)
+            return self._tile(key)[y % self.tileSize, x % self.tileSize]
+        else:
+            return self.matrices[band][y, x]
+
+    def fill(self, value, band=0):
+        """Sets all the cells of a band to the passed value."""
+        if self.tiled:
+            for key in [k for k in self.tiles if k[0] == band]:
+                del self.tiles[key]
+                self.dirty.discard(key)
+            self.dataset.GetRasterBand(band + 1).Fill(value)
+            for tileY in xrange(self._tileCount(self.ny)):
+                for tileX in xrange(self._tileCount(self.nx)):
+                    self.written.add((band, tileX, tileY))
+        else:
+            self.matrices[band][:] = value
 
     def close(self):
-        format = 'GTiff'
-        driver = gdal.GetDriverByName(format)
-        dst_ds = driver.Create(self.fileName, self.nx, self.ny, 1,
-                               gdal.GDT_Float32)
+        if self.tiled:
+            for key in list(self.tiles.keys()):
+                self._flush(key)
+            self.tiles.clear()
+            # Tiles that were never touched still have to be stored
+            for band in xrange(self.nbands):
+                for tileY in xrange(self._tileCount(self.ny)):
+                    for tileX in xrange(self._tileCount(self.nx)):
+                        key = (band, tileX, tileY)
+                        if key not in self.written:
+                            self._flush(key, self._emptyTile(key))
+            self.dataset = None
+        else:
+            dst_ds = self._create(self.options)
+            for band in xrange(self.nbands):
+                dst_ds.GetRasterBand(band + 1).WriteArray(self.matrices[band])
+            dst_ds = None
+
+    def _create(self, options):
+        driver = gdal.GetDriverByName('GTiff')
+        dst_ds = driver.Create(self.fileName, self.nx, self.ny, self.nbands,
+                               gdal.GDT_Float32, options)
         dst_ds.SetProjection(unicode(self.crs.toWkt()))
         dst_ds.SetGeoTransform([self.minx, self.cellsize, 0,
-                                self.maxy, self.cellsize, 0])
-        dst_ds.GetRasterBand(1).WriteArray(self.matrix)
-        dst_ds = None
+                                self.maxy, 0, -self.cellsize])
+        for band in xrange(self.nbands):
+            dst_ds.GetRasterBand(band + 1).SetNoDataValue(self.NODATA)
+        return dst_ds
+
+    def _contains(self, x, y, band):
+        return 0 <= x < self.nx and 0 <= y < self.ny and 0 <= band < self.nbands
+
+    def _tileCount(self, size):
+        return (size + self.tileSize - 1) // self.tileSize
+
+    def _window(self, key):
+        (band, tileX, tileY) = key
+        xOffset = tileX * self.tileSize
+        yOffset = tileY * self.tileSize
+        return (xOffset, yOffset, min(self.tileSize, self.nx - xOffset),
+                min(self.tileSize, self.ny - yOffset))
+
+    def _emptyTile(self, key):
+        (xOffset, yOffset, xSize, ySize) = self._window(key)
+        tile = numpy.empty(shape=(ySize, xSize), dtype=numpy.float32)
+        tile[:] = self.NODATA
+        return tile
+
+    def _tile(self, key):
+        tile = self.tiles.pop(key, None)
+        if tile is None:
+            if key in self.written:
+                (xOffset, yOffset, xSize, ySize) = self._window(key)
+                band = self.dataset.GetRasterBand(key[0] + 1)
+                tile = band.ReadAsArray(xOffset, yOffset, xSize, ySize)
+            else:
+                tile = self._emptyTile(key)
+            while len(self.tiles) >= self.cacheTiles:
+                oldest = next(iter(self.tiles))
+                self._flush(oldest)
+                del self.tiles[oldest]
+        # Re-inserting keeps the cache ordered by last use
+        self.tiles[key] = tile
+        return tile
+
+    def _flush(self, key, tile=None):
+        if tile is None:
+            if key not in self.dirty:
+                return
+            tile = self.tiles[key]
+        (xOffset, yOffset, xSize, ySize) = self._window(key)
+        self.dataset.GetRasterBand(key[0] + 1).WriteArray(tile, xOffset, yOffset)
+        self.dirty.discard(key)
+        self.written.add(key)
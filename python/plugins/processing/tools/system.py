@@ -30,8 +30,10 @@ import os
 import time
 import sys
 import uuid
+import multiprocessing
 
-from PyQt4.QtCore import QFileInfo, QDir
+from PyQt4.QtCore import QFileInfo, QDir, QCoreApplication
+from PyQt4.QtGui import QApplication
 from qgis.core import QgsApplication
 
 numExported = 1
@@ -126,6 +128,66 @@ def getNumExportedLayers():
     return numExported
 
 
+def workerProcesses():
+    """Returns the number of worker processes that algorithms are
+    allowed to use, as set in the Processing configuration.
+    """
+    from processing.core.ProcessingConfig import ProcessingConfig
+    try:
+        workers = int(ProcessingConfig.getSetting(ProcessingConfig.MAX_WORKER_PROCESSES))
+    except (TypeError, ValueError):
+        workers = 1
+    return max(1, min(workers, multiprocessing.cpu_count()))
+
+
+def canForkWorkers():
+    """Returns True if worker processes can be started from the
+    current process.
+    """
+    # Forking a process running the QGIS GUI is not safe: the child
+    # gets a copy of the event loop, the canvas and the threads of the
+    # parent. On Windows workers are new processes.
+    if isWindows():
+        return True
+    app = QCoreApplication.instance()
+    return app is None or not isinstance(app, QApplication) \
+        or app.type() == QApplication.Tty
+
+
+def processPool(workers=None, initializer=None):
+    """Returns a multiprocessing pool with the passed number of
+    workers, or with the configured number if it is None. The
+    initializer, if any, is called in each worker when it starts.
+
+    Returns None if a single worker would be used or if workers cannot
+    be forked from this process, in which case the caller should do the
+    work in the current process.
+    """
+    if workers is None:
+        workers = workerProcesses()
+    if workers <= 1 or not canForkWorkers():
+        return None
+    if isWindows():
+        # Inside QGIS sys.executable is the QGIS binary, not Python
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, 'pythonw.exe'))
+    return multiprocessing.Pool(workers, initializer)
+
+
+def peakMemory():
+    """Returns the peak resident memory of the current process in
+    kilobytes, or None if it cannot be known on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Reported in bytes instead of kilobytes
+        peak /= 1024
+    return peak
+
+
 def mkdir(newdir):
     newdir = newdir.strip('\n\r ')
     if os.path.isdir(newdir):
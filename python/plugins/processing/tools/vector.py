@@ -29,14 +29,17 @@ __revision__ = '$Format:%H$'
 
 import csv
 import uuid
+import numpy
+import gzip
 import codecs
 import cStringIO
 
-from PyQt4.QtCore import QVariant, QSettings
+from PyQt4.QtCore import Qt, QVariant, QSettings, QPyNullVariant, QDate, QDateTime, QTime
 from qgis.core import QGis, QgsFields, QgsField, QgsGeometry, QgsRectangle, QgsSpatialIndex, QgsMapLayerRegistry, QgsMapLayer, QgsVectorLayer, QgsVectorFileWriter, QgsDistanceArea
 from processing.core.ProcessingConfig import ProcessingConfig
 from PyQt4 import QtSql
 from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
+from processing.tools import profiling
 from qgis.core import *
 
 
@@ -67,7 +70,10 @@ TYPE_MAP_POSTGIS_LAYER = {
     QVariant.String: "VARCHAR",
     QVariant.Double: "REAL",
     QVariant.Int: "INTEGER",
-    QVariant.Bool: "BOOLEAN"
+    QVariant.Bool: "BOOLEAN",
+    QVariant.Date: "DATE",
+    QVariant.DateTime: "TIMESTAMP",
+    QVariant.Time: "TIME"
 }
 
 TYPE_MAP_SPATIALITE_LAYER = {
@@ -78,7 +84,13 @@ TYPE_MAP_SPATIALITE_LAYER = {
 }
 
 
-def features(layer):
+def _useSelection(layer):
+    return bool(ProcessingConfig.getSetting(ProcessingConfig.USE_SELECTED)) \
+        and layer.selectedFeatureCount() > 0
+
+
+def features(layer, attributes=None, geometry=True, filterRect=None,
+             expression=None):
     """This returns an iterator over features in a vector layer,
     considering the selection that might exist in the layer, and the
     configuration that indicates whether to use only selected feature
@@ -86,43 +98,106 @@ def features(layer):
 
     This should be used by algorithms instead of calling the QGis API
     directly, to ensure a consistent behaviour across algorithms.
+
+    The optional arguments restrict what is read from the layer:
+    attributes is a list of field names or indices to fetch (other
+    attributes are left empty), geometry can be set to False to skip
+    geometries, filterRect only returns features intersecting a
+    QgsRectangle and expression only returns features matching a
+    filter expression. With filters, the length of the iterator is an
+    upper bound of the number of features returned.
     """
     class Features:
 
-        def __init__(self, layer):
+        def __init__(self, layer, request, expression):
             self.layer = layer
             self.selection = False
-            self.iter = layer.getFeatures()
-            if ProcessingConfig.getSetting(ProcessingConfig.USE_SELECTED):
-                selected = layer.selectedFeatures()
-                if len(selected) > 0:
-                    self.selection = True
-                    self.iter = iter(selected)
+            if _useSelection(layer):
+                self.selection = True
+                self.iter = layer.selectedFeaturesIterator(request)
+                if expression is not None:
+                    # The selection replaces the request filter, so the
+                    # expression is evaluated here
+                    self.iter = (f for f in self.iter if expression.evaluate(f))
+            else:
+                if expression is not None:
+                    request.setFilterExpression(expression.expression())
+                self.iter = layer.getFeatures(request)
+            profile = profiling.active()
+            if profile is not None:
+                profile.calls['vector.features'] += 1
+                self.iter = profiling.countFeatures(self.iter, layer.source())
 
         def __iter__(self):
             return self.iter
 
+        def next(self):
+            return self.iter.next()
+
         def __len__(self):
             if self.selection:
                 return int(self.layer.selectedFeatureCount())
             else:
                 return int(self.layer.featureCount())
 
-    return Features(layer)
-
-
-def uniqueValues(layer, attribute):
+    request = QgsFeatureRequest()
+    if not geometry:
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+    if filterRect is not None:
+        request.setFilterRect(filterRect)
+    if expression is not None:
+        expression = QgsExpression(expression)
+        if expression.hasParserError():
+            raise GeoAlgorithmExecutionException(
+                'Wrong filter expression:\n%s' % expression.parserErrorString())
+        expression.prepare(layer.pendingFields())
+    if attributes is not None:
+        indices = set(resolveFieldIndex(layer, attr) for attr in attributes)
+        if expression is not None:
+            for name in expression.referencedColumns():
+                index = layer.fieldNameIndex(name)
+                if index != -1:
+                    indices.add(index)
+        request.setSubsetOfAttributes(sorted(indices))
+
+    return Features(layer, request, expression)
+
+
+def uniqueValues(layer, attribute, useProvider=False):
     """Returns a list of unique values for a given attribute.
 
     Attribute can be defined using a field names or a zero-based
     field index. It considers the existing selection.
+
+    Values are returned in the order they are first found. If
+    useProvider is True and no selection has to be considered, the
+    values are instead asked to the layer, which lets database
+    providers compute them, and their order is undefined.
     """
-    values = []
     fieldIndex = resolveFieldIndex(layer, attribute)
-    feats = features(layer)
+    if useProvider and not _useSelection(layer):
+        return layer.uniqueValues(fieldIndex)
+
+    feats = features(layer, [fieldIndex], geometry=False)
+    values = []
+    seen = set()
+    hasNull = False
     for feat in feats:
-        if feat.attributes()[fieldIndex] not in values:
-            values.append(feat.attributes()[fieldIndex])
+        value = feat.attributes()[fieldIndex]
+        if isinstance(value, QPyNullVariant):
+            if hasNull:
+                continue
+            hasNull = True
+        else:
+            try:
+                if value in seen:
+                    continue
+                seen.add(value)
+            except TypeError:
+                # Unhashable value
+                if value in values:
+                    continue
+        values.append(value)
     return values
 
 
@@ -146,7 +221,7 @@ def resolveFieldIndex(layer, attr):
         return index
 
 
-def values(layer, *attributes):
+def values(layer, *attributes, **kwargs):
     """Returns the values in the attributes table of a vector layer,
     for the passed fields.
 
@@ -155,21 +230,44 @@ def values(layer, *attributes):
     It considers the existing selection.
 
     It assummes fields are numeric or contain values that can be parsed
-    to a number.
+    to a number. Values that cannot are returned as None or, if
+    asNumpy=True is passed, the lists are replaced by numpy float64
+    arrays and those values are NaN.
+
+    All fields are read in a single pass over the layer.
     """
-    ret = {}
-    for attr in attributes:
-        index = resolveFieldIndex(layer, attr)
-        values = []
-        feats = features(layer)
-        for feature in feats:
+    asNumpy = kwargs.get('asNumpy', False)
+    indices = [resolveFieldIndex(layer, attr) for attr in attributes]
+    feats = features(layer, indices, geometry=False)
+    if asNumpy:
+        size = len(feats)
+        columns = [numpy.empty(size) for attr in attributes]
+        missing = numpy.nan
+    else:
+        columns = [[] for attr in attributes]
+        missing = None
+
+    n = 0
+    for feature in feats:
+        attrs = feature.attributes()
+        if asNumpy and n == size:
+            # Only happens if the layer reports a wrong feature count
+            size = 2 * size + 1
+            columns = [numpy.resize(column, size) for column in columns]
+        for (column, index) in zip(columns, indices):
             try:
-                v = float(feature.attributes()[index])
-                values.append(v)
-            except:
-                values.append(None)
-        ret[attr] = values
-    return ret
+                v = float(attrs[index])
+            except (TypeError, ValueError):
+                v = missing
+            if asNumpy:
+                column[n] = v
+            else:
+                column.append(v)
+        n += 1
+
+    if asNumpy:
+        columns = [column[:n] for column in columns]
+    return dict(zip(attributes, columns))
 
 
 def testForUniqueness(fieldList1, fieldList2):
@@ -198,6 +296,167 @@ def spatialindex(layer):
     return idx
 
 
+class FeatureStore:
+    """A spatial index over a vector layer that also keeps the indexed
+    features, so that candidates returned by the index can be read
+    without one provider query per feature.
+
+    Index and cache are filled in a single pass over the layer
+    (honouring the selection, like features()). Features are cached
+    until their estimated size reaches memoryBudget bytes, and the rest
+    are fetched from the layer in batches of fids when requested.
+    Features returned by the store are shared and must not be modified.
+
+    If precision is not zero, geometries are snapped to it (see
+    snapToPrecision) once, as they are read.
+    """
+
+    MEMORY_BUDGET = 256 * 1024 * 1024
+    BATCH_SIZE = 1000
+
+    def __init__(self, layer, attributes=None, memoryBudget=None,
+                 precision=0.0):
+        self.layer = layer
+        self.precision = precision
+        self.index = QgsSpatialIndex()
+        self.cache = {}
+        self.request = QgsFeatureRequest()
+        if attributes is not None:
+            self.request.setSubsetOfAttributes(
+                [resolveFieldIndex(layer, attr) for attr in attributes])
+
+        if memoryBudget is None:
+            memoryBudget = self.MEMORY_BUDGET
+        size = 0
+        for f in features(layer, attributes):
+            self._snap(f)
+            self.index.insertFeature(f)
+            if size < memoryBudget:
+                self.cache[f.id()] = f
+                size += self._featureSize(f)
+
+    def intersects(self, rect):
+        """Returns the ids of the features whose bounding box intersects
+        the given rectangle.
+        """
+        return self.index.intersects(rect)
+
+    def nearestNeighbor(self, point, neighbors):
+        """Returns the ids of the features nearest to a point.
+        """
+        return self.index.nearestNeighbor(point, neighbors)
+
+    def feature(self, fid):
+        """Returns the feature with the given id, or None if it does not
+        exist.
+        """
+        if fid in self.cache:
+            return self.cache[fid]
+        return self._fetch([fid]).get(fid)
+
+    def features(self, fids):
+        """Iterates over the features with the given ids, in the same
+        order. Ids that do not exist are skipped.
+        """
+        fids = list(fids)
+        for start in xrange(0, len(fids), self.BATCH_SIZE):
+            batch = fids[start:start + self.BATCH_SIZE]
+            missing = [fid for fid in batch if fid not in self.cache]
+            fetched = self._fetch(missing) if missing else {}
+            for fid in batch:
+                if fid in self.cache:
+                    yield self.cache[fid]
+                elif fid in fetched:
+                    yield fetched[fid]
+
+    def _fetch(self, fids):
+        request = QgsFeatureRequest(self.request)
+        request.setFilterFids(fids)
+        return dict((f.id(), self._snap(f))
+                    for f in self.layer.getFeatures(request))
+
+    def _snap(self, f):
+        if self.precision:
+            f.setGeometry(snapToPrecision(f.geometry(), self.precision))
+        return f
+
+    @staticmethod
+    def _featureSize(f):
+        size = 64 + 32 * len(f.attributes())
+        geom = f.constGeometry()
+        if geom is not None:
+            size += geom.wkbSize()
+        return size
+
+
+class GeometryPredicates:
+    """Evaluates the predicates selected in a ParameterGeometryPredicate
+    between one driving geometry and many candidate geometries.
+
+    The driving geometry is prepared once with prepare(), and matches()
+    then returns True if any of the predicates holds for a candidate.
+    Predicates are read as driving.predicate(candidate), or as
+    candidate.predicate(driving) if converse is True. 'disjoint' is
+    not evaluated by matches(): algorithms track disjoint features by
+    removing the ones for which intersects() is True.
+    """
+
+    METHODS = {
+        'intersects': 'intersects',
+        'contains': 'contains',
+        'equals': 'isEqual',
+        'touches': 'touches',
+        'overlaps': 'overlaps',
+        'within': 'within',
+        'crosses': 'crosses',
+    }
+
+    CONVERSE = {
+        'contains': 'within',
+        'within': 'contains',
+    }
+
+    def __init__(self, predicates, converse=False):
+        self.methods = []
+        for predicate in predicates:
+            if predicate == 'disjoint':
+                continue
+            if converse:
+                predicate = self.CONVERSE.get(predicate, predicate)
+            self.methods.append(self.METHODS[predicate])
+        self.geom = None
+        self.engine = None
+        self.tests = []
+
+    def prepare(self, geom):
+        """Sets the driving geometry.
+        """
+        # The engine refers to the geometry, so a reference is kept
+        self.geom = geom
+        self.engine = None
+        self.tests = []
+        if geom.geometry() is not None:
+            self.engine = QgsGeometry.createGeometryEngine(geom.geometry())
+            self.engine.prepareGeometry()
+            self.tests = [getattr(self.engine, method)
+                          for method in self.methods]
+
+    def matches(self, geom):
+        g = geom.geometry()
+        if g is None:
+            return False
+        for test in self.tests:
+            if test(g):
+                return True
+        return False
+
+    def intersects(self, geom):
+        g = geom.geometry()
+        if self.engine is None or g is None:
+            return False
+        return self.engine.intersects(g)
+
+
 def createUniqueFieldName(fieldName, fieldList):
     def nextname(name):
         num = 1
@@ -293,16 +552,11 @@ def simpleMeasure(geom, method=0, ellips=None, crs=None):
 
 
 def getUniqueValues(layer, fieldIndex):
-    values = []
-    feats = features(layer)
-    for feat in feats:
-        if feat.attributes()[fieldIndex] not in values:
-            values.append(feat.attributes()[fieldIndex])
-    return values
+    return uniqueValues(layer, fieldIndex)
 
 
 def getUniqueValuesCount(layer, fieldIndex):
-    return len(getUniqueValues(layer, fieldIndex))
+    return len(uniqueValues(layer, fieldIndex, True))
 
 
 def combineVectorFields(layerA, layerB):
@@ -416,6 +670,36 @@ def snapToPrecision(geom, precision):
     return snapped
 
 
+def cascadedUnion(geoms):
+    """Returns the union of a list of geometries.
+
+    All geometries are merged with a single GEOS cascaded union. If that
+    fails, they are merged pairwise in a balanced tree, so that no
+    vertex is copied more than log(n) times. Returns None if the
+    geometries cannot be merged.
+    """
+    if len(geoms) == 0:
+        return None
+    if len(geoms) == 1:
+        return QgsGeometry(geoms[0])
+
+    union = QgsGeometry.unaryUnion(geoms)
+    if union is not None and not union.isEmpty():
+        return union
+
+    while len(geoms) > 1:
+        merged = []
+        for i in xrange(0, len(geoms) - 1, 2):
+            union = geoms[i].combine(geoms[i + 1])
+            if union is None:
+                return None
+            merged.append(union)
+        if len(geoms) % 2 == 1:
+            merged.append(geoms[-1])
+        geoms = merged
+    return geoms[0]
+
+
 def bufferedBoundingBox(bbox, buffer_size):
     if buffer_size == 0.0:
         return QgsRectangle(bbox)
@@ -427,18 +711,86 @@ def bufferedBoundingBox(bbox, buffer_size):
         bbox.yMaximum() + buffer_size)
 
 
+def ogrDriverName(filename):
+    """Returns the name of the OGR driver used by QGIS to write a file
+    with the extension of the given filename, or None if there is no
+    such driver.
+    """
+    extension = filename[filename.rfind('.') + 1:]
+    formats = QgsVectorFileWriter.supportedFiltersAndFormats()
+    for (key, value) in formats.items():
+        ext = unicode(key)
+        ext = ext[ext.find('*.') + 2:]
+        ext = ext[:ext.find(' ')]
+        if ext == extension:
+            return value
+    return None
+
+
+# Scopes in which buffered writers are kept until the scope closes
+# them, innermost (e.g. the algorithm run by a model) last
+_writerScopes = []
+
+
+class WriterScope:
+
+    """Keeps the buffered writers created while it is active, so that
+    they are closed by close(), which raises any error writing their
+    last records, rather than when they are garbage collected, which
+    would only print it.
+
+    GeoAlgorithm.execute() runs processAlgorithm() in a WriterScope.
+    """
+
+    def __init__(self):
+        self.writers = []
+
+    def __enter__(self):
+        _writerScopes.append(self)
+        return self
+
+    def __exit__(self, *args):
+        _writerScopes.remove(self)
+        self.writers = []
+
+    def close(self):
+        writers = self.writers
+        self.writers = []
+        for writer in writers:
+            writer.close()
+
+
+def _keepInScope(writer):
+    if _writerScopes:
+        _writerScopes[-1].writers.append(writer)
+
+
 class VectorWriter:
 
+    """Writes features to a file, memory, PostGIS or SpatiaLite layer.
+
+    Features written to layers that are not file based are buffered and
+    added in batches of batchSize features. PostGIS tables are filled
+    with COPY. The buffer is flushed when the writer is closed, when
+    the algorithm creating it finishes (see WriterScope) or when it is
+    deleted.
+    """
+
     MEMORY_LAYER_PREFIX = 'memory:'
     POSTGIS_LAYER_PREFIX = 'postgis:'
     SPATIALITE_LAYER_PREFIX = 'spatialite:'
 
+    BATCH_SIZE = 1000
+
     def __init__(self, destination, encoding, fields, geometryType,
-                 crs, options=None):
+                 crs, options=None, batchSize=None):
         self.destination = destination
         self.isNotFileBased = False
         self.layer = None
         self.writer = None
+        self.db = None
+        self.buffer = []
+        self.batchSize = batchSize or self.BATCH_SIZE
 
         if encoding is None:
             settings = QSettings()
@@ -496,6 +848,13 @@ class VectorWriter:
 
             self.layer = QgsVectorLayer(uri.uri(), uri.table(), "postgres")
             self.writer = self.layer.dataProvider()
+
+            db.con.set_client_encoding('UTF8')
+            self.db = db
+            self.copyTable = uri.table().lower()
+            self.copySchema = uri.schema() or None
+            self.copyColumns = [f.name() for f in fields] + ['the_geom']
+            self.srid = crs.authid().split(":")[-1]
         elif self.destination.startswith(self.SPATIALITE_LAYER_PREFIX):
             self.isNotFileBased = True
             uri = QgsDataSourceURI(self.destination[len(self.SPATIALITE_LAYER_PREFIX):])
@@ -527,17 +886,9 @@ class VectorWriter:
             self.layer = QgsVectorLayer(uri.uri(), uri.table(), "spatialite")
             self.writer = self.layer.dataProvider()
         else:
-            formats = QgsVectorFileWriter.supportedFiltersAndFormats()
-            OGRCodes = {}
-            for (key, value) in formats.items():
-                extension = unicode(key)
-                extension = extension[extension.find('*.') + 2:]
-                extension = extension[:extension.find(' ')]
-                OGRCodes[extension] = value
-
-            extension = self.destination[self.destination.rfind('.') + 1:]
-            if extension not in OGRCodes:
-                extension = 'shp'
+            driverName = ogrDriverName(self.destination)
+            if driverName is None:
+                driverName = ogrDriverName('.shp')
                 self.destination = self.destination + '.shp'
 
             qgsfields = QgsFields()
@@ -545,62 +896,170 @@ class VectorWriter:
                 qgsfields.append(_toQgsField(field))
 
             self.writer = QgsVectorFileWriter(self.destination, encoding,
-                                              qgsfields, geometryType, crs, OGRCodes[extension])
+                                              qgsfields, geometryType, crs, driverName)
+
+        if self.isNotFileBased:
+            _keepInScope(self)
 
     def addFeature(self, feature):
+        profile = profiling.active()
+        if profile is not None:
+            profile.calls['VectorWriter.addFeature'] += 1
+            profile.featuresWritten[self.destination] += 1
         if self.isNotFileBased:
-            self.writer.addFeatures([feature])
+            # Algorithms usually reuse the same feature object
+            self.buffer.append(QgsFeature(feature))
+            if len(self.buffer) >= self.batchSize:
+                self.flush()
         else:
             self.writer.addFeature(feature)
 
+    def flush(self):
+        """Writes the buffered features to the destination layer."""
+        if not self.buffer:
+            return
+        features = self.buffer
+        self.buffer = []
+        if self.db is not None:
+            self._copyToPostGIS(features)
+        else:
+            self.writer.addFeatures(features)
+
+    def close(self):
+        """Flushes buffered features. For file based layers, this also
+        closes the file, so no more features can be added.
+        """
+        self.flush()
+        if not self.isNotFileBased:
+            self.writer = None
+
+    def __del__(self):
+        self.flush()
+
+    def _copyToPostGIS(self, features):
+        lines = []
+        for feature in features:
+            values = [_copyValue(v) for v in feature.attributes()]
+            geom = feature.geometry()
+            if geom is None or geom.isEmpty():
+                values.append('\\N')
+            else:
+                values.append('SRID=%s;%s' % (self.srid, geom.exportToWkt()))
+            lines.append(u'\t'.join(values))
+        lines.append(u'')
+        data = cStringIO.StringIO(u'\n'.join(lines).encode('utf-8'))
+        try:
+            self.db.copy_from(self.copyTable, self.copyColumns, data,
+                              self.copySchema)
+        except postgis_utils.DbError as e:
+            raise GeoAlgorithmExecutionException(
+                'Error writing to output PostGIS table:\n%s' % e.message)
+
+
+def _copyValue(value):
+    """Returns a value as a field of a PostgreSQL COPY text row."""
+    if value is None or isinstance(value, QPyNullVariant):
+        return '\\N'
+    if isinstance(value, (QDate, QDateTime, QTime)):
+        value = value.toString(Qt.ISODate)
+    value = unicode(value)
+    for (char, escaped) in (('\\', '\\\\'), ('\t', '\\t'),
+                            ('\n', '\\n'), ('\r', '\\r')):
+        value = value.replace(char, escaped)
+    return value
+
 
 class TableWriter:
 
+    """Writes records to a CSV file, or to a gzip-compressed CSV file if
+    the file name ends with '.gz'.
+
+    The file is kept open while records are added, so the writer has to
+    be closed when done, either explicitly or by using it as a context
+    manager. Writers created by an algorithm (or a script) and left
+    open are closed when it finishes (see WriterScope), and others when
+    they are deleted.
+    """
+
+    BUFFER_SIZE = 1024 * 1024
+
     def __init__(self, fileName, encoding, fields):
+        self.file = None
         self.fileName = fileName
-        if not self.fileName.lower().endswith('csv'):
+        if not self.fileName.lower().endswith(('csv', 'csv.gz')):
             self.fileName += '.csv'
 
         self.encoding = encoding
         if self.encoding is None or encoding == 'System':
             self.encoding = 'utf-8'
 
-        with open(self.fileName, 'wb') as csvFile:
-            self.writer = UnicodeWriter(csvFile, encoding=self.encoding)
-            if len(fields) != 0:
-                self.writer.writerow(fields)
+        if self.fileName.lower().endswith('.gz'):
+            self.file = gzip.open(self.fileName, 'wb')
+        else:
+            self.file = open(self.fileName, 'wb', self.BUFFER_SIZE)
+        self.writer = UnicodeWriter(self.file, encoding=self.encoding)
+        if len(fields) != 0:
+            self.writer.writerow(fields)
+        _keepInScope(self)
 
     def addRecord(self, values):
-        with open(self.fileName, 'ab') as csvFile:
-            self.writer = UnicodeWriter(csvFile, encoding=self.encoding)
-            self.writer.writerow(values)
+        self.writer.writerow(values)
 
     def addRecords(self, records):
-        with open(self.fileName, 'ab') as csvFile:
-            self.writer = UnicodeWriter(csvFile, encoding=self.encoding)
-            self.writer.writerows(records)
+        self.writer.writerows(records)
+
+    def close(self):
+        if self.file is not None:
+            self.writer.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
 
 
 class UnicodeWriter:
 
+    """CSV writer for rows of unicode values, written to a byte stream
+    with the given encoding.
+
+    UTF-8 rows are written straight to the stream. For other encodings
+    rows are gathered in a buffer that is re-encoded every BUFFER_SIZE
+    bytes and when flush() is called.
+    """
+
+    BUFFER_SIZE = 64 * 1024
+
     def __init__(self, f, dialect=csv.excel, encoding='utf-8', **kwds):
-        self.queue = cStringIO.StringIO()
-        self.writer = csv.writer(self.queue, dialect=dialect, **kwds)
         self.stream = f
-        self.encoder = codecs.getincrementalencoder(encoding)()
+        self.encoder = None
+        if codecs.lookup(encoding).name == 'utf-8':
+            self.queue = None
+            self.writer = csv.writer(f, dialect=dialect, **kwds)
+        else:
+            self.queue = cStringIO.StringIO()
+            self.writer = csv.writer(self.queue, dialect=dialect, **kwds)
+            self.encoder = codecs.getincrementalencoder(encoding)()
 
     def writerow(self, row):
-        row = map(unicode, row)
-        try:
-            self.writer.writerow([s.encode('utf-8') for s in row])
-        except:
-            self.writer.writerow(row)
-        data = self.queue.getvalue()
-        data = data.decode('utf-8')
-        data = self.encoder.encode(data)
-        self.stream.write(data)
-        self.queue.truncate(0)
+        self.writer.writerow([unicode(s).encode('utf-8') for s in row])
+        if self.queue is not None and self.queue.tell() > self.BUFFER_SIZE:
+            self.flush()
 
     def writerows(self, rows):
         for row in rows:
             self.writerow(row)
+
+    def flush(self):
+        if self.queue is None:
+            return
+        data = self.queue.getvalue().decode('utf-8')
+        self.stream.write(self.encoder.encode(data))
+        self.queue.seek(0)
+        self.queue.truncate()